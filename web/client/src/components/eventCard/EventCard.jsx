@@ -43,10 +43,15 @@ const EventCard = (data) => {
         <div className="card-right">
           <img
             src={
-              obj.source == "AapdaMitra App"
+              obj.post_image_hash
+                ? `http://localhost:5000/search/image/${obj.post_image_hash}`
+                : obj.source == "AapdaMitra App"
                 ? `data:image/png;base64,${obj.post_image_b64}`
                 : obj.post_image_url
             }
+            width={obj.post_image_width}
+            height={obj.post_image_height}
+            loading="lazy"
             alt={obj.post_title}
             className="card-image"
           />
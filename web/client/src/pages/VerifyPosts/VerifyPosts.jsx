@@ -4,7 +4,7 @@ import Header from "../../components/header/header";
 import Footer from "../../components/footer/Footer";
 import "./VerifyPosts.css";
 import EventCard from "../../components/eventCard/EventCard";
-import { Button, Carousel, Dropdown, Form } from "react-bootstrap";
+import { Button, Carousel, Dropdown, Form, Modal } from "react-bootstrap";
 import { MdDelete } from "react-icons/md";
 import { CiLink } from "react-icons/ci";
 import axios from "axios";
@@ -16,6 +16,7 @@ const VerifyPosts = (props) => {
   const [posts, setPosts] = useState(incomingPosts.state.posts);
   const [verifiedPosts, setVerifiedPosts] = useState([]);
   const [postComments, setPostComments] = useState([]);
+  const [confirmReject, setConfirmReject] = useState(false);
 
   const handlePostVerify = async (post, idx) => {
     try {
@@ -36,7 +37,7 @@ content = "This post is Verified by RescuNet. \n\n RescuNet | RescuNet Team";
         });
         if (response.status === 200) {
           toast.success("Comment added on post successfully!");
-          handlePostRemoveDatabase(post);
+          moderatePosts([post], "verify");
         }
       } else if (post.source === "RescuNet App") {
         const toSend = {
@@ -45,7 +46,9 @@ content = "This post is Verified by RescuNet. \n\n RescuNet | RescuNet Team";
           location: post.location,
           date: post.date,
           type: post.disaster_type,
-          imageUrl: post.post_image_b64 || post.post_image_url,
+          imageUrl: post.post_image_hash
+            ? `http://localhost:5000/search/image/${post.post_image_hash}`
+            : post.post_image_b64 || post.post_image_url,
           source: post.source,
           postId: post.post_id,
           priority: "",
@@ -60,7 +63,7 @@ content = "This post is Verified by RescuNet. \n\n RescuNet | RescuNet Team";
         );
         if (response.status === 201) {
           toast.success("Post Verified successfully!");
-          handlePostRemoveDatabase(post);
+          moderatePosts([post], "verify");
         }
       }
     } catch (error) {
@@ -87,25 +90,39 @@ content = "This post is Verified by RescuNet. \n\n RescuNet | RescuNet Team";
     setPosts((prevPosts) => prevPosts.filter((e) => e !== post));
   };
 
-  const handlePostRemoveDatabase = async (post, idx) => {
+  // verdict is "verify", "archive" or "reject", all posts go in one request
+  const moderatePosts = async (selected, verdict) => {
     try {
-      const formData = new FormData();
-      formData.append("objId", post.objId);
-
-      const response = await fetch("http://localhost:5000/search/remove-post", {
-        method: "POST",
-        body: formData,
-      });
-      if (response.status === 200) {
-        toast.success("Post removed from database!");
-        setPosts((prevPosts) => prevPosts.filter((e) => e !== post));
+      const response = await axios.post(
+        "http://localhost:5000/search/moderate",
+        { ids: selected.map((post) => post.objId), verdict: verdict },
+        { headers: { "Content-Type": "application/json" } }
+      );
+      if (response.data.error) {
+        toast.error(response.data.error);
+        return;
+      }
+      const done = new Set(
+        response.data.items
+          .filter((item) => item.status !== "failed")
+          .map((item) => item.objId)
+      );
+      if (response.data.failed) {
+        toast.error(`${response.data.failed} posts couldn't be updated.`);
+      } else {
+        toast.success(`${done.size} posts updated!`);
       }
+      setPosts((prevPosts) => prevPosts.filter((e) => !done.has(e.objId)));
     } catch (error) {
       toast.error("Something went wrong. Try again later.");
       console.error(error);
     }
   };
 
+  const handlePostRemoveDatabase = async (post, idx) => {
+    moderatePosts([post], "reject");
+  };
+
   useEffect(() => {
     console.log(incomingPosts);
     // // setPosts(incomingPosts);
@@ -118,6 +135,45 @@ content = "This post is Verified by RescuNet. \n\n RescuNet | RescuNet Team";
     <div>
       <Header />
       <div className="verify-cards-wrapper">
+        <div className="verify-bulk-buttons">
+          <Button
+            className="verify-card-button verify"
+            disabled={posts.length === 0}
+            onClick={() => moderatePosts(Object.values(posts), "archive")}
+          >
+            Archive All ({posts.length})
+          </Button>
+          <Button
+            className="verify-card-button remove"
+            disabled={posts.length === 0}
+            onClick={() => setConfirmReject(true)}
+          >
+            Reject All ({posts.length})
+          </Button>
+        </div>
+        <Modal show={confirmReject} onHide={() => setConfirmReject(false)}>
+          <Modal.Header closeButton>
+            <Modal.Title>Reject all posts?</Modal.Title>
+          </Modal.Header>
+          <Modal.Body>
+            This permanently deletes all {posts.length} posts listed here. To
+            keep them out of the queue without losing them, use Archive All.
+          </Modal.Body>
+          <Modal.Footer>
+            <Button variant="secondary" onClick={() => setConfirmReject(false)}>
+              Cancel
+            </Button>
+            <Button
+              variant="danger"
+              onClick={() => {
+                setConfirmReject(false);
+                moderatePosts(Object.values(posts), "reject");
+              }}
+            >
+              Reject {posts.length} posts
+            </Button>
+          </Modal.Footer>
+        </Modal>
         <Carousel
           interval={null}
           prevIcon={
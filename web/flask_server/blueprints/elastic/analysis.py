@@ -0,0 +1,265 @@
+from spacy.matcher import PhraseMatcher
+from spacy.util import filter_spans
+from blueprints.elastic.cache import TTLCache
+from blueprints.elastic.nlpService import NLPClient
+import spacy
+import os
+
+# Parsed query structure is memoized on the normalized query text
+PARSE_CACHE_SIZE = int(os.environ.get("PARSE_CACHE_SIZE", 4096))
+PARSE_CACHE_TTL = float(os.environ.get("PARSE_CACHE_TTL", 3600))
+NLP_BATCH_SIZE = int(os.environ.get("NLP_BATCH_SIZE", 64))
+
+NLP_MODEL = os.environ.get("NLP_MODEL", "en_core_web_lg")
+# Pipeline components nothing here uses, never loaded
+NLP_EXCLUDE = [
+    name.strip()
+    for name in os.environ.get("NLP_EXCLUDE", "parser,textcat").split(",")
+    if name.strip()
+]
+# host:port (or socket path) of a running nlpService. When set, parsing goes
+# there and this process never loads the model.
+NLP_SERVICE = os.environ.get("NLP_SERVICE", "")
+NLP_SERVICE_AUTHKEY = os.environ.get("NLP_SERVICE_AUTHKEY", "")
+
+# Highest level wins when a text matches several
+PRIORITY_LEVELS = ("high", "medium", "low")
+
+disaster_keywords = {
+    "natural_disasters": [
+        "earthquake",
+        "flood",
+        "tsunami",
+        "landslide",
+        "avalanche",
+        "hurricane",
+        "typhoon",
+        "cyclone",
+        "tornado",
+        "storm",
+        "wildfire",
+        "forest fire",
+        "drought",
+        "volcano",
+        "eruption",
+    ],
+    "man_made_disasters": [
+        "explosion",
+        "fire",
+        "chemical spill",
+        "gas leak",
+        "building collapse",
+        "pollution",
+        "oil spill",
+        "plane crash",
+        "train derailment",
+        "car crash",
+    ],
+    "violence_and_security": [
+        "shooting",
+        "attack",
+        "terrorist",
+        "riot",
+        "protest",
+        "bomb",
+        "hostage",
+        "war",
+        "gunfire",
+        "looting",
+        "explosion",
+        "armed",
+    ],
+    "health_disasters": [
+        "pandemic",
+        "epidemic",
+        "outbreak",
+        "infection",
+        "disease",
+        "quarantine",
+        "virus",
+        "vaccine",
+        "contamination",
+        "poisoning",
+    ],
+    "infrastructure_disasters": [
+        "power outage",
+        "blackout",
+        "bridge collapse",
+        "roadblock",
+        "traffic",
+        "closure",
+        "train derailment",
+    ],
+}
+
+priority_keywords = {
+    "high": [
+        "high",
+        "emergency",
+        "urgent",
+        "sos",
+        "critical",
+        "immediate",
+        "life-threatening",
+        "evacuate",
+        "high alert",
+        "rescue",
+        "catastrophic",
+    ],
+    "medium": [
+        "medium",
+        "important",
+        "warning",
+        "caution",
+        "alert",
+        "moderate",
+        "significant",
+        "serious",
+        "needs attention",
+    ],
+    "low": [
+        "low",
+        "update",
+        "minor",
+        "low priority",
+        "routine",
+        "informational",
+        "no immediate danger",
+    ],
+}
+
+
+def build_keyword_categories():
+    categories = {}
+    for category, keywords in disaster_keywords.items():
+        for keyword in keywords:
+            categories.setdefault(keyword, []).append(category)
+    return categories
+
+
+keyword_categories = build_keyword_categories()
+
+
+def build_keyword_matcher():
+    # One LEMMA matcher for disasters and priority, so "floods" matches "flood"
+    # without re-tokenizing a joined lemma string
+    keyword_matcher = PhraseMatcher(nlp.vocab, attr="LEMMA")
+    for keyword, pattern in zip(keyword_categories, nlp.pipe(keyword_categories)):
+        keyword_matcher.add(f"DISASTER:{keyword}", [pattern])
+    for level, keywords in priority_keywords.items():
+        keyword_matcher.add(f"PRIORITY:{level}", list(nlp.pipe(keywords)))
+    return keyword_matcher
+
+
+nlp = None
+matcher = None
+
+
+def load_nlp():
+    global nlp, matcher
+    if nlp is None:
+        print("Loading NLP...")
+        nlp = spacy.load(NLP_MODEL, exclude=NLP_EXCLUDE)
+        matcher = build_keyword_matcher()
+        print("Loaded!")
+    return nlp
+
+
+nlp_client = None
+if NLP_SERVICE:
+    nlp_client = NLPClient(NLP_SERVICE, NLP_SERVICE_AUTHKEY)
+else:
+    load_nlp()
+
+
+def classify_doc(doc):
+    disaster_spans = []
+    levels = set()
+    for span in matcher(doc, as_spans=True):
+        kind, value = span.label_.split(":", 1)
+        if kind == "PRIORITY":
+            levels.add(value)
+        else:
+            disaster_spans.append(span)
+
+    # "forest fire" wins over the "fire" inside it
+    disasters = []
+    for span in filter_spans(disaster_spans):
+        keyword = span.label_.split(":", 1)[1]
+        if keyword not in disasters:
+            disasters.append(keyword)
+
+    categories = []
+    for keyword in disasters:
+        for category in keyword_categories[keyword]:
+            if category not in categories:
+                categories.append(category)
+
+    priority = next((level for level in PRIORITY_LEVELS if level in levels), None)
+    return {"disasters": disasters, "categories": categories, "priority": priority}
+
+
+parse_cache = TTLCache(PARSE_CACHE_SIZE, PARSE_CACHE_TTL)
+
+
+def normalize_query(text):
+    return " ".join((text or "").lower().split())
+
+
+def analyze_doc(doc):
+    # Dates are kept as phrases, they are resolved against today by the caller.
+    # Post text keeps its case for the entity recognizer, so a capitalized
+    # "Flood" is lemmatized as a name and has to be lowercased to match.
+    for token in doc:
+        token.lemma_ = token.lemma_.lower()
+    classification = classify_doc(doc)
+    return {
+        "lemmas": [token.lemma_ for token in doc],
+        "disaster_type": (
+            classification["disasters"][0] if classification["disasters"] else None
+        ),
+        "disasters": classification["disasters"],
+        "categories": classification["categories"],
+        "priority": classification["priority"],
+        "locations": [ent.text for ent in doc.ents if ent.label_ == "GPE"],
+        "dates": [ent.text for ent in doc.ents if ent.label_ == "DATE"],
+    }
+
+
+def parse_texts(texts, batch_size=NLP_BATCH_SIZE, n_process=1):
+    # analyze_doc results from the model in this process
+    return [
+        analyze_doc(doc)
+        for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+    ]
+
+
+def analyze_texts(texts, batch_size=NLP_BATCH_SIZE, n_process=1):
+    # Same as parse_texts, from the NLP service when one is configured
+    if nlp_client is not None:
+        return nlp_client.analyze(texts)
+    return parse_texts(texts, batch_size, n_process)
+
+
+def analyze_queries(texts):
+    # Returned dicts are shared with the cache and must not be mutated
+    keys = [normalize_query(text) for text in texts]
+    parsed = {}
+    missing = []
+    for key in keys:
+        if key in parsed:
+            continue
+        cached = parse_cache.get(key)
+        if cached is None:
+            missing.append(key)
+        parsed[key] = cached
+
+    for key, analyzed in zip(missing, analyze_texts(missing) if missing else []):
+        parsed[key] = analyzed
+        parse_cache.set(key, analyzed)
+
+    return [parsed[key] for key in keys]
+
+
+def analyze_query(text):
+    return analyze_queries([text])[0]
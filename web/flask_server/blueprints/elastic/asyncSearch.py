@@ -0,0 +1,100 @@
+import asyncio
+import atexit
+import threading
+
+
+class AsyncSearch:
+    """Runs Elasticsearch calls for async views on one background event loop.
+
+    Every view awaits the same AsyncElasticsearch client, so their calls
+    share one connection pool, and `gather` sends several calls at once and
+    waits for all of them. Flask still runs each async view on a request
+    thread of its own; this saves round trips, not threads. Without an
+    async client (the local backend) the synchronous client is called from
+    the loop's thread pool instead, as it also is while `available` says
+    the cluster is down.
+    """
+
+    def __init__(self, client_factory=None, sync_client=None, available=None):
+        self.client_factory = client_factory
+        self.sync_client = sync_client
+        self.available = available
+        self.client = None
+        self.loop = None
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+        self.failed = 0
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, daemon=True).start()
+            if self.client_factory is not None:
+                self.client = self.client_factory()
+                atexit.register(self.close)
+
+    def close(self):
+        if self.client is not None:
+            asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result(5)
+
+    async def run(self, method, kwargs):
+        # On the background loop. method is a client attribute path like
+        # "count" or "indices.exists".
+        self.calls += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            use_async = self.client is not None and (
+                self.available is None or self.available()
+            )
+            target = self.client if use_async else self.sync_client
+            for name in method.split("."):
+                target = getattr(target, name)
+            if use_async:
+                return await target(**kwargs)
+            return await asyncio.to_thread(target, **kwargs)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def run_all(self, calls):
+        return await asyncio.gather(
+            *(self.run(method, kwargs) for method, kwargs in calls)
+        )
+
+    def check_available(self):
+        # Fail fast while the health probe has the cluster down
+        if self.sync_client is not None:
+            return
+        if self.available is not None and not self.available():
+            raise ConnectionError("Elasticsearch is unreachable")
+
+    async def call(self, method, **kwargs):
+        # Awaitable from any event loop, e.g. the one Flask runs a view on
+        self.check_available()
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self.run(method, kwargs), self.loop)
+        return await asyncio.wrap_future(future)
+
+    async def gather(self, *calls):
+        # calls: (method, kwargs) pairs, results in the same order
+        self.check_available()
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self.run_all(calls), self.loop)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        return {
+            "client": "async" if self.client_factory is not None else "threaded",
+            "running": self.loop is not None,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "calls": self.calls,
+            "failed": self.failed,
+        }
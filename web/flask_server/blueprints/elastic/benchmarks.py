@@ -0,0 +1,360 @@
+"""Micro-benchmarks for the search pipeline.
+
+Run from web/flask_server, e.g. `python -m blueprints.elastic.benchmarks classifier`.
+"""
+
+from datetime import datetime, timedelta
+import argparse
+import random
+import time
+
+SAMPLE_QUERIES = [
+    "flood in Chennai this week",
+    "Cyclone Fengal landfall near Puducherry last week",
+    "urgent rescue needed building collapse in Mumbai",
+    "earthquake tremors felt in Delhi yesterday",
+    "forest fire spreading in Uttarakhand, evacuate villages",
+    "train derailment near Balasore, high alert",
+    "minor landslide update from Wayanad",
+    "gas leak reported in Bhopal factory",
+    "heavy rain and waterlogging in Bengaluru past 7 days",
+    "bus accident Kurla last month",
+    "power outage across Hyderabad after storm",
+    "riot and looting reported, needs attention",
+    "cholera outbreak in Odisha district",
+    "bridge collapse in Gujarat, critical situation",
+    "recent tsunami warning for Andaman coast",
+    "routine informational update on monsoon",
+]
+
+DATE_PHRASES = [
+    "this week",
+    "last week",
+    "past week",
+    "last month",
+    "this month",
+    "past 7 days",
+    "last 10 days",
+    "past 3 weeks",
+    "last two months",
+    "yesterday",
+    "today",
+    "last weekend",
+    "this weekend",
+    "last quarter",
+    "q3 2024",
+    "last december",
+    "november 2024",
+    "2024-12-01",
+    "2024-12-01 to 2024-12-05",
+    "05-12-2024",
+    "this year",
+    "3 days ago",
+    "the 5th of december",
+    "monsoon season",
+]
+
+
+LOCATIONS = [
+    "Chennai",
+    "Mumbai",
+    "Delhi",
+    "Tamil Nadu",
+    "Kerala",
+    "Wayanad",
+    "Puducherry",
+    "Bhopal",
+    "Hyderabad",
+    "Navi Mumbai",
+]
+DISASTERS = ["flood", "cyclone", "earthquake", "fire", "landslide", "accident"]
+PRIORITIES = ["high", "medium", "low"]
+SOURCES = ["RSS", "Twitter", "Mobile", "Web"]
+FILLER = (
+    "rescue teams relief water road power people stranded update district "
+    "officials villages rain wind damage shelter hospital evacuate alert"
+).split()
+
+# (query text, disaster_type, location, priority, source, date phrase)
+SEARCH_CASES = [
+    ("flood", "flood", None, None, None, None),
+    ("rescue teams", None, "Chennai", None, None, None),
+    ("", "cyclone", "Tamil Nadu", "high", None, None),
+    ("", None, "Mumbai", None, None, "last month"),
+    ("stranded people", "flood", "Kerala", None, None, "past 3 weeks"),
+    ("", None, None, "medium", "Twitter", None),
+    ("power outage", None, None, None, None, "this year"),
+    ("", None, None, None, None, None),
+]
+
+
+def synthetic_posts(count, seed=7):
+    # Reproducible posts shaped like /search/add-post payloads
+    rng = random.Random(seed)
+    now = datetime.now()
+    for number in range(count):
+        disaster = rng.choice(DISASTERS)
+        location = rng.choice(LOCATIONS)
+        yield {
+            "post_id": f"synthetic-{number}",
+            "post_title": f"{disaster.title()} in {location}",
+            "post_body": " ".join(rng.choice(FILLER) for _ in range(rng.randint(8, 40)))
+            + f" {disaster} {location}",
+            "location": location,
+            "date": (now - timedelta(minutes=rng.randint(0, 400 * 24 * 60))).isoformat(
+                timespec="seconds"
+            ),
+            "priority": rng.choice(PRIORITIES),
+            "source": rng.choice(SOURCES),
+            "disaster_type": disaster,
+        }
+
+
+def search_case_queries(size):
+    from blueprints.elastic.elastic import build_es_query
+    from blueprints.elastic.dates import parse_date_range
+
+    for text, disaster, location, priority, source, date in SEARCH_CASES:
+        entities = {
+            "query": text,
+            "disaster_type": disaster,
+            "location": location,
+            "priority": priority,
+            "source": source,
+            "date": parse_date_range(date),
+        }
+        yield build_es_query(entities, size=size)
+
+
+def time_per_item(fn, items, repeat):
+    # Best of `repeat` runs, in microseconds per item
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+
+def bench_classifier(args):
+    from blueprints.elastic.analysis import nlp, classify_doc
+
+    queries = [query.lower() for query in SAMPLE_QUERIES]
+    docs = list(nlp.pipe(queries))
+
+    parse_cost = time_per_item(nlp, queries, args.repeat)
+    classify_cost = time_per_item(classify_doc, docs, args.repeat)
+
+    print(f"queries:          {len(queries)}")
+    print(f"spaCy parse:      {parse_cost:10.1f} us/query")
+    print(f"classify_doc:     {classify_cost:10.1f} us/query")
+
+
+def bench_dates(args):
+    from blueprints.elastic.dates import match_date_range, parse_date_range
+    import dateparser
+
+    grammar_hits = sum(1 for phrase in DATE_PHRASES if match_date_range(phrase))
+    # Warm the dateparser cache so misses are measured at steady state
+    for phrase in DATE_PHRASES:
+        parse_date_range(phrase)
+
+    resolver_cost = time_per_item(parse_date_range, DATE_PHRASES, args.repeat)
+    dateparser_cost = time_per_item(dateparser.parse, DATE_PHRASES, args.repeat)
+
+    print(f"phrases:          {len(DATE_PHRASES)} ({grammar_hits} matched by grammar)")
+    print(f"parse_date_range: {resolver_cost:10.1f} us/phrase")
+    print(f"dateparser.parse: {dateparser_cost:10.1f} us/phrase")
+
+
+def bench_local_search(args):
+    from blueprints.elastic.elastic import build_post_document
+    from blueprints.elastic.localSearch import LocalSearchBackend
+
+    backend = LocalSearchBackend()
+    count = args.posts or 100_000
+    start = time.perf_counter()
+    for post in synthetic_posts(count):
+        document = build_post_document(post)
+        backend.index(index="posts", id=document["post_id"], document=document)
+    ingest = time.perf_counter() - start
+
+    print(f"posts:            {count} (indexed in {ingest:.1f} s)")
+    print("   size=50  size=1000     hits  case")
+
+    def search(query):
+        return backend.search(index="posts", body=query)
+
+    for case, page, full in zip(
+        SEARCH_CASES, search_case_queries(50), search_case_queries(1000)
+    ):
+        page_cost = time_per_item(search, [page], args.repeat) / 1000
+        full_cost = time_per_item(search, [full], args.repeat) / 1000
+        hits = backend.count(index="posts", query=page["query"])["count"]
+        print(f"{page_cost:8.2f} ms {full_cost:7.2f} ms {hits:8}  {case}")
+
+
+def bench_search_parity(args):
+    # Same corpus and queries against a scratch ES index and the local backend
+    from blueprints.elastic.elastic import build_post_document, es, local_search
+    from blueprints.elastic.localSearch import LocalSearchBackend
+    from elasticsearch.helpers import bulk
+
+    if es is None or local_search is not None:
+        print("Elasticsearch not available, nothing to compare against")
+        return
+
+    index = f"parity_posts_{int(time.time())}"
+    backend = LocalSearchBackend()
+    documents = [
+        build_post_document(post) for post in synthetic_posts(args.posts or 2000)
+    ]
+    for document in documents:
+        backend.index(index=index, id=document["post_id"], document=document)
+    bulk(
+        es,
+        (
+            {"_index": index, "_id": document["post_id"], "_source": document}
+            for document in documents
+        ),
+        refresh=True,
+    )
+
+    failures = 0
+    try:
+        for case, query in zip(SEARCH_CASES, search_case_queries(len(documents))):
+            expected = es.search(index=index, body=query)["hits"]["hits"]
+            actual = backend.search(index=index, body=query)["hits"]["hits"]
+            # Ties inside a source rank are in index order, so compare per rank
+            expected_ranks = [hit["_source"]["source_rank"] for hit in expected]
+            actual_ranks = [hit["_source"]["source_rank"] for hit in actual]
+            same_ids = {hit["_id"] for hit in expected} == {
+                hit["_id"] for hit in actual
+            }
+            ok = same_ids and expected_ranks == actual_ranks
+            failures += not ok
+            status = "ok  " if ok else "FAIL"
+            print(f"{status} {len(expected):5} es / {len(actual):5} local  {case}")
+    finally:
+        es.indices.delete(index=index, ignore_unavailable=True)
+    print(f"{len(SEARCH_CASES) - failures}/{len(SEARCH_CASES)} queries match")
+
+
+def story_posts(count, seed=11):
+    # Distinct stories over a 50k word vocabulary with a Zipf-like spread,
+    # synthetic_posts bodies share too many words for a duplicate check
+    rng = random.Random(seed)
+    for post in synthetic_posts(count, seed):
+        words = [
+            f"w{int(100 * 500 ** rng.random())}" for _ in range(rng.randint(20, 60))
+        ]
+        words += [post["disaster_type"], post["location"]]
+        yield {**post, "post_body": " ".join(words)}
+
+
+def rewrite(post, rng):
+    # Same story reworded: a quarter of the words dropped, a few new ones added
+    words = post["post_body"].split()
+    kept = [word for word in words if rng.random() > 0.25]
+    for _ in range(len(words) // 8):
+        kept.insert(rng.randrange(len(kept) + 1), f"w{rng.randrange(50_000)}")
+    return {
+        **post,
+        "post_id": f"{post['post_id']}-rewrite",
+        "post_body": " ".join(kept),
+    }
+
+
+def bench_dedup(args):
+    from blueprints.elastic.dedup import default_duplicate_index
+
+    # One minute of ingest at 10k posts/min, a fifth of them rewrites
+    rng = random.Random(11)
+    count = args.posts or 10_000
+    posts = []
+    for post in story_posts(count * 4 // 5):
+        posts.append(post)
+        if rng.random() < 0.25:
+            posts.append(rewrite(post, rng))
+    index = default_duplicate_index()
+
+    start = time.perf_counter()
+    groups = [index.assign(post, key=post["post_id"]) for post in posts]
+    elapsed = time.perf_counter() - start
+
+    by_id = dict(zip((post["post_id"] for post in posts), groups))
+    rewrites = [
+        post["post_id"] for post in posts if post["post_id"].endswith("-rewrite")
+    ]
+    caught = sum(
+        by_id[post_id] == by_id[post_id[: -len("-rewrite")]] for post_id in rewrites
+    )
+    stats = index.stats()
+    per_post = elapsed / len(posts) * 1e6
+    print(f"posts:            {len(posts)} ({len(rewrites)} rewrites)")
+    print(f"assign:           {per_post:10.1f} us/post")
+    print(f"at 10k posts/min: {per_post * 10_000 / 60 / 1e4:10.2f} % of one core")
+    print(f"rewrites grouped: {caught}/{len(rewrites)}")
+    print(f"groups:           {len(set(groups))}")
+    print(
+        f"candidates:       {stats['candidates_checked'] / len(posts):10.1f} per post"
+    )
+
+
+def bench_percolate(args):
+    from blueprints.elastic.elastic import build_es_query, build_post_document
+    from blueprints.elastic.savedQueries import SavedQueryIndex
+
+    # Dashboards' worth of saved queries, matched against bulk-sized batches
+    rng = random.Random(5)
+    index = SavedQueryIndex(1000)
+    for _ in range(args.queries or 10_000):
+        entities = {
+            "query": rng.choice(FILLER + [None] * 20),
+            "disaster_type": rng.choice(DISASTERS + [None] * 5),
+            "location": rng.choice(LOCATIONS + [None] * 5),
+            "priority": rng.choice(PRIORITIES + [None] * 10),
+            "source": rng.choice(SOURCES + [None] * 10),
+            "date": None,
+        }
+        index.add(build_es_query(entities)["query"])
+    posts = [
+        (post["post_id"], build_post_document(post))
+        for post in synthetic_posts(args.posts or 5000)
+    ]
+
+    start = time.perf_counter()
+    matches = 0
+    for position in range(0, len(posts), 500):
+        for query_ids in index.percolate(posts[position : position + 500]).values():
+            matches += len(query_ids)
+    elapsed = time.perf_counter() - start
+
+    stats = index.stats()
+    per_post = elapsed / len(posts) * 1e6
+    print(f"saved queries:    {stats['queries']} ({stats['unanchored']} unanchored)")
+    print(f"posts:            {len(posts)}")
+    print(f"percolate:        {per_post:10.1f} us/post")
+    print(f"matches:          {matches / len(posts):10.1f} queries/post")
+    print(f"re-checked:       {stats['checked'] / len(posts):10.1f} queries/post")
+
+
+BENCHMARKS = {
+    "classifier": bench_classifier,
+    "dates": bench_dates,
+    "dedup": bench_dedup,
+    "local-search": bench_local_search,
+    "percolate": bench_percolate,
+    "search-parity": bench_search_parity,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search pipeline micro-benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--posts", type=int, help="synthetic corpus size")
+    parser.add_argument("--queries", type=int, help="saved query count")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
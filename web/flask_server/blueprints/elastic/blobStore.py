@@ -0,0 +1,140 @@
+import binascii
+import hashlib
+import base64
+import struct
+import threading
+import os
+import re
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def decode_image(value):
+    # Raw base64 or a data: URL, as mobile.js and the web form send them
+    if not isinstance(value, str) or not value.strip():
+        return None
+    if value.startswith("data:"):
+        value = value.partition(",")[2]
+    # Line-wrapped base64 and dropped padding are common, both are accepted
+    value = "".join(value.split())
+    value += "=" * (-len(value) % 4)
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def image_type(data):
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def jpeg_size(data):
+    # Walks the segments to the first start-of-frame marker
+    position = 2
+    while position + 9 < len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker in (0xFF, 0x01) or 0xD0 <= marker <= 0xD7:
+            position += 1 if marker == 0xFF else 2
+            continue
+        (length,) = struct.unpack(">H", data[position + 2 : position + 4])
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[position + 5 : position + 9])
+            return width, height
+        position += 2 + length
+    return None
+
+
+def image_size(data, content_type):
+    # (width, height) from the image header, None when it can't be read
+    try:
+        if content_type == "image/png":
+            return struct.unpack(">II", data[16:24])
+        if content_type == "image/gif":
+            return struct.unpack("<HH", data[6:10])
+        if content_type == "image/jpeg":
+            return jpeg_size(data)
+        if content_type == "image/webp":
+            chunk = data[12:16]
+            if chunk == b"VP8X":
+                width = int.from_bytes(data[24:27], "little") + 1
+                height = int.from_bytes(data[27:30], "little") + 1
+                return width, height
+            if chunk == b"VP8L":
+                bits = int.from_bytes(data[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8 ":
+                width, height = struct.unpack("<HH", data[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+    except struct.error:
+        pass
+    return None
+
+
+def thumbnail_size(width, height, max_side):
+    # Fits the image in a max_side square, never scaling it up
+    scale = min(max_side / max(width, height, 1), 1.0)
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+class BlobStore:
+    """Content-addressed files on local disk.
+
+    A blob is named by the sha256 of its bytes and lives at
+    root/ab/cd/abcd..., so no directory grows past a few thousand entries
+    and the same image posted by several people is written once. Files are
+    written to a temporary name and renamed into place, so a reader never
+    sees a partial blob.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_stored = 0
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            with self.lock:
+                self.deduplicated += 1
+            return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as blob:
+            blob.write(data)
+        os.replace(temporary, path)
+        with self.lock:
+            self.stored += 1
+            self.bytes_stored += len(data)
+        return digest
+
+    def find(self, digest):
+        # Path of the blob, None for a malformed or unknown digest
+        if not DIGEST_PATTERN.match(digest or ""):
+            return None
+        path = self.path(digest)
+        return path if os.path.exists(path) else None
+
+    def stats(self):
+        return {
+            "root": self.root,
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "bytes_stored": self.bytes_stored,
+        }
@@ -0,0 +1,88 @@
+import hashlib
+import math
+import threading
+import time
+
+
+class CountingBloomFilter:
+    """Probabilistic set of post_ids that supports removal.
+
+    A miss is definite for the keys this filter was given, a hit only means
+    "maybe seen" and has to be confirmed against Elasticsearch. Counters are
+    one byte each and saturate at 255. `rebuild` swaps in a fresh copy, e.g.
+    from the index other processes write to, keeping keys added meanwhile.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.counters = bytearray(self.size)
+        self.count = 0
+        self.ready = False
+        self.refreshed_at = None
+        # Keys added while a rebuild runs, None when none is running
+        self.pending = None
+        self.lock = threading.Lock()
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        with self.lock:
+            for position in positions:
+                if self.counters[position] < 255:
+                    self.counters[position] += 1
+            self.count += 1
+            if self.pending is not None:
+                self.pending.append(key)
+
+    def rebuild(self, keys):
+        fresh = CountingBloomFilter(self.capacity, self.error_rate)
+        with self.lock:
+            self.pending = []
+        try:
+            for key in keys:
+                fresh.add(key)
+        finally:
+            with self.lock:
+                pending, self.pending = self.pending, None
+        for key in pending:
+            fresh.add(key)
+        with self.lock:
+            self.counters = fresh.counters
+            self.count = fresh.count
+            self.refreshed_at = time.time()
+
+    def remove(self, key):
+        positions = self._positions(key)
+        with self.lock:
+            if not all(self.counters[position] for position in positions):
+                return False
+            for position in positions:
+                # A saturated counter no longer knows its true count, leave it set
+                if self.counters[position] < 255:
+                    self.counters[position] -= 1
+            self.count -= 1
+            return True
+
+    def __contains__(self, key):
+        return all(self.counters[position] for position in self._positions(key))
+
+    def stats(self):
+        filled = 1 - self.counters.count(0) / self.size
+        return {
+            "ready": self.ready,
+            "refreshed_at": self.refreshed_at,
+            "capacity": self.capacity,
+            "entries": self.count,
+            "target_error_rate": self.error_rate,
+            "estimated_error_rate": filled**self.hash_count,
+            "hash_count": self.hash_count,
+            "memory_bytes": len(self.counters),
+        }
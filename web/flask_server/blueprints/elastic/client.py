@@ -0,0 +1,210 @@
+import threading
+import time
+
+# Served by the fallback while the cluster is down
+FALLBACK_READS = frozenset(
+    (
+        "search",
+        "count",
+        "get",
+        "mget",
+        "msearch",
+        "exists",
+        "open_point_in_time",
+        "close_point_in_time",
+    )
+)
+# Applied to the fallback and journaled for the cluster
+JOURNALED_WRITES = frozenset(("index", "create", "update", "delete", "bulk"))
+
+
+class ElasticClient:
+    """Lazily created Elasticsearch client with a background health probe.
+
+    Stands in for the client itself: attribute access is forwarded to an
+    Elasticsearch client built on first use, so nothing connects at import.
+    A probe thread pings the cluster every `health_interval` seconds. Once a
+    ping fails, calls fail fast instead of each waiting out the timeout, and
+    the probe retries with exponential backoff from `health_backoff` up to
+    `health_max_backoff` until the cluster answers again. With a `fallback`
+    client, such as the in-process index, reads go there instead while the
+    cluster is down. Writes only do with a `journal` to keep them until the
+    cluster is back and they are replayed to it, otherwise they fail as
+    every other call does. Callbacks given to `on_ready` run once, after the
+    first successful ping.
+    """
+
+    def __init__(
+        self,
+        host,
+        connections=10,
+        request_timeout=10,
+        max_retries=3,
+        retry_on_timeout=True,
+        health_interval=30,
+        health_timeout=2,
+        health_backoff=1,
+        health_max_backoff=300,
+        fallback=None,
+        journal=None,
+    ):
+        self.host = host
+        self.connections = connections
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.retry_on_timeout = retry_on_timeout
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.health_backoff = health_backoff
+        self.health_max_backoff = health_max_backoff
+        self.fallback = fallback
+        self.journal = journal
+        self.sync_client = None
+        self.lock = threading.Lock()
+        self.probing = False
+        self.ready_callbacks = []
+        self.ready = False
+        # None until the first probe, then whether the last ping answered
+        self.healthy = None
+        self.checked_at = None
+        self.failures = 0
+        self.next_probe = None
+
+    def client_settings(self, connections):
+        return {
+            "connections_per_node": connections,
+            "request_timeout": self.request_timeout,
+            "max_retries": self.max_retries,
+            "retry_on_timeout": self.retry_on_timeout,
+        }
+
+    def client(self):
+        with self.lock:
+            if self.sync_client is None:
+                from elasticsearch import Elasticsearch
+
+                self.sync_client = Elasticsearch(
+                    self.host, **self.client_settings(self.connections)
+                )
+            return self.sync_client
+
+    def async_client(self, connections):
+        # Same cluster and settings, for AsyncSearch
+        from elasticsearch import AsyncElasticsearch
+
+        return AsyncElasticsearch(self.host, **self.client_settings(connections))
+
+    def falling_back(self):
+        return self.healthy is False and self.fallback is not None
+
+    def __getattr__(self, name):
+        if self.healthy is False:
+            if self.fallback is not None and name in FALLBACK_READS:
+                return getattr(self.fallback, name)
+            if self.fallback is not None and self.journal is not None:
+                if name in JOURNALED_WRITES:
+                    return self.journal.recorder(name, getattr(self.fallback, name))
+            raise ConnectionError(f"Elasticsearch at {self.host} is unreachable")
+        return getattr(self.client(), name)
+
+    def on_ready(self, callback):
+        self.ready_callbacks.append(callback)
+
+    def start_probing(self):
+        with self.lock:
+            if self.probing:
+                return
+            self.probing = True
+        threading.Thread(target=self.probe, daemon=True).start()
+
+    def probe(self):
+        backoff = self.health_backoff
+        while True:
+            try:
+                healthy = bool(
+                    self.client()
+                    .options(request_timeout=self.health_timeout, max_retries=0)
+                    .ping()
+                )
+            except Exception as e:
+                print(f"Elasticsearch health check failed: {e}")
+                healthy = False
+            self.checked_at = time.time()
+
+            if healthy:
+                if self.healthy is not True:
+                    print("Connected to ElasticSearch")
+                # Writes journaled while it was down go first, then the
+                # stragglers journaled while that ran
+                self.replay_journal()
+                self.healthy = True
+                self.replay_journal()
+                self.failures = 0
+                backoff = self.health_backoff
+                if not self.ready:
+                    self.ready = True
+                    for callback in self.ready_callbacks:
+                        try:
+                            callback()
+                        except Exception as e:
+                            print(f"Warning: Elasticsearch startup task failed: {e}")
+                wait = self.health_interval
+            else:
+                if self.healthy is not False:
+                    print(
+                        f"Warning: ElasticSearch not reachable, retrying in {backoff}s"
+                    )
+                self.healthy = False
+                self.failures += 1
+                wait = backoff
+                backoff = min(backoff * 2, self.health_max_backoff)
+            self.next_probe = self.checked_at + wait
+            time.sleep(wait)
+
+    def replay_journal(self):
+        if self.journal is None:
+            return
+        try:
+            sent = self.journal.replay(self.client())
+            if sent:
+                print(f"Replayed {sent} writes journaled while ES was down")
+        except Exception as e:
+            print(f"Warning: Could not replay journaled writes: {e}")
+
+    def pool_stats(self):
+        # Connections checked out of each node's pool right now
+        nodes = []
+        if self.sync_client is not None:
+            for node in self.sync_client.transport.node_pool.all():
+                pool = getattr(node, "pool", None)
+                if pool is None or pool.pool is None:
+                    continue
+                size = pool.pool.maxsize
+                in_use = size - pool.pool.qsize()
+                nodes.append(
+                    {
+                        "node": str(node.base_url),
+                        "size": size,
+                        "in_use": in_use,
+                        "utilization": round(in_use / size, 3) if size else 0.0,
+                        "opened": pool.num_connections,
+                        "requests": pool.num_requests,
+                    }
+                )
+        return nodes
+
+    def stats(self):
+        return {
+            "host": self.host,
+            "healthy": self.healthy,
+            "falling_back": self.falling_back(),
+            "journal": self.journal.stats() if self.journal is not None else None,
+            "ready": self.ready,
+            "failures": self.failures,
+            "checked_at": self.checked_at,
+            "next_probe": self.next_probe,
+            "request_timeout": self.request_timeout,
+            "max_retries": self.max_retries,
+            "retry_on_timeout": self.retry_on_timeout,
+            "pool": self.pool_stats(),
+        }
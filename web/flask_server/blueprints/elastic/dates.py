@@ -0,0 +1,291 @@
+from datetime import datetime, timedelta
+from blueprints.elastic.cache import TTLCache
+import dateparser
+import re
+import os
+
+# dateparser is only consulted when the grammar below has no rule for a phrase
+DATEPARSER_CACHE_SIZE = int(os.environ.get("DATEPARSER_CACHE_SIZE", 1024))
+
+MONTHS = {
+    "january": 1,
+    "february": 2,
+    "march": 3,
+    "april": 4,
+    "may": 5,
+    "june": 6,
+    "july": 7,
+    "august": 8,
+    "september": 9,
+    "october": 10,
+    "november": 11,
+    "december": 12,
+    "jan": 1,
+    "feb": 2,
+    "mar": 3,
+    "apr": 4,
+    "jun": 6,
+    "jul": 7,
+    "aug": 8,
+    "sep": 9,
+    "sept": 9,
+    "oct": 10,
+    "nov": 11,
+    "dec": 12,
+}
+
+NUMBER_WORDS = {
+    "a": 1,
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+    "eleven": 11,
+    "twelve": 12,
+    "fifteen": 15,
+    "thirty": 30,
+}
+
+UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365}
+
+MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+NUMBER = r"\d+|" + "|".join(NUMBER_WORDS)
+
+dateparser_cache = TTLCache(DATEPARSER_CACHE_SIZE, 24 * 60 * 60)
+
+
+def start_of_day(day):
+    return datetime(day.year, day.month, day.day)
+
+
+def end_of_day(day):
+    return datetime(day.year, day.month, day.day, 23, 59, 59, 999999)
+
+
+def end_of_month(year, month):
+    if month == 12:
+        return datetime(year, 12, 31)
+    return datetime(year, month + 1, 1) - timedelta(days=1)
+
+
+def day_range(start, end):
+    return (start_of_day(start), end_of_day(end))
+
+
+def to_number(text):
+    return int(text) if text.isdigit() else NUMBER_WORDS[text]
+
+
+def rolling(match, today):
+    days = to_number(match["count"]) * UNIT_DAYS[match["unit"]]
+    return day_range(today - timedelta(days=days), today)
+
+
+def rolling_one(match, today):
+    return day_range(today - timedelta(days=UNIT_DAYS[match["unit"]]), today)
+
+
+def last_weekend(match, today):
+    saturday = today - timedelta(days=today.weekday() + 2)
+    return day_range(saturday, saturday + timedelta(days=1))
+
+
+def this_weekend(match, today):
+    if today.weekday() >= 5:
+        return day_range(today - timedelta(days=today.weekday() - 5), today)
+    return last_weekend(match, today)
+
+
+def last_week(match, today):
+    start = today - timedelta(days=today.weekday() + 7)
+    return day_range(start, start + timedelta(days=6))
+
+
+def this_week(match, today):
+    return day_range(today - timedelta(days=today.weekday()), today)
+
+
+def last_month(match, today):
+    end = today.replace(day=1) - timedelta(days=1)
+    return day_range(end.replace(day=1), end)
+
+
+def this_month(match, today):
+    return day_range(today.replace(day=1), today)
+
+
+def last_year(match, today):
+    return day_range(datetime(today.year - 1, 1, 1), datetime(today.year - 1, 12, 31))
+
+
+def this_year(match, today):
+    return day_range(datetime(today.year, 1, 1), today)
+
+
+def today_range(match, today):
+    return day_range(today, today)
+
+
+def yesterday(match, today):
+    day = today - timedelta(days=1)
+    return day_range(day, day)
+
+
+def quarter_range(year, quarter):
+    start_month = 3 * (quarter - 1) + 1
+    return day_range(
+        datetime(year, start_month, 1), end_of_month(year, start_month + 2)
+    )
+
+
+def last_quarter(match, today):
+    quarter = (today.month - 1) // 3
+    if quarter == 0:
+        return quarter_range(today.year - 1, 4)
+    return quarter_range(today.year, quarter)
+
+
+def this_quarter(match, today):
+    start, _ = quarter_range(today.year, (today.month - 1) // 3 + 1)
+    return day_range(start, today)
+
+
+def named_quarter(match, today):
+    year = int(match["year"]) if match["year"] else today.year
+    return quarter_range(year, int(match["quarter"]))
+
+
+def named_month(match, today):
+    month = MONTHS[match["month"]]
+    if match["year"]:
+        year = int(match["year"])
+    elif match["last"]:
+        # "last march" in March means the previous year's March
+        year = today.year - 1 if today.month <= month else today.year
+    else:
+        year = today.year - 1 if today.month < month else today.year
+    return day_range(datetime(year, month, 1), end_of_month(year, month))
+
+
+def day_of_month(match, today):
+    month = MONTHS[match["month"] or match["month2"]]
+    day = int(match["day"] or match["day2"])
+    if match["year"]:
+        year = int(match["year"])
+    else:
+        year = today.year - 1 if (month, day) > (today.month, today.day) else today.year
+    date = datetime(year, month, day)
+    return day_range(date, date)
+
+
+def iso_dates(match, today):
+    start = datetime(int(match["y1"]), int(match["m1"]), int(match["d1"]))
+    end = start
+    if match["y2"]:
+        end = datetime(int(match["y2"]), int(match["m2"]), int(match["d2"]))
+    return day_range(start, end)
+
+
+def dmy_date(match, today):
+    day = datetime(int(match["year"]), int(match["month"]), int(match["day"]))
+    return day_range(day, day)
+
+
+# Checked in order, the first matching rule wins
+DATE_RULES = [
+    (
+        r"\b(?:last|past|previous)\s+(?P<count>" + NUMBER + r")\s+"
+        r"(?P<unit>day|week|month|year)s?\b",
+        rolling,
+    ),
+    (r"\b(?:last|previous)\s+weekend\b", last_weekend),
+    (r"\bthis\s+weekend\b", this_weekend),
+    (r"\bpast\s+(?P<unit>week|month|year)\b", rolling_one),
+    (r"\b(?:last|previous)\s+week\b", last_week),
+    (r"\bthis\s+week\b", this_week),
+    (r"\b(?:last|previous)\s+month\b", last_month),
+    (r"\bthis\s+month\b", this_month),
+    (r"\b(?:last|previous)\s+year\b", last_year),
+    (r"\bthis\s+year\b", this_year),
+    (r"\b(?:last|previous)\s+quarter\b", last_quarter),
+    (r"\bthis\s+quarter\b", this_quarter),
+    (r"\bq(?P<quarter>[1-4])(?:\s*(?P<year>\d{4}))?\b", named_quarter),
+    (r"\btoday\b", today_range),
+    (r"\byesterday\b", yesterday),
+    (
+        r"(?P<y1>\d{4})-(?P<m1>\d{1,2})-(?P<d1>\d{1,2})"
+        r"(?:\s*(?:to|until|-)\s*(?P<y2>\d{4})-(?P<m2>\d{1,2})-(?P<d2>\d{1,2}))?",
+        iso_dates,
+    ),
+    (r"\b(?P<day>\d{1,2})[-/.](?P<month>\d{1,2})[-/.](?P<year>\d{4})\b", dmy_date),
+    (
+        r"\b(?:(?P<day>\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<month>"
+        + MONTH_NAMES
+        + r")|(?P<month2>"
+        + MONTH_NAMES
+        + r")\s+(?P<day2>\d{1,2})(?:st|nd|rd|th)?)\b(?:,?\s+(?P<year>\d{4}))?",
+        day_of_month,
+    ),
+    (
+        r"\b(?P<last>last\s+)?(?P<month>" + MONTH_NAMES + r")\b(?:\s+(?P<year>\d{4}))?",
+        named_month,
+    ),
+]
+DATE_RULES = [(re.compile(pattern), resolver) for pattern, resolver in DATE_RULES]
+
+
+def match_date_range(phrase, today=None):
+    today = today or datetime.now()
+    phrase = phrase.lower()
+    for pattern, resolver in DATE_RULES:
+        match = pattern.search(phrase)
+        if match:
+            try:
+                return resolver(match, today)
+            except ValueError:
+                # e.g. 31-02-2024
+                return None
+    return None
+
+
+def cached_dateparser(phrase):
+    # Relative phrases ("3 days ago") depend on today, so the day is part of the key
+    key = (phrase.lower().strip(), datetime.now().date())
+    cached = dateparser_cache.get(key)
+    if cached is not None:
+        return cached[0]
+    try:
+        parsed = dateparser.parse(phrase, settings={"PREFER_DATES_FROM": "past"})
+    except Exception as e:
+        print(e)
+        parsed = None
+    dateparser_cache.set(key, (parsed,))
+    return parsed
+
+
+def parse_date_range(phrase):
+    if not phrase:
+        return None
+    date_range = match_date_range(phrase)
+    if date_range:
+        return date_range
+    parsed = cached_dateparser(phrase)
+    if parsed is None:
+        return None
+    return day_range(parsed, parsed)
+
+
+def parse_date(text):
+    # Single date for the manual search form, which searches from that date on
+    if not text:
+        return None
+    date_range = match_date_range(text)
+    if date_range:
+        return date_range[0]
+    return cached_dateparser(text)
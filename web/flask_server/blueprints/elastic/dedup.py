@@ -0,0 +1,190 @@
+from collections import OrderedDict
+from spacy.lang.en.stop_words import STOP_WORDS
+import numpy as np
+import threading
+import uuid
+import zlib
+import re
+import os
+
+# Posts whose estimated word-set Jaccard similarity reaches the threshold share
+# a dup_group_id. Rewrites of one story typically score 0.35-0.5, unrelated
+# posts about the same kind of disaster stay well below 0.2.
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", 0.35))
+# bands * rows MinHash values per post. More bands catch weaker matches but
+# check more candidates, more rows per band do the opposite.
+DEDUP_BANDS = int(os.environ.get("DEDUP_BANDS", 20))
+DEDUP_ROWS = int(os.environ.get("DEDUP_ROWS", 3))
+# Only the most recent posts are compared against, rewrites arrive close together
+DEDUP_MAX_ENTRIES = int(os.environ.get("DEDUP_MAX_ENTRIES", 200_000))
+# Most recent posts kept per bucket, bounds the work for a story posted 1000 times
+DEDUP_BUCKET_SIZE = int(os.environ.get("DEDUP_BUCKET_SIZE", 32))
+
+# Post fields that are compared
+DEDUP_TEXT_FIELDS = ("post_title", "post_body")
+
+TOKEN_PATTERN = re.compile(r"\w+")
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+def dedup_tokens(document, fields=DEDUP_TEXT_FIELDS):
+    text = " ".join(str(document.get(field) or "") for field in fields)
+    return {
+        token
+        for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOP_WORDS
+    }
+
+
+class DuplicateIndex:
+    """MinHash LSH over the word sets of recent posts.
+
+    Each post gets `bands * rows` MinHash values, and every band of `rows`
+    values is a key in that band's bucket table. Posts sharing any bucket are
+    candidates, and a candidate whose signature agrees on at least `threshold`
+    of the values is a near-duplicate. The new post joins the best match's
+    group, so a chain of rewrites ends up in one group. The oldest posts are
+    evicted past `max_entries`, and buckets only hold their `bucket_size`
+    most recent posts.
+    """
+
+    def __init__(
+        self,
+        threshold,
+        bands,
+        rows,
+        max_entries,
+        bucket_size=DEDUP_BUCKET_SIZE,
+        fields=DEDUP_TEXT_FIELDS,
+        seed=1,
+    ):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.max_entries = max_entries
+        self.bucket_size = bucket_size
+        self.fields = fields
+        # Universal hashing (a * x + b) mod p, everything below p = 2**31 - 1
+        # so the products fit in uint64
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=bands * rows, dtype=np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=bands * rows, dtype=np.uint64)
+        self.entries = OrderedDict()
+        self.buckets = [{} for _ in range(bands)]
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.duplicates = 0
+        self.assigned = 0
+
+    def signature(self, tokens):
+        if not tokens:
+            return None
+        hashes = np.fromiter(
+            (zlib.crc32(token.encode("utf-8")) % MERSENNE_PRIME for token in tokens),
+            dtype=np.uint64,
+            count=len(tokens),
+        )
+        values = (np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME
+        return values.min(axis=1)
+
+    def band_keys(self, signature):
+        return [
+            signature[band * self.rows : (band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def assign(self, document, key=None, group_id=None):
+        # dup_group_id for the post, recording it for the posts after it.
+        # `key` identifies the post so a re-sent one replaces its old entry,
+        # `group_id` keeps an already assigned group (used when warming).
+        signature = self.signature(dedup_tokens(document, self.fields))
+        if signature is None:
+            return group_id
+        keys = self.band_keys(signature)
+
+        with self.lock:
+            self.assigned += 1
+            if group_id is None:
+                candidates = set()
+                for band, band_key in enumerate(keys):
+                    candidates.update(self.buckets[band].get(band_key, ()))
+                group_id = self.best_match(signature, candidates)
+                if group_id is not None:
+                    self.duplicates += 1
+                else:
+                    group_id = uuid.uuid4().hex
+
+            entry_id = key if key is not None else uuid.uuid4().hex
+            if entry_id in self.entries:
+                self.forget(entry_id)
+            self.entries[entry_id] = (signature, group_id)
+            for band, band_key in enumerate(keys):
+                bucket = self.buckets[band].setdefault(band_key, {})
+                bucket[entry_id] = None
+                if len(bucket) > self.bucket_size:
+                    del bucket[next(iter(bucket))]
+            while len(self.entries) > self.max_entries:
+                self.forget(next(iter(self.entries)))
+        return group_id
+
+    def best_match(self, signature, candidates):
+        if not candidates:
+            return None
+        candidates = list(candidates)
+        self.checked += len(candidates)
+        signatures = np.stack([self.entries[entry_id][0] for entry_id in candidates])
+        scores = np.count_nonzero(signatures == signature, axis=1) / len(signature)
+        best = int(scores.argmax())
+        if scores[best] < self.threshold:
+            return None
+        return self.entries[candidates[best]][1]
+
+    def forget(self, entry_id):
+        signature, _ = self.entries.pop(entry_id)
+        for band, band_key in enumerate(self.band_keys(signature)):
+            bucket = self.buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.pop(entry_id, None)
+                if not bucket:
+                    del self.buckets[band][band_key]
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows": self.rows,
+            "bucket_size": self.bucket_size,
+            "assigned": self.assigned,
+            "duplicates": self.duplicates,
+            "candidates_checked": self.checked,
+        }
+
+
+def default_duplicate_index(fields=DEDUP_TEXT_FIELDS):
+    return DuplicateIndex(
+        DEDUP_THRESHOLD, DEDUP_BANDS, DEDUP_ROWS, DEDUP_MAX_ENTRIES, fields=fields
+    )
+
+
+def collapse_duplicates(posts, index=None):
+    # Keeps the first post of each dup_group_id and counts the rest on it.
+    # Posts without a group are grouped on the fly when an index is given.
+    kept = []
+    groups = {}
+    for post in posts:
+        if not isinstance(post, dict):
+            kept.append(post)
+            continue
+        group_id = post.get("dup_group_id")
+        if not group_id and index is not None:
+            group_id = index.assign(post)
+        if not group_id:
+            kept.append(post)
+        elif group_id in groups:
+            groups[group_id]["duplicates"] = groups[group_id].get("duplicates", 0) + 1
+        else:
+            groups[group_id] = post
+            kept.append(post)
+    return kept
@@ -1,209 +1,877 @@
-from flask import Blueprint, request
-from datetime import datetime, timedelta
-from spacy.matcher import PhraseMatcher
-import dateparser
-import spacy
+from flask import (
+    Blueprint,
+    Response,
+    copy_current_request_context,
+    request,
+    send_file,
+)
+from werkzeug.datastructures import MultiDict
+from elasticsearch import TransportError
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+from blueprints.elastic.blobStore import (
+    BlobStore,
+    decode_image,
+    image_size,
+    image_type,
+    thumbnail_size,
+)
+from blueprints.elastic.bloom import CountingBloomFilter
+from blueprints.elastic.cache import TTLCache
+from blueprints.elastic.client import ElasticClient
+from blueprints.elastic.writeJournal import WriteJournal
+from blueprints.elastic.analysis import (
+    analyze_queries,
+    analyze_query,
+    nlp_client,
+    parse_cache,
+)
+from blueprints.elastic.asyncSearch import AsyncSearch
+from blueprints.elastic.dates import parse_date, parse_date_range
+from blueprints.elastic.dedup import collapse_duplicates, default_duplicate_index
+from blueprints.elastic.enrichment import (
+    EnrichmentWorker,
+    enrich_documents,
+    enrichment_operations,
+)
+from blueprints.elastic.geocode import Gazetteer
+from blueprints.elastic.incidents import IncidentIndex, INCIDENT_FIELDS
+from blueprints.elastic.localSearch import LocalSearchBackend
+from blueprints.elastic.partitions import (
+    add_months,
+    document_partition,
+    expired_partitions,
+    partition_base,
+    partition_name,
+    partitions_between,
+    template_name,
+    write_alias,
+)
+from blueprints.elastic.savedQueries import SavedQueryIndex
+from blueprints.elastic.suggest import (
+    PrefixIndex,
+    normalize_suggestion,
+    suggestion_texts,
+    SUGGESTION_FIELDS,
+)
+import hashlib
+import threading
+import uuid
+import queue
+import click
+import base64
 import json
+import time
 import os
 
 DEMO_MODE = os.environ.get("DEMO_MODE", "false").lower() == "true"
 
-# Elasticsearch setup - mock in demo mode
+# "elasticsearch", or "local" to always use the in-process index
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "elasticsearch").lower()
+# Use the in-process index when the cluster is mocked, unreachable or no
+# ES_HOST is set
+LOCAL_SEARCH_FALLBACK = (
+    os.environ.get("LOCAL_SEARCH_FALLBACK", "true").lower() == "true"
+)
+
+# Writes taken while the cluster is down wait here until they are replayed
+WRITE_JOURNAL_DIR = os.environ.get(
+    "WRITE_JOURNAL_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "write_journal"),
+)
+
+ES_HOST = os.environ.get("ES_HOST", "http://mongo.chinmaydesai.site:9200")
+# Connections per node for the synchronous client, i.e. calls in flight at once
+ES_CONNECTIONS = int(os.environ.get("ES_CONNECTIONS", 10))
+ES_REQUEST_TIMEOUT = float(os.environ.get("ES_REQUEST_TIMEOUT", 10))
+ES_MAX_RETRIES = int(os.environ.get("ES_MAX_RETRIES", 3))
+ES_RETRY_ON_TIMEOUT = os.environ.get("ES_RETRY_ON_TIMEOUT", "true").lower() == "true"
+# Seconds between health checks, and the backoff bounds while the cluster is down
+ES_HEALTH_INTERVAL = float(os.environ.get("ES_HEALTH_INTERVAL", 30))
+ES_HEALTH_BACKOFF = float(os.environ.get("ES_HEALTH_BACKOFF", 1))
+ES_HEALTH_MAX_BACKOFF = float(os.environ.get("ES_HEALTH_MAX_BACKOFF", 300))
+# Connections the async client keeps open, shared by every async view
+ASYNC_ES_CONNECTIONS = int(os.environ.get("ASYNC_ES_CONNECTIONS", 100))
+
+INDEX_NAME = "unverified_posts"
+ARCHIVE_INDEX_NAME = "archived_posts"
+
+
+def local_search_backend():
+    # Both names share one store, the unverified one only shows posts without
+    # a verdict, as moderation moves them out of it in the cluster
+    return LocalSearchBackend(
+        aliases={INDEX_NAME: ARCHIVE_INDEX_NAME},
+        alias_filters={
+            INDEX_NAME: {"bool": {"must_not": [{"exists": {"field": "verdict"}}]}}
+        },
+    )
+
+
+# Elasticsearch setup - mock in demo mode. The client connects on first use
+# and the health probe started below decides whether search is up. While it
+# is down, reads go to an in-process index standing in for the cluster, and
+# writes go there too and to a journal on disk that is replayed to it later.
 es = None
 if DEMO_MODE:
-    print("[DEMO MODE] Elasticsearch mocked - search will return empty results")
-else:
+    print("[DEMO MODE] Elasticsearch mocked")
+elif SEARCH_BACKEND != "local" and ES_HOST:
+    standby_search = None
+    write_journal = None
+    if LOCAL_SEARCH_FALLBACK:
+        standby_search = local_search_backend()
+        write_journal = WriteJournal(os.path.normpath(WRITE_JOURNAL_DIR))
+    es = ElasticClient(
+        ES_HOST,
+        connections=ES_CONNECTIONS,
+        request_timeout=ES_REQUEST_TIMEOUT,
+        max_retries=ES_MAX_RETRIES,
+        retry_on_timeout=ES_RETRY_ON_TIMEOUT,
+        health_interval=ES_HEALTH_INTERVAL,
+        health_backoff=ES_HEALTH_BACKOFF,
+        health_max_backoff=ES_HEALTH_MAX_BACKOFF,
+        fallback=standby_search,
+        journal=write_journal,
+    )
+
+# Completion-suggester index fed at ingest, with an in-process prefix index in front
+SUGGEST_INDEX_NAME = "post_suggestions"
+AUTOCOMPLETE_SIZE = 25
+SUGGEST_MAX_ENTRIES = int(os.environ.get("SUGGEST_MAX_ENTRIES", 100_000))
+SUGGEST_CACHE_SIZE = int(os.environ.get("SUGGEST_CACHE_SIZE", 1024))
+# Seconds between reloads of the suggestions other workers have added
+SUGGEST_REFRESH = float(os.environ.get("SUGGEST_REFRESH", 300))
+
+# Search ordering: RSS first, then Twitter, then everything else
+SOURCE_RANKS = {"RSS": 0, "Twitter": 1}
+DEFAULT_SOURCE_RANK = 2
+
+# List views get a lightweight "card" projection, heavy fields are fetched per post
+CARD_FIELDS = [
+    "post_id",
+    "post_title",
+    "post_body",
+    "location",
+    "date",
+    "priority",
+    "source",
+    "disaster_type",
+    "post_image_url",
+    # Only posts offload-images hasn't moved to the image store still have it
+    "post_image_b64",
+    "post_image_hash",
+    "post_image_width",
+    "post_image_height",
+    "url",
+    "likes",
+    "retweets",
+    "createdAt",
+    "dup_group_id",
+]
+
+# Cursor pagination for /elastic
+DEFAULT_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = 1000
+
+# Sub-queries one /multi request may carry
+MULTI_SEARCH_MAX_QUERIES = int(os.environ.get("MULTI_SEARCH_MAX_QUERIES", 20))
+
+# Post photos are kept out of the index, in a content-addressed store on disk
+IMAGE_STORE_DIR = os.environ.get(
+    "IMAGE_STORE_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "image_store"),
+)
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", 10 * 1024 * 1024))
+# Longest side of the card thumbnail the stored width and height are for
+IMAGE_THUMBNAIL_SIZE = int(os.environ.get("IMAGE_THUMBNAIL_SIZE", 320))
+# Blobs never change under a hash, so clients may keep them for a year
+IMAGE_MAX_AGE = 365 * 24 * 3600
+PIT_KEEP_ALIVE = os.environ.get("SEARCH_PIT_KEEP_ALIVE", "2m")
+
+# Result cache for repeated /elastic queries
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 256))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 60))
+# Other workers' writes reach the cache keys through the cluster's indexing
+# counters, read this often, so that is how long their posts can be missing
+SEARCH_GENERATION_POLL = float(os.environ.get("SEARCH_GENERATION_POLL", 2))
+# The posts indices' refresh_interval. A write only shows up in searches after
+# the next refresh, so results this soon after one aren't cached.
+ES_REFRESH_INTERVAL = float(os.environ.get("ES_REFRESH_INTERVAL", 1))
+
+# Streaming mode reads the result set in batches of this size
+STREAM_BATCH_SIZE = int(os.environ.get("SEARCH_STREAM_BATCH_SIZE", 500))
+
+# Bulk ingest tuning, overridable per request
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", 500))
+BULK_FLUSH_INTERVAL = float(os.environ.get("BULK_FLUSH_INTERVAL", 1.0))
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/ndjson")
+
+# Moderation verdicts and the status they leave on the post
+MODERATION_VERDICTS = {
+    "verify": "verified",
+    "archive": "archived",
+    "reject": "rejected",
+}
+MODERATE_MAX_POSTS = int(os.environ.get("MODERATE_MAX_POSTS", 5000))
+
+# In-process "seen" filter in front of the post_id existence checks
+SEEN_FILTER_CAPACITY = int(os.environ.get("SEEN_FILTER_CAPACITY", 1_000_000))
+SEEN_FILTER_ERROR_RATE = float(os.environ.get("SEEN_FILTER_ERROR_RATE", 0.01))
+# Other workers' posts only reach this filter when it is refreshed from the
+# cluster, so for up to this many seconds they can read as unseen. The post_id
+# is the document _id, so a post re-sent in that window overwrites itself.
+# 0 leaves the filter off and every lookup goes to Elasticsearch.
+SEEN_FILTER_REFRESH = float(os.environ.get("SEEN_FILTER_REFRESH", 60))
+# A refresh only reads the posts indexed since the last one. The filter is
+# rebuilt from every post this often, which also drops other workers' removals.
+SEEN_FILTER_REBUILD = float(os.environ.get("SEEN_FILTER_REBUILD", 3600))
+# Seconds of indexed_at each incremental refresh reads again, covering the
+# index refresh delay and clock skew between workers
+INGEST_REFRESH_OVERLAP = float(os.environ.get("INGEST_REFRESH_OVERLAP", 30))
+
+# /stats dashboard aggregations, cached briefly since every poll is identical
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", 30))
+STATS_TERMS_SIZE = 10
+STATS_FIELDS = ("disaster_type", "source", "priority", "location")
+STATS_INTERVALS = ("hour", "day", "week", "month")
+
+# Ingest-time NLP enrichment, batched on a background thread
+ENRICHMENT_ENABLED = os.environ.get("ENRICHMENT", "true").lower() == "true"
+ENRICH_BATCH_SIZE = int(os.environ.get("ENRICH_BATCH_SIZE", 64))
+ENRICH_MAX_WAIT = float(os.environ.get("ENRICH_MAX_WAIT", 0.5))
+ENRICH_QUEUE_SIZE = int(os.environ.get("ENRICH_QUEUE_SIZE", 10_000))
+# spaCy worker processes for the enrich-posts backfill
+ENRICH_N_PROCESS = int(os.environ.get("ENRICH_N_PROCESS", 1))
+
+# Near-duplicate grouping at ingest, thresholds are in dedup.py
+DEDUP_ENABLED = os.environ.get("DEDUP", "true").lower() == "true"
+# Posts from this many days back are loaded into the index at startup
+DEDUP_WARM_DAYS = int(os.environ.get("DEDUP_WARM_DAYS", 3))
+# Seconds between loading what the other workers indexed since, until then a
+# rewrite of their post can start a group of its own
+DEDUP_REFRESH = float(os.environ.get("DEDUP_REFRESH", 5))
+
+# Posts are placed with the bundled gazetteer at ingest, in a geo_point field
+GEO_FIELD = "geo"
+# A place named in a query also matches posts placed this close to it
+GEO_LOCATION_RADIUS_KM = float(os.environ.get("GEO_LOCATION_RADIUS_KM", 50))
+GEO_GRID_PRECISION = 4
+GEO_GRID_SIZE = 1000
+
+# Online clustering of ingested posts into incidents for /incidents
+INCIDENTS_ENABLED = os.environ.get("INCIDENTS", "true").lower() == "true"
+INCIDENT_DIMENSIONS = int(os.environ.get("INCIDENT_DIMENSIONS", 512))
+INCIDENT_THRESHOLD = float(os.environ.get("INCIDENT_THRESHOLD", 0.3))
+INCIDENT_WINDOW_HOURS = float(os.environ.get("INCIDENT_WINDOW_HOURS", 72))
+INCIDENT_MAX = int(os.environ.get("INCIDENT_MAX", 20_000))
+# Posts from this many days back are replayed into the clusters at startup,
+# and again every INCIDENT_REBUILD seconds to drop what other workers removed
+INCIDENT_WARM_DAYS = int(os.environ.get("INCIDENT_WARM_DAYS", 7))
+INCIDENT_REBUILD = float(os.environ.get("INCIDENT_REBUILD", 3600))
+# Seconds between loading the posts other workers indexed since, each with
+# the incident_id it was given there
+INCIDENT_REFRESH = float(os.environ.get("INCIDENT_REFRESH", 10))
+
+# Saved queries, matched against every ingested post and streamed over SSE
+SAVED_QUERY_INDEX_NAME = "saved_queries"
+# Matches waiting for a slow client before they are dropped
+SAVED_QUERY_QUEUE_SIZE = int(os.environ.get("SAVED_QUERY_QUEUE_SIZE", 1000))
+# Proxies close idle connections, a comment line every so often keeps it open
+SSE_KEEPALIVE = float(os.environ.get("SSE_KEEPALIVE", 15))
+# Matches are also written here so SSE streams on other workers see them
+SAVED_QUERY_MATCH_INDEX_NAME = "saved_query_matches"
+# Seconds between polls for other workers' matches, and between reloads of
+# the saved queries other workers added or removed
+SAVED_QUERY_POLL = float(os.environ.get("SAVED_QUERY_POLL", 1))
+SAVED_QUERY_RELOAD = float(os.environ.get("SAVED_QUERY_RELOAD", 30))
+# Matches older than this are deleted from the match index
+SAVED_QUERY_MATCH_TTL = float(os.environ.get("SAVED_QUERY_MATCH_TTL", 600))
+# Matches indexed up to this late, e.g. by the refresh interval, are still read
+SAVED_QUERY_MATCH_LAG = 5
+# Tells this worker's matches apart from the ones it should relay
+WORKER_ID = uuid.uuid4().hex
+
+# Monthly partitions, e.g. unverified_posts-2024.12, behind an alias with the
+# old index name. `flask search partition-indices` migrates an existing index.
+INDEX_PARTITIONS = os.environ.get("INDEX_PARTITIONS", "false").lower() == "true"
+# Date ranges spanning more months than this search the whole alias
+PARTITION_MAX_SEARCH = int(os.environ.get("PARTITION_MAX_SEARCH", 24))
+# Months rollover-partitions keeps, 0 keeps everything
+PARTITION_RETENTION_MONTHS = int(os.environ.get("PARTITION_RETENTION_MONTHS", 0))
+PARTITIONED_INDICES = (INDEX_NAME, ARCHIVE_INDEX_NAME)
+
+POST_TEMPLATE = {
+    "post_id": "",
+    "post_title": "",
+    "post_body": "",
+    "post_body_full": "",
+    "date": None,
+    "likes": 0,
+    "retweets": 0,
+    "post_image_url": "",
+    "post_image_hash": "",
+    "location": "",
+    "url": "",
+    "disaster_type": "",
+    "source": "",
+    "createdAt": "",
+}
+
+search = Blueprint("search", __name__)
+
+seen_filter = CountingBloomFilter(SEEN_FILTER_CAPACITY, SEEN_FILTER_ERROR_RATE)
+search_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+suggestions = PrefixIndex(SUGGEST_MAX_ENTRIES, SUGGEST_CACHE_SIZE)
+stats_cache = TTLCache(64, STATS_CACHE_TTL)
+gazetteer = Gazetteer()
+image_store = BlobStore(os.path.normpath(IMAGE_STORE_DIR))
+duplicate_index = default_duplicate_index() if DEDUP_ENABLED else None
+incidents = (
+    IncidentIndex(
+        INCIDENT_DIMENSIONS, INCIDENT_THRESHOLD, INCIDENT_WINDOW_HOURS, INCIDENT_MAX
+    )
+    if INCIDENTS_ENABLED
+    else None
+)
+saved_queries = SavedQueryIndex(SAVED_QUERY_QUEUE_SIZE, card_fields=CARD_FIELDS)
+
+# Bumped on every write, cached results from older generations are never served
+index_generation = 0
+# Documents indexed and deleted in the post indices by every worker
+cluster_generation = None
+# When either generation last moved
+generation_changed_at = 0.0
+
+
+def bump_index_generation():
+    global index_generation, generation_changed_at
+    index_generation += 1
+    generation_changed_at = time.time()
+
+
+def generation_settled():
+    # Whether the writes behind the current generation are searchable yet
+    if local_search is not None:
+        return True
+    return time.time() - generation_changed_at >= ES_REFRESH_INTERVAL
+
+
+def poll_cluster_generation():
+    global cluster_generation, generation_changed_at
+    while True:
+        if not searching_locally():
+            try:
+                response = es.indices.stats(
+                    index=f"{INDEX_NAME},{ARCHIVE_INDEX_NAME}",
+                    metric="indexing",
+                    ignore_unavailable=True,
+                )
+                indexing = response["_all"]["primaries"].get("indexing", {})
+                generation = indexing.get("index_total", 0) + indexing.get(
+                    "delete_total", 0
+                )
+                if generation != cluster_generation:
+                    generation_changed_at = time.time()
+                cluster_generation = generation
+            except Exception as e:
+                # Unknown, so /elastic stops caching until it can be read
+                print(f"Couldn't read the cluster's indexing stats: {e}")
+                cluster_generation = None
+        time.sleep(SEARCH_GENERATION_POLL)
+
+
+def ingest_timestamp(at=None):
+    # indexed_at value, UTC so workers in different zones compare equal
+    at = time.time() if at is None else at
+    return datetime.fromtimestamp(at, timezone.utc).isoformat(timespec="milliseconds")
+
+
+def indexed_since(since):
+    # Posts indexed at or after the time.time() value `since`
+    return {"range": {"indexed_at": {"gte": ingest_timestamp(since)}}}
+
+
+def indexed_post_ids(since=None):
+    from elasticsearch.helpers import scan
+
+    query = {"_source": ["post_id"]}
+    if since is not None:
+        query["query"] = indexed_since(since)
+    for hit in scan(
+        es,
+        index=f"{INDEX_NAME},{ARCHIVE_INDEX_NAME}",
+        query=query,
+        ignore_unavailable=True,
+    ):
+        post_id = hit["_source"].get("post_id")
+        if post_id:
+            yield post_id
+
+
+def warm_seen_filter():
+    # Picks up what the other workers indexed since the last pass, and now and
+    # then rebuilds from every post
+    rebuilt_at = None
+    refreshed_at = None
+    while True:
+        if not searching_locally():
+            started = time.time()
+            try:
+                if rebuilt_at is None or started - rebuilt_at >= SEEN_FILTER_REBUILD:
+                    seen_filter.rebuild(indexed_post_ids())
+                    rebuilt_at = started
+                else:
+                    since = refreshed_at - INGEST_REFRESH_OVERLAP
+                    for post_id in indexed_post_ids(since):
+                        seen_filter.add(post_id)
+                refreshed_at = started
+                if not seen_filter.ready:
+                    print(f"Seen filter warmed with {seen_filter.count} post ids")
+                seen_filter.ready = True
+            except Exception as e:
+                print(f"Warning: Could not refresh seen filter: {e}")
+        time.sleep(SEEN_FILTER_REFRESH)
+
+
+def create_suggestion_index():
     try:
-        from elasticsearch import Elasticsearch
+        if not es.indices.exists(index=SUGGEST_INDEX_NAME):
+            es.indices.create(
+                index=SUGGEST_INDEX_NAME,
+                mappings={
+                    "properties": {
+                        "suggest": {"type": "completion"},
+                        "text": {"type": "keyword"},
+                        "field": {"type": "keyword"},
+                    }
+                },
+            )
+    except Exception as e:
+        print(f"Warning: Could not create the suggestion index: {e}")
+
+
+def load_suggestions():
+    # One pass over the suggestion index into the in-process prefix index
+    from elasticsearch.helpers import scan
+
+    for hit in scan(
+        es,
+        index=SUGGEST_INDEX_NAME,
+        query={"_source": ["text", "suggest.weight"]},
+    ):
+        source = hit["_source"]
+        suggestions.set_weight(source["text"], source["suggest"]["weight"])
+    suggestions.complete = len(suggestions.entries) < SUGGEST_MAX_ENTRIES
+
+
+def warm_suggestions():
+    create_suggestion_index()
+    warmed = False
+    while True:
+        if not searching_locally():
+            try:
+                load_suggestions()
+                if not warmed:
+                    print(
+                        f"Autocomplete warmed with {len(suggestions.entries)} suggestions"
+                    )
+                warmed = True
+            except Exception as e:
+                print(f"Warning: Could not warm autocomplete: {e}")
+        time.sleep(SUGGEST_REFRESH)
+
+
+def load_duplicate_index(query):
+    from elasticsearch.helpers import scan
+
+    loaded = 0
+    for hit in scan(
+        es,
+        index=f"{INDEX_NAME},{ARCHIVE_INDEX_NAME}",
+        query={
+            "query": query,
+            "_source": ["post_title", "post_body", "dup_group_id"],
+        },
+        ignore_unavailable=True,
+    ):
+        source = hit["_source"]
+        duplicate_index.assign(
+            source, key=hit["_id"], group_id=source.get("dup_group_id")
+        )
+        loaded += 1
+    return loaded
+
+
+def warm_duplicate_index():
+    # Recent posts first, then what the other workers index from there on,
+    # keeping the groups they assigned
+    refreshed_at = None
+    while True:
+        if not searching_locally():
+            started = time.time()
+            try:
+                if refreshed_at is None:
+                    warmed = load_duplicate_index(
+                        {"range": {"date": {"gte": f"now-{DEDUP_WARM_DAYS}d/d"}}}
+                    )
+                    print(f"Duplicate index warmed with {warmed} posts")
+                else:
+                    load_duplicate_index(
+                        indexed_since(refreshed_at - INGEST_REFRESH_OVERLAP)
+                    )
+                refreshed_at = started
+            except Exception as e:
+                print(f"Warning: Could not refresh duplicate index: {e}")
+        time.sleep(DEDUP_REFRESH)
+
+
+def incident_posts(query):
+    from elasticsearch.helpers import scan
+
+    hits = list(
+        scan(
+            es,
+            index=f"{INDEX_NAME},{ARCHIVE_INDEX_NAME}",
+            query={"query": query, "_source": list(INCIDENT_FIELDS)},
+            ignore_unavailable=True,
+        )
+    )
+    # Replayed in posting order, as if they had just come in
+    hits.sort(key=lambda hit: str(hit["_source"].get("date")))
+    for hit in hits:
+        yield hit["_source"], hit["_id"], hit["_source"].get("incident_id")
+
+
+def warm_incidents():
+    # Posts keep the incident_id they were given, so every worker puts them
+    # in the same incident
+    rebuilt_at = None
+    refreshed_at = None
+    while True:
+        if not searching_locally():
+            started = time.time()
+            try:
+                if rebuilt_at is None or started - rebuilt_at >= INCIDENT_REBUILD:
+                    warmed = incidents.rebuild(
+                        incident_posts(
+                            {"range": {"date": {"gte": f"now-{INCIDENT_WARM_DAYS}d/d"}}}
+                        )
+                    )
+                    if rebuilt_at is None:
+                        print(f"Incidents warmed with {warmed} posts")
+                    rebuilt_at = started
+                else:
+                    since = refreshed_at - INGEST_REFRESH_OVERLAP
+                    for document, doc_id, incident_id in incident_posts(
+                        indexed_since(since)
+                    ):
+                        incidents.add(document, doc_id, incident_id)
+                refreshed_at = started
+            except Exception as e:
+                print(f"Warning: Could not refresh incidents: {e}")
+        time.sleep(INCIDENT_REFRESH)
 
-        es = Elasticsearch("http://mongo.chinmaydesai.site:9200")
-        if es.ping():
-            print("Connected to ElasticSearch")
-        else:
-            print("Warning: ElasticSearch not reachable, running in fallback mode")
-            es = None
+
+def reload_saved_queries():
+    # Other workers add and remove saved queries too, the index has them all
+    from elasticsearch.helpers import scan
+
+    saved = {}
+    for hit in scan(es, index=SAVED_QUERY_INDEX_NAME):
+        source = hit["_source"]
+        saved[hit["_id"]] = (source["query"], source.get("parameters"))
+    saved_queries.sync(saved)
+
+
+def warm_saved_queries():
+    try:
+        if not es.indices.exists(index=SAVED_QUERY_INDEX_NAME):
+            # The query DSL is only stored, never searched
+            es.indices.create(
+                index=SAVED_QUERY_INDEX_NAME,
+                mappings={
+                    "dynamic": False,
+                    "properties": {"created_at": {"type": "date"}},
+                },
+            )
+        if not es.indices.exists(index=SAVED_QUERY_MATCH_INDEX_NAME):
+            es.indices.create(
+                index=SAVED_QUERY_MATCH_INDEX_NAME,
+                mappings={
+                    "dynamic": False,
+                    "properties": {
+                        "matched_at": {"type": "date", "format": "epoch_millis"},
+                        "origin": {"type": "keyword"},
+                    },
+                },
+            )
+        reload_saved_queries()
+        print(f"Saved queries warmed with {len(saved_queries)} queries")
     except Exception as e:
-        print(f"Warning: Could not connect to ElasticSearch: {e}")
-        es = None
+        print(f"Warning: Could not warm saved queries: {e}")
+    threading.Thread(target=relay_saved_query_matches, daemon=True).start()
+
+
+def relay_saved_query_matches():
+    # Publishes other workers' matches to the SSE streams on this one, and
+    # picks up their saved query changes
+    since = time.time() * 1000
+    relayed = {}
+    reloaded = cleaned = time.monotonic()
+    while True:
+        time.sleep(SAVED_QUERY_POLL)
+        if searching_locally():
+            continue
+        try:
+            if time.monotonic() - reloaded >= SAVED_QUERY_RELOAD:
+                reload_saved_queries()
+                reloaded = time.monotonic()
+            if time.monotonic() - cleaned >= SAVED_QUERY_MATCH_TTL / 10:
+                cutoff = int(time.time() * 1000 - SAVED_QUERY_MATCH_TTL * 1000)
+                es.delete_by_query(
+                    index=SAVED_QUERY_MATCH_INDEX_NAME,
+                    query={"range": {"matched_at": {"lt": cutoff}}},
+                    conflicts="proceed",
+                )
+                cleaned = time.monotonic()
+            if not saved_queries.has_subscribers():
+                since = time.time() * 1000
+                relayed.clear()
+                continue
+
+            horizon = int(since - SAVED_QUERY_MATCH_LAG * 1000)
+            response = es.search(
+                index=SAVED_QUERY_MATCH_INDEX_NAME,
+                query={
+                    "bool": {
+                        "filter": [{"range": {"matched_at": {"gte": horizon}}}],
+                        "must_not": [{"term": {"origin": WORKER_ID}}],
+                    }
+                },
+                sort=[{"matched_at": "asc"}],
+                size=1000,
+            )
+            for hit in response["hits"]["hits"]:
+                if hit["_id"] in relayed:
+                    continue
+                match = hit["_source"]
+                relayed[hit["_id"]] = match["matched_at"]
+                since = max(since, match["matched_at"])
+                saved_queries.publish(
+                    match["post"]["objId"], match["post"], match["query_ids"]
+                )
+            # Only the ids still inside the look-back window can come again
+            horizon = since - SAVED_QUERY_MATCH_LAG * 1000
+            for event_id in [key for key, at in relayed.items() if at < horizon]:
+                del relayed[event_id]
+        except Exception as e:
+            print(f"Couldn't relay saved query matches: {e}")
+
+
+def ensure_post_mapping():
+    # Has to exist before the first geo point is indexed, or it maps as an object
+    for index in (INDEX_NAME, ARCHIVE_INDEX_NAME):
+        try:
+            es.indices.put_mapping(
+                index=index,
+                properties={
+                    GEO_FIELD: {"type": "geo_point"},
+                    "indexed_at": {"type": "date"},
+                },
+            )
+        except Exception as e:
+            print(f"Warning: Could not map the post fields of {index}: {e}")
+
+
+def put_partition_template(base, aliased=True):
+    # New partitions get the mappings set by hand on the old index, and join
+    # the read alias unless the old index still holds its name
+    template = {
+        "mappings": {
+            "properties": {
+                GEO_FIELD: {"type": "geo_point"},
+                "source_rank": {"type": "long"},
+            }
+        }
+    }
+    if aliased:
+        template["aliases"] = {base: {}}
+    es.indices.put_index_template(
+        name=template_name(base), index_patterns=[f"{base}-*"], template=template
+    )
 
-INDEX_NAME = "unverified_posts"
 
-search = Blueprint("search", __name__)
+def ensure_partitions(base, today=None):
+    # This month's partition exists and holds the write alias
+    today = today or datetime.now()
+    current = partition_name(base, today)
+    if not es.indices.exists(index=current):
+        try:
+            es.indices.create(index=current)
+        except Exception as e:
+            # Usually a post for this month created it first
+            print(f"{current}: {e}")
 
-print("Loading NLP...")
-nlp = spacy.load("en_core_web_lg")
-print("Loaded!")
-
-disaster_keywords = {
-    "natural_disasters": [
-        "earthquake",
-        "flood",
-        "tsunami",
-        "landslide",
-        "avalanche",
-        "hurricane",
-        "typhoon",
-        "cyclone",
-        "tornado",
-        "storm",
-        "wildfire",
-        "forest fire",
-        "drought",
-        "volcano",
-        "eruption",
-    ],
-    "man_made_disasters": [
-        "explosion",
-        "fire",
-        "chemical spill",
-        "gas leak",
-        "building collapse",
-        "pollution",
-        "oil spill",
-        "plane crash",
-        "train derailment",
-        "car crash",
-    ],
-    "violence_and_security": [
-        "shooting",
-        "attack",
-        "terrorist",
-        "riot",
-        "protest",
-        "bomb",
-        "hostage",
-        "war",
-        "gunfire",
-        "looting",
-        "explosion",
-        "armed",
-    ],
-    "health_disasters": [
-        "pandemic",
-        "epidemic",
-        "outbreak",
-        "infection",
-        "disease",
-        "quarantine",
-        "virus",
-        "vaccine",
-        "contamination",
-        "poisoning",
-    ],
-    "infrastructure_disasters": [
-        "power outage",
-        "blackout",
-        "bridge collapse",
-        "roadblock",
-        "traffic",
-        "closure",
-        "train derailment",
-    ],
-}
-matcher = PhraseMatcher(nlp.vocab)
-disasters = []
-for keyword in disaster_keywords:
-    disasters += disaster_keywords[keyword]
-patterns = [nlp.make_doc(text) for text in disasters]
-matcher.add("DISASTER", None, *patterns)
+    alias = write_alias(base)
+    actions = [{"add": {"index": current, "alias": alias, "is_write_index": True}}]
+    if es.indices.exists_alias(name=alias):
+        for index in es.indices.get_alias(name=alias):
+            if index != current:
+                actions.append({"remove": {"index": index, "alias": alias}})
+    es.indices.update_aliases(actions=actions)
 
 
-def build_date_range_filter(start_date, end_date=None):
-    if not start_date:
-        return None
+def is_partitioned(base):
+    # After the migration the old index name is the read alias
+    return bool(es.indices.exists_alias(name=base))
 
-    date_filter = {"range": {"date": {}}}
-    date_filter["range"]["date"]["gte"] = start_date.strftime("%Y-%m-%d")
 
-    if end_date:
-        date_filter["range"]["date"]["lte"] = end_date.strftime("%Y-%m-%d")
+local_search = None
+partitioned = False
+if es is None and (SEARCH_BACKEND == "local" or LOCAL_SEARCH_FALLBACK):
+    # Nothing else writes the unverified index here, so both names share one store
+    local_search = local_search_backend()
+    es = local_search
+    print("Using the in-process local search backend")
 
-    return date_filter
 
+def searching_locally():
+    # The in-process index serves everything, for good or while ES is down
+    return local_search is not None or (es is not None and es.falling_back())
 
-def detect_priority(phrase):
-    priority_keywords = {
-        "high": [
-            "high",
-            "emergency",
-            "urgent",
-            "sos",
-            "critical",
-            "immediate",
-            "life-threatening",
-            "evacuate",
-            "high alert",
-            "rescue",
-            "catastrophic",
-        ],
-        "medium": [
-            "medium",
-            "important",
-            "warning",
-            "caution",
-            "alert",
-            "moderate",
-            "significant",
-            "serious",
-            "needs attention",
-        ],
-        "low": [
-            "low",
-            "update",
-            "minor",
-            "low priority",
-            "routine",
-            "informational",
-            "no immediate danger",
-        ],
-    }
-    phrase_lower = phrase.lower()
 
-    if any(keyword in phrase_lower for keyword in priority_keywords["high"]):
-        return "high"
+def prepare_cluster():
+    # Runs on the health probe's thread once the cluster first answers
+    global partitioned
+    if INDEX_PARTITIONS:
+        try:
+            for base in PARTITIONED_INDICES:
+                if not is_partitioned(base):
+                    raise RuntimeError(
+                        f"{base} is not partitioned yet, run partition-indices"
+                    )
+                put_partition_template(base)
+                ensure_partitions(base)
+            partitioned = True
+        except Exception as e:
+            print(f"Warning: Not using index partitions: {e}")
+    ensure_post_mapping()
+    if SEEN_FILTER_REFRESH > 0:
+        threading.Thread(target=warm_seen_filter, daemon=True).start()
+    threading.Thread(target=warm_suggestions, daemon=True).start()
+    if duplicate_index is not None:
+        threading.Thread(target=warm_duplicate_index, daemon=True).start()
+    if incidents is not None:
+        threading.Thread(target=warm_incidents, daemon=True).start()
+    threading.Thread(target=warm_saved_queries, daemon=True).start()
+    threading.Thread(target=poll_cluster_generation, daemon=True).start()
+
+
+if local_search is not None:
+    # Every post the local index holds went through this process
+    seen_filter.ready = True
+    suggestions.complete = True
+elif es is not None:
+    es.on_ready(prepare_cluster)
+    es.start_probing()
+
+async_search = None
+if local_search is not None:
+    async_search = AsyncSearch(sync_client=local_search)
+elif es is not None:
+    async_search = AsyncSearch(
+        client_factory=lambda: es.async_client(ASYNC_ES_CONNECTIONS),
+        sync_client=es.fallback,
+        available=lambda: es.healthy is not False,
+    )
 
-    elif any(keyword in phrase_lower for keyword in priority_keywords["medium"]):
-        return "medium"
+enrichment = None
+if es is not None and ENRICHMENT_ENABLED:
+    # Enriched fields can change search results, so cached ones are dropped
+    enrichment = EnrichmentWorker(
+        es,
+        ENRICH_BATCH_SIZE,
+        ENRICH_MAX_WAIT,
+        ENRICH_QUEUE_SIZE,
+        on_write=bump_index_generation,
+    )
 
-    elif any(keyword in phrase_lower for keyword in priority_keywords["low"]):
-        return "low"
 
-    else:
-        return None
+def enqueue_enrichment(index, doc_id, document):
+    if enrichment is not None:
+        enrichment.submit(index, doc_id, document)
+
 
+def assign_incident(document):
+    # Stored on the post, for the other workers and the next start
+    if incidents is not None:
+        document["incident_id"] = incidents.add(document, post_document_id(document))
 
-def detect_disasters(doc):
-    lemmatized_doc = []
-    for token in doc:
-        lemmatized_doc.append(token.lemma_)
 
-    lemmatized_doc = nlp.make_doc(" ".join(lemmatized_doc))
+def untrack_incident(doc_id):
+    if incidents is not None and doc_id is not None:
+        incidents.remove(doc_id)
 
-    matches = matcher(lemmatized_doc)
 
-    for match_id, start, end in matches:
-        span = lemmatized_doc[start:end]
-        return span.text
+def percolate_posts(posts):
+    # posts: [(doc_id, document)], a failure here must not fail the ingest
+    try:
+        matches = saved_queries.percolate(posts)
+        if not matches or searching_locally():
+            return
+        # Streams on other workers pick these up from the match index
+        documents = dict(posts)
+        matched_at = int(time.time() * 1000)
+        operations = []
+        for doc_id, query_ids in matches.items():
+            post = {field: documents[doc_id].get(field) for field in CARD_FIELDS}
+            post["objId"] = doc_id
+            operations.append({"index": {"_index": SAVED_QUERY_MATCH_INDEX_NAME}})
+            operations.append(
+                {
+                    "query_ids": query_ids,
+                    "post": post,
+                    "matched_at": matched_at,
+                    "origin": WORKER_ID,
+                }
+            )
+        es.bulk(operations=operations)
+    except Exception as e:
+        print(f"Couldn't match saved queries: {e}")
 
-    return None
 
+def assign_dup_group(document):
+    if duplicate_index is not None:
+        document["dup_group_id"] = duplicate_index.assign(
+            document, key=post_document_id(document)
+        )
+
+
+def build_date_range_filter(start_date, end_date=None):
+    if not start_date:
+        return None
+
+    date_filter = {"range": {"date": {}}}
+    date_filter["range"]["date"]["gte"] = start_date.strftime("%Y-%m-%d")
+
+    if end_date:
+        date_filter["range"]["date"]["lte"] = end_date.strftime("%Y-%m-%d")
+
+    return date_filter
 
-def preprocess_query(query, entities):
 
-    doc = nlp(query.lower())
-    entities["disaster_type"] = detect_disasters(doc)
-    entities["priority"] = detect_priority(query.lower())
+def preprocess_query(query, entities, parsed=None):
+    parsed = parsed or analyze_query(query)
+    entities["disaster_type"] = parsed["disaster_type"]
+    entities["priority"] = parsed["priority"]
 
-    for ent in doc.ents:
-        # Location
-        if ent.label_ == "GPE":
-            entities["location"] = ent.text
+    for location in parsed["locations"]:
+        entities["location"] = location
 
-        # Date
-        elif ent.label_ == "DATE":
-            parsed_date = parse_date_range(ent.text)
-            if parsed_date:
-                entities["date"] = parsed_date
+    for phrase in parsed["dates"]:
+        parsed_date = parse_date_range(phrase)
+        if parsed_date:
+            entities["date"] = parsed_date
 
     if "recent" in query.lower():
         entities["date"] = (datetime.now(), None)
@@ -211,120 +879,76 @@ def preprocess_query(query, entities):
     return entities
 
 
-def parse_date_range(phrase):
-    today = datetime.now()
-    start_date, end_date = None, None
-
-    if "last week" in phrase:
-        start_date = today - timedelta(days=today.weekday() + 7)
-        end_date = start_date + timedelta(days=6)
-    elif "this week" in phrase:
-        start_date = today - timedelta(days=today.weekday())
-        end_date = min(
-            start_date + timedelta(days=6), today
-        )  # Restrict end_date to today
-    elif "past week" in phrase:
-        start_date = today - timedelta(days=7)
-        end_date = today
-    elif "last month" in phrase:
-        start_of_this_month = today.replace(day=1)
-        end_of_last_month = start_of_this_month - timedelta(days=1)
-        start_date = end_of_last_month.replace(day=1)
-        end_date = end_of_last_month
-    elif "this month" in phrase:
-        start_date = today.replace(day=1)
-        end_date = today
-    elif "past month" in phrase:
-        start_date = today - timedelta(days=30)
-        end_date = today
-    elif "last year" in phrase:
-        start_date = today.replace(year=today.year - 1, month=1, day=1)
-        end_date = today.replace(year=today.year - 1, month=12, day=31)
-    elif "this year" in phrase:
-        start_date = today.replace(month=1, day=1)
-        end_date = today
-    elif "yesterday" in phrase:
-        start_date = today - timedelta(days=1)
-        end_date = start_date
-    elif "last weekend" in phrase:
-        last_saturday = today - timedelta(days=today.weekday() + 2)
-        last_sunday = last_saturday + timedelta(days=1)
-        start_date = last_saturday
-        end_date = last_sunday
-    elif "this weekend" in phrase:
-        last_saturday = today - timedelta(days=today.weekday() + 2)
-        last_sunday = last_saturday + timedelta(days=1)
-        start_date = last_saturday if last_saturday <= today else None
-        end_date = last_sunday if last_sunday <= today else None
-    elif "last quarter" in phrase:
-        current_quarter = (today.month - 1) // 3 + 1
-        start_month = 3 * (current_quarter - 2) + 1
-        end_month = start_month + 2
-        if start_month <= 0:
-            start_month += 12
-            end_month += 12
-            year = today.year - 1
-        else:
-            year = today.year
-        start_date = datetime(year, start_month, 1)
-        end_date = datetime(year, end_month, 1) + timedelta(days=-1)
-    elif "past 7 days" in phrase:
-        start_date = today - timedelta(days=7)
-        end_date = today
-    elif "past 30 days" in phrase:
-        start_date = today - timedelta(days=30)
-        end_date = today
-    elif "last 15 days" in phrase:
-        start_date = today - timedelta(days=15)
-        end_date = today
-    elif "last 2 weeks" in phrase:
-        start_date = today - timedelta(days=14)
-        end_date = today
-    elif "last 3 weeks" in phrase:
-        start_date = today - timedelta(days=21)
-        end_date = today
-    else:
-        months = [
-            "january",
-            "february",
-            "march",
-            "april",
-            "may",
-            "june",
-            "july",
-            "august",
-            "september",
-            "october",
-            "november",
-            "december",
-        ]
-        for i, month in enumerate(months, start=1):
-            if f"last {month}" in phrase.lower():
-                year = today.year - 1 if today.month <= i else today.year
-                start_date = datetime(year, i, 1)
-                if i == 12:  # December
-                    end_date = datetime(year, 12, 31)
-                else:
-                    end_date = datetime(year, i + 1, 1) - timedelta(days=1)
-                break
+def enriched_clause(field, value, fallback):
+    # The keyword the NLP pass extracted, or the text clause for values it
+    # missed or didn't lemmatize, like a hand-entered "Floods"
+    return {
+        "bool": {
+            "should": [
+                {"term": {f"{field}.keyword": " ".join(value.lower().split())}},
+                fallback,
+            ]
+        }
+    }
 
-    return (start_date, end_date)
 
+def location_clause(location):
+    # A place the post names, or a post placed near the place searched for. A
+    # state matches every post placed in it, so "Tamil Nadu" finds Tiruvannamalai.
+    clauses = [
+        enriched_clause(
+            "gpe_locations", location, {"match_phrase": {"location": location}}
+        )
+    ]
+    place = gazetteer.lookup(location)
+    if place is not None and place.kind == "state":
+        clauses.append({"term": {"geo_state.keyword": place.state}})
+    elif place is not None:
+        clauses.append(
+            {
+                "geo_distance": {
+                    "distance": f"{GEO_LOCATION_RADIUS_KM}km",
+                    GEO_FIELD: {"lat": place.lat, "lon": place.lon},
+                }
+            }
+        )
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"bool": {"should": clauses}}
 
-def build_es_query(entities):
+
+def build_es_query(entities, size=1000, source=None):
     query = {"bool": {"must": [], "filter": []}}
 
     if entities["query"]:
         query["bool"]["must"].append({"match": {"post_body": entities["query"]}})
 
     if entities["disaster_type"]:
-        query["bool"]["must"].append(
-            {"match": {"disaster_type": entities["disaster_type"]}}
+        query["bool"]["filter"].append(
+            enriched_clause(
+                "disaster_keywords",
+                entities["disaster_type"],
+                {"match": {"disaster_type": entities["disaster_type"]}},
+            )
         )
 
     if entities["location"]:
-        query["bool"]["must"].append(
-            {"match_phrase": {"location": entities["location"]}}
+        query["bool"]["filter"].append(location_clause(entities["location"]))
+
+    if entities.get("near"):
+        near = entities["near"]
+        query["bool"]["filter"].append(
+            {
+                "geo_distance": {
+                    "distance": f"{near['radius_km']}km",
+                    GEO_FIELD: {"lat": near["lat"], "lon": near["lon"]},
+                }
+            }
+        )
+
+    if entities.get("bbox"):
+        query["bool"]["filter"].append(
+            {"geo_bounding_box": {GEO_FIELD: entities["bbox"]}}
         )
 
     if entities["priority"]:
@@ -342,54 +966,126 @@ def build_es_query(entities):
             {"range": {"date": {"gte": start_date, "lte": end_date}}}
         )
 
-    return {
+    es_query = {
         "query": query,
         "sort": [
             {
-                "_script": {
-                    "type": "number",
-                    "script": {
-                        "source": """
-                        if (doc['source.keyword'].value == 'RSS') {
-                            return 0;
-                        } else if (doc['source.keyword'].value == 'Twitter') {
-                            return 1;
-                        } else {
-                            return 2;
-                        }
-                    """,
-                        "lang": "painless",
-                    },
+                "source_rank": {
                     "order": "asc",
+                    "missing": DEFAULT_SOURCE_RANK,
+                    "unmapped_type": "long",
                 }
             }
         ],
-        "size": 1000,
+        "size": size,
     }
+    if source is not None:
+        es_query["_source"] = source
+    return es_query
+
+
+def search_index(entities):
+    # Date bounded searches only read the monthly partitions they overlap
+    if not partitioned or not entities.get("date"):
+        return INDEX_NAME
+    start, end = entities["date"]
+    names = partitions_between(
+        INDEX_NAME, start, end or datetime.now(), PARTITION_MAX_SEARCH
+    )
+    return ",".join(names) if names else INDEX_NAME
+
+
+def write_index(base, document):
+    return document_partition(base, document) if partitioned else base
+
+
+def find_posts(index, ids, source_includes=None):
+    # {objId: hit}. A get through an alias over several partitions is an
+    # error, so partitioned indices are read with an ids query instead.
+    if not partitioned:
+        response = es.mget(index=index, ids=ids, source_includes=source_includes)
+        return {doc["_id"]: doc for doc in response["docs"] if doc.get("found")}
+    response = es.search(
+        index=index,
+        query={"ids": {"values": ids}},
+        size=len(ids),
+        source_includes=source_includes,
+    )
+    return {hit["_id"]: hit for hit in response["hits"]["hits"]}
+
+
+def post_index(index, objId):
+    # Partition holding the post, single document writes can't go to the alias
+    if not partitioned:
+        return index
+    hit = find_posts(index, [objId], ["post_id"]).get(objId)
+    return hit["_index"] if hit else index
 
 
 def search_elastic_db(es_client, index, query):
     if es_client is None:
         print("[DEMO MODE] Returning empty search results")
         return []
-    response = es_client.search(index=index, body=query)
+    # Months without a partition yet are simply skipped
+    response = es_client.search(index=index, body=query, ignore_unavailable=True)
     return response["hits"]["hits"]
 
 
-@search.route("/")
-def index():
-    return "Elastic search pipeline"
+def encode_cursor(pit_id, search_after):
+    state = json.dumps({"pit": pit_id, "after": search_after})
+    return base64.urlsafe_b64encode(state.encode("utf-8")).decode("ascii")
 
 
-@search.post("/elastic")
-def elasticSearch():
-    if es is None:
-        return {
-            "parameters": {},
-            "results": [],
-            "message": "Elasticsearch not available (demo mode)",
-        }
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+
+
+def search_elastic_page(es_client, index, query, page_size, cursor=None):
+    # Pages are read from a point-in-time so new posts don't shift the results
+    if cursor:
+        state = decode_cursor(cursor)
+        pit_id = state["pit"]
+    else:
+        pit_id = es_client.open_point_in_time(
+            index=index, keep_alive=PIT_KEEP_ALIVE, ignore_unavailable=True
+        )["id"]
 
+    body = dict(query)
+    body["size"] = page_size
+    body["track_total_hits"] = False
+    body["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+    if cursor:
+        body["search_after"] = state["after"]
+
+    try:
+        response = es_client.search(body=body)
+    except Exception:
+        # No cursor carries a PIT opened here yet, so nothing else can close it
+        if not cursor:
+            try:
+                es_client.close_point_in_time(id=pit_id)
+            except Exception as e:
+                print(e)
+        raise
+    hits = response["hits"]["hits"]
+    pit_id = response.get("pit_id", pit_id)
+
+    if len(hits) < page_size:
+        es_client.close_point_in_time(id=pit_id)
+        return hits, None
+    return hits, encode_cursor(pit_id, hits[-1]["sort"])
+
+
+def resolve_projection(fields):
+    # "card" (default), "full", or a comma separated list of fields
+    if not fields or fields == "card":
+        return {"includes": CARD_FIELDS}
+    if fields == "full":
+        return None
+    return {"includes": [field.strip() for field in fields.split(",") if field.strip()]}
+
+
+def extract_entities(form, parsed=None):
     entities = {
         "query": None,
         "disaster_type": None,
@@ -398,40 +1094,51 @@ def elasticSearch():
         "priority": None,
         "source": None,
     }
-    print(request.form)
-    query_string = request.form.get("query")
-    # print(True if request.form.get('nlp') else False)
-    # print(request.form.get('nlp'))
-    if request.form.get("nlp", False) == "false":
-        disaster_type = request.form.get("disaster_type")
-        location = request.form.get("location")
-        date = request.form.get("date")
-        try:
-            date = (dateparser.parse(date), None)
-        except:
-            date = None
-        # print(date, type(date))
-        source = request.form.get("source")
-        priority = request.form.get("priority")
+    print(form)
+    query_string = form.get("query")
+    if form.get("nlp", False) == "false":
+        date = parse_date(form.get("date"))
+        date = (date, None) if date else None
         entities = {
             "query": query_string,
-            "disaster_type": disaster_type,
-            "location": location,
+            "disaster_type": form.get("disaster_type"),
+            "location": form.get("location"),
             "date": date,
-            "priority": priority,
-            "source": source,
+            "priority": form.get("priority"),
+            "source": form.get("source"),
         }
         print("Manuel: ", entities)
     else:
-        entities = preprocess_query(query_string, entities)
+        entities = preprocess_query(query_string, entities, parsed)
         print(entities)
+    entities.update(extract_geo_filters(form))
+    return entities
 
-    es_query = build_es_query(entities)
-    print(es_query)
 
-    results = search_elastic_db(es, INDEX_NAME, es_query)
+def extract_geo_filters(form):
+    filters = {"near": None, "bbox": None}
+    lat = form.get("near_lat", type=float)
+    lon = form.get("near_lon", type=float)
+    if lat is not None and lon is not None:
+        radius = form.get("radius_km", GEO_LOCATION_RADIUS_KM, type=float)
+        filters["near"] = {"lat": lat, "lon": lon, "radius_km": radius}
 
-    entities_formatted = entities
+    # "west,south,east,north", as Leaflet's LatLngBounds.toBBoxString() gives it
+    bbox = form.get("bbox")
+    if bbox:
+        try:
+            west, south, east, north = (float(value) for value in bbox.split(","))
+            filters["bbox"] = {
+                "top_left": {"lat": north, "lon": west},
+                "bottom_right": {"lat": south, "lon": east},
+            }
+        except ValueError:
+            print(f"Ignoring malformed bbox: {bbox}")
+    return filters
+
+
+def format_entities(entities):
+    entities_formatted = dict(entities)
     entities_formatted["date"] = (
         " to ".join(
             date.strftime("%d-%m-%Y") for date in entities_formatted["date"] if date
@@ -439,94 +1146,974 @@ def elasticSearch():
         if entities_formatted["date"]
         else None
     )
+    return entities_formatted
 
-    for result in results:
-        result["_source"]["objId"] = result["_id"]
+
+def hits_to_posts(hits):
+    for hit in hits:
+        hit["_source"]["objId"] = hit["_id"]
+    return [hit["_source"] for hit in hits]
+
+
+def search_cache_key(form, projection):
+    # Keyed on the raw form so cache hits skip spaCy entirely. The day is part
+    # of the key because "this week" or "yesterday" resolve against today.
+    if form.get("nlp", False) == "false":
+        fields = ("query", "disaster_type", "location", "date", "priority", "source")
+    else:
+        fields = ("query",)
+    fields += ("near_lat", "near_lon", "radius_km", "bbox")
+    normalized = tuple(
+        (field, " ".join((form.get(field) or "").lower().split())) for field in fields
+    )
+    return (
+        index_generation,
+        cluster_generation,
+        datetime.now().date().isoformat(),
+        json.dumps(projection, sort_keys=True),
+        form.get("collapse", "false") == "true",
+        normalized,
+    )
+
+
+def next_day_boundary():
+    tomorrow = datetime.now().date() + timedelta(days=1)
+    return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+
+
+def wants_stream(req):
+    if req.form.get("stream", "false") == "true":
+        return True
+    best = req.accept_mimetypes.best_match(("application/json",) + NDJSON_MIMETYPES)
+    return best in NDJSON_MIMETYPES
+
+
+def stream_search_results(entities, projection, collapse=False):
+    # First line is the parsed parameters, then one post per line
+    yield json.dumps({"parameters": format_entities(entities)}) + "\n"
+
+    es_query = build_es_query(entities, size=STREAM_BATCH_SIZE, source=projection)
+    cursor = None
+    groups = set()
+    try:
+        while True:
+            hits, cursor = search_elastic_page(
+                es, search_index(entities), es_query, STREAM_BATCH_SIZE, cursor
+            )
+            for post in hits_to_posts(hits):
+                # Posts are already sent, so later duplicates are just skipped
+                group_id = post.get("dup_group_id")
+                if collapse and group_id:
+                    if group_id in groups:
+                        continue
+                    groups.add(group_id)
+                yield json.dumps(post) + "\n"
+            if cursor is None:
+                break
+    except Exception as e:
+        print(e)
+        yield json.dumps({"error": "Search failed while streaming"}) + "\n"
+    finally:
+        # Client went away mid-stream, release the point-in-time early
+        if cursor is not None:
+            try:
+                es.close_point_in_time(id=decode_cursor(cursor)["pit"])
+            except Exception as e:
+                print(e)
+
+
+@search.route("/")
+def index():
+    return "Elastic search pipeline"
+
+
+@search.post("/elastic")
+def elasticSearch():
+    if es is None:
+        return {
+            "parameters": {},
+            "results": [],
+            "message": "Elasticsearch not available (demo mode)",
+        }
+
+    projection = resolve_projection(request.form.get("fields"))
+    page_size = request.form.get("page_size", type=int)
+    cursor = request.form.get("cursor")
+    stream = wants_stream(request)
+    # Keep one post per near-duplicate group, within each page when paginating
+    collapse = request.form.get("collapse", "false") == "true"
+    if collapse and projection is not None:
+        projection["includes"] = list(
+            dict.fromkeys(projection["includes"] + ["dup_group_id"])
+        )
+
+    full_search = not stream and page_size is None and cursor is None
+    # Without the cluster's generation a cached result could miss other
+    # workers' posts for the whole TTL
+    cacheable = local_search is not None or cluster_generation is not None
+    cache_key = None
+    if full_search and cacheable:
+        cache_key = search_cache_key(request.form, projection)
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    entities = extract_entities(request.form)
+
+    if stream:
+        return Response(
+            stream_search_results(entities, projection, collapse),
+            mimetype="application/x-ndjson",
+        )
+
+    if full_search:
+        es_query = build_es_query(entities, source=projection)
+        print(es_query)
+        fallback = local_search is None and searching_locally()
+        try:
+            results = search_elastic_db(es, search_index(entities), es_query)
+        except (ConnectionError, TransportError) as e:
+            print(e)
+            return {
+                "parameters": format_entities(entities),
+                "results": [],
+                "message": "Elasticsearch not available",
+            }
+        posts = hits_to_posts(results)
+        response = {
+            "parameters": format_entities(entities),
+            "results": collapse_duplicates(posts) if collapse else posts,
+        }
+        # Stand-in results would outlive the outage in the cache, and ones from
+        # before the last write's refresh would hide it
+        if cache_key is not None and not fallback and generation_settled():
+            search_cache.set(cache_key, response, expires_at=next_day_boundary())
+        return response
+
+    page_size = min(max(page_size or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    es_query = build_es_query(entities, size=page_size, source=projection)
+    print(es_query)
+    try:
+        results, next_cursor = search_elastic_page(
+            es, search_index(entities), es_query, page_size, cursor
+        )
+    except Exception as e:
+        print(e)
+        return {"error": "Search failed or cursor expired"}
+
+    posts = hits_to_posts(results)
     return {
-        "parameters": entities,
-        "results": [result["_source"] for result in results],
+        "parameters": format_entities(entities),
+        "results": collapse_duplicates(posts) if collapse else posts,
+        "next_cursor": next_cursor,
     }
 
     # print(query_string, doc_type, location, date_range, priority)
     # return {'output': [query_string, location, doc_type, date_range, priority]}
 
 
+def descriptor_form(descriptor):
+    # A /multi sub-query as the form /elastic would have received
+    form = MultiDict()
+    for field, value in descriptor.items():
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        if value is not None:
+            form[field] = str(value)
+    return form
+
+
+def multi_search_request(form, parsed=None):
+    # (entities, msearch header, msearch body) for one sub-query
+    entities = extract_entities(form, parsed)
+    projection = resolve_projection(form.get("fields"))
+    collapse = form.get("collapse", "false") == "true"
+    if collapse and projection is not None:
+        projection["includes"] = list(
+            dict.fromkeys(projection["includes"] + ["dup_group_id"])
+        )
+    # size=0 (or count=true) for just the total
+    size = 0 if form.get("count", "false") == "true" else form.get("size", type=int)
+    size = MAX_PAGE_SIZE if size is None else min(max(size, 0), MAX_PAGE_SIZE)
+    body = build_es_query(entities, size=size, source=projection)
+    body["track_total_hits"] = True
+    header = {"index": search_index(entities), "ignore_unavailable": True}
+    return entities, header, body
+
+
+@search.post("/multi")
+def multiSearch():
+    # Several /elastic searches in one call: the NLP queries are parsed in one
+    # spaCy batch and everything goes to the cluster as one _msearch
+    if es is None:
+        return {"error": "Elasticsearch not available (demo mode)"}
+
+    queries = (request.get_json(silent=True) or {}).get("queries")
+    if isinstance(queries, list):
+        queries = {str(position): query for position, query in enumerate(queries)}
+    if not isinstance(queries, dict) or not queries:
+        return {"error": "queries must be a non-empty list or object"}
+    if len(queries) > MULTI_SEARCH_MAX_QUERIES:
+        return {"error": f"At most {MULTI_SEARCH_MAX_QUERIES} queries per request"}
+    if not all(isinstance(query, dict) for query in queries.values()):
+        return {"error": "Each query must be an object"}
+
+    forms = {key: descriptor_form(query) for key, query in queries.items()}
+    nlp_keys = [key for key, form in forms.items() if form.get("nlp") != "false"]
+    parsed = dict(
+        zip(nlp_keys, analyze_queries([forms[key].get("query") for key in nlp_keys]))
+    )
+
+    results = {}
+    pending = []
+    searches = []
+    for key, form in forms.items():
+        try:
+            entities, header, body = multi_search_request(form, parsed.get(key))
+        except Exception as e:
+            print(e)
+            results[key] = {"error": "Couldn't parse query"}
+            continue
+        pending.append((key, entities, form.get("collapse", "false") == "true"))
+        searches += [header, body]
+
+    if searches:
+        try:
+            responses = es.msearch(searches=searches)["responses"]
+        except Exception as e:
+            print(e)
+            return {"error": "Multi-search failed"}
+        for (key, entities, collapse), response in zip(pending, responses):
+            if "error" in response:
+                print(response["error"])
+                results[key] = {"error": "Search failed"}
+                continue
+            posts = hits_to_posts(response["hits"]["hits"])
+            results[key] = {
+                "parameters": format_entities(entities),
+                "total": response["hits"]["total"]["value"],
+                "results": collapse_duplicates(posts) if collapse else posts,
+            }
+
+    return {"results": {key: results[key] for key in queries}}
+
+
+def suggestion_operations(documents):
+    # Bulk upserts that bump the weight of every title/location/type seen
+    operations = []
+    for document in documents:
+        for text, field in suggestion_texts(document):
+            suggestions.add(text)
+            normalized = normalize_suggestion(text)
+            words = normalized.split(" ")
+            operations.append(
+                {
+                    "update": {
+                        "_index": SUGGEST_INDEX_NAME,
+                        "_id": hashlib.sha1(normalized.encode("utf-8")).hexdigest(),
+                    }
+                }
+            )
+            operations.append(
+                {
+                    "script": {
+                        "source": "ctx._source.suggest.weight += 1",
+                        "lang": "painless",
+                    },
+                    "upsert": {
+                        "text": text,
+                        "field": field,
+                        "suggest": {
+                            # Every word start, so "nadu" completes "Tamil Nadu"
+                            "input": [
+                                " ".join(words[position:])
+                                for position in range(min(len(words), 10))
+                            ],
+                            "weight": 1,
+                        },
+                    },
+                }
+            )
+    return operations
+
+
+def autocomplete_response(options):
+    # Same shape as the old terms aggregation, which Searchbar.jsx reads
+    return {
+        "aggregations": {
+            "auto_complete": {
+                "buckets": [
+                    {"key": text, "doc_count": weight} for text, weight in options
+                ]
+            }
+        }
+    }
+
+
 @search.get("/autocomplete")
 def esautocomplete():
-    query = request.args.get("query")
-    baseQuery = {
-        "_source": [],
-        "size": 0,
-        "min_score": 0.5,
-        "query": {
-            "bool": {
-                "must": [
-                    {
-                        "match_phrase_prefix": {
-                            "post_body": {"query": "{}".format(query)}
-                        }
-                    }
-                ],
-                "filter": [],
-                "should": [],
-                "must_not": [],
+    query = request.args.get("query", "")
+    options = suggestions.lookup(query, AUTOCOMPLETE_SIZE)
+    # A complete index answers every prefix, however few options it has
+    full = suggestions.complete
+    if full or es is None or local_search is not None or not query.strip():
+        return autocomplete_response(options)
+
+    try:
+        response = es.search(
+            index=SUGGEST_INDEX_NAME,
+            source=["text", "suggest.weight"],
+            suggest={
+                "auto_complete": {
+                    "prefix": normalize_suggestion(query),
+                    "completion": {
+                        "field": "suggest",
+                        "size": AUTOCOMPLETE_SIZE,
+                        "skip_duplicates": True,
+                    },
+                }
+            },
+        )
+    except Exception as e:
+        print(e)
+        return autocomplete_response(options)
+
+    options = [
+        (option["_source"]["text"], option["_source"]["suggest"]["weight"])
+        for option in response["suggest"]["auto_complete"][0]["options"]
+    ]
+    return autocomplete_response(options)
+
+
+@search.get("/autocomplete/stats")
+def autocompleteStats():
+    return suggestions.stats()
+
+
+@search.cli.command("backfill-suggestions")
+def backfillSuggestions():
+    # One-shot: flask --app main search backfill-suggestions
+    if es is None or local_search is not None:
+        print("Elasticsearch not available, nothing to backfill")
+        return
+
+    from elasticsearch.helpers import scan
+
+    create_suggestion_index()
+    load_suggestions()
+    documents = []
+    total = 0
+    for hit in scan(
+        es,
+        index=f"{INDEX_NAME},{ARCHIVE_INDEX_NAME}",
+        query={"_source": list(SUGGESTION_FIELDS)},
+        ignore_unavailable=True,
+    ):
+        documents.append(hit["_source"])
+        if len(documents) >= BULK_CHUNK_SIZE:
+            es.bulk(operations=suggestion_operations(documents))
+            total += len(documents)
+            documents = []
+    if documents:
+        es.bulk(operations=suggestion_operations(documents))
+        total += len(documents)
+    print(f"Backfilled suggestions from {total} posts")
+
+
+@search.get("/post/<objId>")
+def getPost(objId):
+    fields = request.args.get("fields")
+    try:
+        response = find_posts(
+            INDEX_NAME, [objId], fields.split(",") if fields else None
+        )[objId]
+    except Exception as e:
+        print(e)
+        return {"error": "Post not found"}, 404
+    response["_source"]["objId"] = response["_id"]
+    return response["_source"]
+
+
+@search.post("/posts")
+def getPosts():
+    req = request.json
+    ids = [str(objId) for objId in req.get("ids", [])]
+    if not ids:
+        return {"posts": {}}
+    try:
+        found = find_posts(INDEX_NAME, ids, req.get("fields") or None)
+    except Exception as e:
+        print(e)
+        return {"error": "Couldn't fetch posts"}
+
+    posts = {}
+    for objId in ids:
+        if objId in found:
+            found[objId]["_source"]["objId"] = objId
+            posts[objId] = found[objId]["_source"]
+        else:
+            posts[objId] = None
+    return {"posts": posts}
+
+
+def source_rank(source):
+    return SOURCE_RANKS.get(source, DEFAULT_SOURCE_RANK)
+
+
+def store_post_image(document):
+    # The photo goes to the image store, the post keeps its hash and the
+    # size to draw its thumbnail at. Raises ValueError for a photo that can't
+    # be stored, so the post is refused instead of silently losing it.
+    if not document.get("post_image_b64"):
+        document.pop("post_image_b64", None)
+        return
+    data = decode_image(document["post_image_b64"])
+    if data is None:
+        raise ValueError("post_image_b64 is not valid base64")
+    if len(data) > IMAGE_MAX_BYTES:
+        raise ValueError(f"Post image is over {IMAGE_MAX_BYTES} bytes")
+    # None for formats the header isn't read for, those are stored unsized
+    content_type = image_type(data)
+    try:
+        document["post_image_hash"] = image_store.put(data)
+    except OSError as e:
+        # Keep the photo in the post rather than lose it
+        print(f"Couldn't store post image: {e}")
+        return
+    del document["post_image_b64"]
+    size = image_size(data, content_type)
+    if size:
+        width, height = thumbnail_size(*size, IMAGE_THUMBNAIL_SIZE)
+        document["post_image_width"] = width
+        document["post_image_height"] = height
+
+
+def build_post_document(data):
+    document = dict(POST_TEMPLATE)
+    for key in data.keys():
+        document[key] = data[key]
+    store_post_image(document)
+    document["source_rank"] = source_rank(document["source"])
+    # When this post reached the cluster, for refreshes that only read new ones
+    document["indexed_at"] = ingest_timestamp()
+    place = gazetteer.lookup(document["location"])
+    if place is not None:
+        document[GEO_FIELD] = {"lat": place.lat, "lon": place.lon}
+        document["geo_place"] = place.name
+        document["geo_state"] = place.state
+    return document
+
+
+def post_document_id(document):
+    # post_id doubles as the ES _id so re-sent posts overwrite instead of duplicating
+    return str(document["post_id"]) if document.get("post_id") else None
+
+
+def iter_bulk_posts():
+    # Accepts a JSON array, {"posts": [...]} or an NDJSON body
+    if request.mimetype in NDJSON_MIMETYPES:
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+    else:
+        data = request.get_json(silent=True) or []
+        if isinstance(data, dict):
+            data = data.get("posts", [])
+        yield from data
+
+
+def flush_bulk_chunk(index, chunk):
+    operations = []
+    for position, document in chunk:
+        action = {"_index": write_index(index, document)}
+        doc_id = post_document_id(document)
+        if doc_id:
+            action["_id"] = doc_id
+        operations.append({"index": action})
+        operations.append(document)
+
+    try:
+        response = es.bulk(operations=operations)
+    except Exception as e:
+        print(e)
+        for _, document in chunk:
+            untrack_incident(post_document_id(document))
+        return [
+            {
+                "position": position,
+                "post_id": document.get("post_id"),
+                "status": "failed",
+                "error": str(e),
             }
+            for position, document in chunk
+        ]
+
+    bump_index_generation()
+    results = []
+    indexed = []
+    for (position, document), item in zip(chunk, response["items"]):
+        outcome = item["index"]
+        result = {"position": position, "post_id": document.get("post_id")}
+        if "error" in outcome:
+            result["status"] = "failed"
+            result["error"] = outcome["error"].get("reason")
+            untrack_incident(post_document_id(document))
+        else:
+            result["status"] = outcome["result"]
+            result["objId"] = outcome["_id"]
+            if outcome["result"] == "created" and document.get("post_id"):
+                seen_filter.add(document["post_id"])
+            enqueue_enrichment(outcome["_index"], outcome["_id"], document)
+            indexed.append((outcome["_id"], document))
+        results.append(result)
+    percolate_posts(indexed)
+    # Only posts that made it in feed the suggestions
+    if indexed:
+        try:
+            es.bulk(
+                operations=suggestion_operations(document for _, document in indexed)
+            )
+        except Exception as e:
+            print(f"Couldn't update suggestions: {e}")
+    return results
+
+
+@search.cli.command("backfill-source-rank")
+def backfillSourceRank():
+    # One-shot: flask --app main search backfill-source-rank
+    if es is None or local_search is not None:
+        print("Elasticsearch not available, nothing to backfill")
+        return
+
+    for index in (INDEX_NAME, ARCHIVE_INDEX_NAME):
+        try:
+            es.indices.put_mapping(
+                index=index, properties={"source_rank": {"type": "long"}}
+            )
+            response = es.update_by_query(
+                index=index,
+                query={"bool": {"must_not": {"exists": {"field": "source_rank"}}}},
+                script={
+                    "source": "ctx._source.source_rank = "
+                    "params.ranks.getOrDefault(ctx._source.source, params.default)",
+                    "lang": "painless",
+                    "params": {"ranks": SOURCE_RANKS, "default": DEFAULT_SOURCE_RANK},
+                },
+                conflicts="proceed",
+                refresh=True,
+                wait_for_completion=True,
+            )
+            print(f"{index}: backfilled source_rank on {response['updated']} posts")
+        except Exception as e:
+            print(f"{index}: backfill failed: {e}")
+
+
+@search.cli.command("enrich-posts")
+def enrichPosts():
+    # One-shot: flask --app main search enrich-posts, for posts from before enrichment
+    if es is None or local_search is not None:
+        print("Elasticsearch not available, nothing to enrich")
+        return
+
+    from elasticsearch.helpers import scan
+
+    hits = scan(
+        es,
+        index=f"{INDEX_NAME},{ARCHIVE_INDEX_NAME}",
+        query={"query": {"bool": {"must_not": {"exists": {"field": "enriched_at"}}}}},
+        ignore_unavailable=True,
+    )
+    operations = []
+    total = 0
+    for fields, (index, doc_id) in enrich_documents(
+        ((hit["_source"], (hit["_index"], hit["_id"])) for hit in hits),
+        ENRICH_BATCH_SIZE,
+        n_process=ENRICH_N_PROCESS,
+    ):
+        operations += enrichment_operations(index, doc_id, fields)
+        total += 1
+        if len(operations) >= 2 * BULK_CHUNK_SIZE:
+            es.bulk(operations=operations)
+            operations = []
+    if operations:
+        es.bulk(operations=operations)
+    print(f"Enriched {total} posts")
+
+
+@search.cli.command("geocode-posts")
+def geocodePosts():
+    # One-shot: flask --app main search geocode-posts, for posts from before geocoding
+    if es is None or local_search is not None:
+        print("Elasticsearch not available, nothing to geocode")
+        return
+
+    from elasticsearch.helpers import scan
+
+    ensure_post_mapping()
+    operations = []
+    placed = 0
+    for hit in scan(
+        es,
+        index=f"{INDEX_NAME},{ARCHIVE_INDEX_NAME}",
+        query={
+            "query": {"bool": {"must_not": {"exists": {"field": GEO_FIELD}}}},
+            "_source": ["location"],
         },
-        "aggs": {
-            "auto_complete": {
-                "terms": {
-                    "field": "post_body.keyword",
-                    "order": {"_count": "desc"},
-                    "size": 25,
+        ignore_unavailable=True,
+    ):
+        place = gazetteer.lookup(hit["_source"].get("location"))
+        if place is None:
+            continue
+        operations.append({"update": {"_index": hit["_index"], "_id": hit["_id"]}})
+        operations.append(
+            {
+                "doc": {
+                    GEO_FIELD: {"lat": place.lat, "lon": place.lon},
+                    "geo_place": place.name,
+                    "geo_state": place.state,
                 }
             }
-        },
-    }
+        )
+        placed += 1
+        if len(operations) >= 2 * BULK_CHUNK_SIZE:
+            es.bulk(operations=operations)
+            operations = []
+    if operations:
+        es.bulk(operations=operations)
+    print(f"Geocoded {placed} posts")
+
+
+@search.cli.command("partition-indices")
+def partitionIndices():
+    # One-shot: flask --app main search partition-indices with ingest stopped,
+    # then set INDEX_PARTITIONS=true. Posts are copied to the partition of
+    # their month, and the old index is only dropped once every post made it.
+    if es is None or local_search is not None:
+        print("Elasticsearch not available, nothing to partition")
+        return
+
+    for base in PARTITIONED_INDICES:
+        if is_partitioned(base):
+            print(f"{base}: already partitioned")
+            continue
+        try:
+            # The old index still has the alias name until it is dropped
+            put_partition_template(base, aliased=False)
+            if es.indices.exists(index=base):
+                response = es.reindex(
+                    source={"index": base},
+                    dest={"index": partition_name(base, datetime.now())},
+                    script={
+                        "source": "def date = ctx._source.date; "
+                        "String month = params.current; "
+                        "if (date instanceof String && date.length() >= 7 "
+                        "&& date.substring(4, 5) == '-') "
+                        "{ month = date.substring(0, 7).replace('-', '.'); } "
+                        "ctx._index = params.base + '-' + month;",
+                        "lang": "painless",
+                        "params": {
+                            "base": base,
+                            "current": datetime.now().strftime("%Y.%m"),
+                        },
+                    },
+                    refresh=True,
+                    wait_for_completion=True,
+                )
+                copied = es.count(index=f"{base}-*")["count"]
+                total = es.count(index=base)["count"]
+                if response.get("failures") or copied < total:
+                    print(f"{base}: only {copied} of {total} posts copied, kept as is")
+                    continue
+                es.indices.delete(index=base)
+            put_partition_template(base)
+            ensure_partitions(base)
+            es.indices.update_aliases(
+                actions=[{"add": {"index": f"{base}-*", "alias": base}}]
+            )
+            print(f"{base}: partitioned by month")
+        except Exception as e:
+            print(f"{base}: partitioning failed: {e}")
+
+
+@search.cli.command("rollover-partitions")
+@click.option(
+    "--keep-months",
+    type=int,
+    default=PARTITION_RETENTION_MONTHS,
+    help="Drop partitions older than this many months, 0 keeps everything.",
+)
+@click.option("--dry-run", is_flag=True, help="Only list what would be dropped.")
+def rolloverPartitions(keep_months, dry_run):
+    # Daily from cron: flask --app main search rollover-partitions. Creates
+    # this and next month's partitions, moves the write alias, and drops whole
+    # partitions past the retention instead of deleting posts one by one.
+    if es is None or local_search is not None:
+        print("Elasticsearch not available, nothing to roll over")
+        return
 
-    print(baseQuery)
-    res = es.search(index=INDEX_NAME, body=baseQuery)
-    return dict(res)
+    today = datetime.now()
+    for base in PARTITIONED_INDICES:
+        if not is_partitioned(base):
+            print(f"{base}: not partitioned, run partition-indices first")
+            continue
+        try:
+            ensure_partitions(base, today)
+            upcoming = partition_name(base, add_months(today, 1))
+            if not es.indices.exists(index=upcoming):
+                es.indices.create(index=upcoming)
+            if keep_months <= 0:
+                continue
+            names = es.indices.get_alias(index=f"{base}-*").keys()
+            expired = expired_partitions(names, base, keep_months, today)
+            if not expired:
+                print(f"{base}: nothing past {keep_months} months")
+            elif dry_run:
+                print(f"{base}: would drop {', '.join(expired)}")
+            else:
+                es.indices.delete(index=",".join(expired))
+                bump_index_generation()
+                print(f"{base}: dropped {', '.join(expired)}")
+        except Exception as e:
+            print(f"{base}: rollover failed: {e}")
+
+
+@search.cli.command("offload-images")
+@click.option("--batch-size", type=int, default=100, help="Posts per bulk update.")
+def offloadImages(batch_size):
+    # One-shot: flask --app main search offload-images. Moves post_image_b64
+    # out of posts indexed before the image store into it.
+    if es is None or local_search is not None:
+        print("Elasticsearch not available, nothing to offload")
+        return
+    from elasticsearch.helpers import scan
+
+    operations = []
+    moved = 0
+    for hit in scan(
+        es,
+        index=f"{INDEX_NAME},{ARCHIVE_INDEX_NAME}",
+        query={"query": {"exists": {"field": "post_image_b64"}}},
+        ignore_unavailable=True,
+    ):
+        document = {"post_image_b64": hit["_source"].get("post_image_b64")}
+        try:
+            store_post_image(document)
+        except ValueError as e:
+            print(f"Keeping the image in post {hit['_id']}: {e}")
+            continue
+        if "post_image_b64" in document:
+            continue
+        operations.append({"update": {"_index": hit["_index"], "_id": hit["_id"]}})
+        operations.append(
+            {
+                "script": {
+                    "source": "ctx._source.remove('post_image_b64'); "
+                    "ctx._source.putAll(params.fields)",
+                    "lang": "painless",
+                    "params": {"fields": document},
+                }
+            }
+        )
+        moved += 1
+        if len(operations) >= 2 * batch_size:
+            es.bulk(operations=operations)
+            operations = []
+    if operations:
+        es.bulk(operations=operations)
+    if moved:
+        bump_index_generation()
+    print(f"Moved {moved} post images to {image_store.root}")
+
+
+@search.get("/image/<digest>")
+def getImage(digest):
+    path = image_store.find(digest)
+    if path is None:
+        return {"error": "Image not found"}, 404
+    with open(path, "rb") as blob:
+        mimetype = image_type(blob.read(16)) or "application/octet-stream"
+    # conditional=True answers If-None-Match with 304 and Range with 206
+    response = send_file(
+        path, mimetype=mimetype, etag=digest, conditional=True, max_age=IMAGE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
-@search.post("/add-post")
-def addPost():
+@search.get("/images/stats")
+def imageStats():
+    return image_store.stats()
+
+
+@search.get("/nlp")
+def nlpStats():
+    if nlp_client is None:
+        return {"mode": "local"}
     try:
-        template = {
-            "post_id": "",
-            "post_title": "",
-            "post_body": "",
-            "post_body_full": "",
-            "date": None,
-            "likes": 0,
-            "retweets": 0,
-            "post_image_url": "",
-            "post_image_b64": "",
-            "location": "",
-            "url": "",
-            "disaster_type": "",
-            "source": "",
-            "createdAt": "",
-        }
+        return {"mode": "service", **nlp_client.stats()}
+    except Exception as e:
+        print(e)
+        return {"error": "NLP service not available"}
+
 
-        data = request.json
-        for key in data.keys():
-            template[key] = data[key]
+@search.get("/enrichment")
+def enrichmentStats():
+    if enrichment is None:
+        return {"running": False}
+    return enrichment.stats()
 
+
+@search.post("/add-post")
+def addPost():
+    try:
+        try:
+            template = build_post_document(request.json)
+        except ValueError as e:
+            return {"error": str(e)}
+        assign_dup_group(template)
+        assign_incident(template)
         print(template)
 
-        es.index(index="archived_posts", document=dict(template))
+        try:
+            response = es.index(
+                index=write_index(ARCHIVE_INDEX_NAME, template),
+                id=post_document_id(template),
+                document=template,
+            )
+        except Exception:
+            untrack_incident(post_document_id(template))
+            raise
+        bump_index_generation()
+        # A re-sent post is an update and is already counted
+        if template["post_id"] and response["result"] == "created":
+            seen_filter.add(template["post_id"])
+        enqueue_enrichment(response["_index"], response["_id"], template)
+        percolate_posts([(response["_id"], template)])
+        try:
+            es.bulk(operations=suggestion_operations([template]))
+        except Exception as e:
+            print(f"Couldn't update suggestions: {e}")
         return {"onload": "Successful"}
     except Exception as e:
         print(e)
         return {"error": "something went wrong"}
 
 
+@search.post("/bulk-add-post")
+def bulkAddPost():
+    if es is None:
+        return {"error": "Elasticsearch not available (demo mode)"}
+
+    chunk_size = max(request.args.get("chunk_size", BULK_CHUNK_SIZE, type=int), 1)
+    flush_interval = request.args.get(
+        "flush_interval", BULK_FLUSH_INTERVAL, type=float
+    )
+
+    # The body is read on its own thread, so a partial chunk is flushed after
+    # flush_interval even while a slow NDJSON stream has nothing new to give
+    posts = queue.Queue(chunk_size)
+    finished = object()
+
+    @copy_current_request_context
+    def read_posts():
+        try:
+            for post in iter_bulk_posts():
+                posts.put(post)
+        except Exception as e:
+            print(f"Couldn't read the bulk body: {e}")
+        finally:
+            posts.put(finished)
+
+    threading.Thread(target=read_posts, daemon=True).start()
+
+    results = []
+    chunk = []
+    chunk_started = None
+    position = -1
+    while True:
+        timeout = None
+        if chunk:
+            timeout = max(chunk_started + flush_interval - time.monotonic(), 0)
+        try:
+            post = posts.get(timeout=timeout)
+        except queue.Empty:
+            results += flush_bulk_chunk(ARCHIVE_INDEX_NAME, chunk)
+            chunk = []
+            continue
+        if post is finished:
+            break
+        position += 1
+
+        if not isinstance(post, dict):
+            results.append(
+                {
+                    "position": position,
+                    "post_id": None,
+                    "status": "failed",
+                    "error": "Post is not a JSON object",
+                }
+            )
+            continue
+
+        try:
+            document = build_post_document(post)
+        except ValueError as e:
+            results.append(
+                {
+                    "position": position,
+                    "post_id": post.get("post_id"),
+                    "status": "failed",
+                    "error": str(e),
+                }
+            )
+            continue
+        assign_dup_group(document)
+        assign_incident(document)
+        if not chunk:
+            chunk_started = time.monotonic()
+        chunk.append((position, document))
+        if len(chunk) >= chunk_size:
+            results += flush_bulk_chunk(ARCHIVE_INDEX_NAME, chunk)
+            chunk = []
+
+    if chunk:
+        results += flush_bulk_chunk(ARCHIVE_INDEX_NAME, chunk)
+
+    results.sort(key=lambda result: result["position"])
+    summary = {"created": 0, "updated": 0, "failed": 0}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+
+    return {**summary, "items": results}
+
+
+def forget_post(index, objId):
+    if not seen_filter.ready:
+        return
+    try:
+        document = find_posts(index, [objId], ["post_id"]).get(objId)
+        post_id = document and document["_source"].get("post_id")
+        if post_id:
+            seen_filter.remove(post_id)
+    except Exception as e:
+        print(e)
+
+
 @search.post("/remove-post")
 def removePost():
     try:
         objId = request.form.get("objId", "")
         if objId:
-            response = es.delete(index=INDEX_NAME, id=objId)
+            forget_post(INDEX_NAME, objId)
+            response = es.delete(index=post_index(INDEX_NAME, objId), id=objId)
+            bump_index_generation()
+            untrack_incident(objId)
             print(response)
         else:
             response = {"error": "No objId in form"}
@@ -536,22 +2123,293 @@ def removePost():
         return {"error": "Something went wrong"}
 
 
+def moderation_operations(hits, verdict, moderator):
+    # Verified and archived posts are copied to the archive and deleted from
+    # the unverified index, rejected ones are only deleted. Returns the bulk
+    # operations and, per post, the kinds of its operations in order.
+    operations = []
+    layout = []
+    fields = {
+        "verdict": MODERATION_VERDICTS[verdict],
+        "moderated_at": datetime.now().isoformat(timespec="seconds"),
+        "moderator": moderator,
+    }
+    for hit in hits:
+        kinds = []
+        if verdict != "reject" and local_search is not None:
+            # Both names share one store here, the verdict alone takes the
+            # post out of the unverified index
+            operations.append({"update": {"_index": hit["_index"], "_id": hit["_id"]}})
+            operations.append({"doc": fields})
+            kinds.append("update")
+        else:
+            if verdict != "reject":
+                document = {**hit["_source"], **fields}
+                operations.append(
+                    {
+                        "index": {
+                            "_index": write_index(ARCHIVE_INDEX_NAME, document),
+                            "_id": hit["_id"],
+                        }
+                    }
+                )
+                operations.append(document)
+                kinds.append("index")
+            operations.append({"delete": {"_index": hit["_index"], "_id": hit["_id"]}})
+            kinds.append("delete")
+        layout.append((hit, kinds))
+    return operations, layout
+
+
+def moderate_chunk(ids, verdict, moderator):
+    # One lookup and one bulk request for the whole chunk
+    try:
+        found = find_posts(INDEX_NAME, ids)
+        hits = [found[objId] for objId in ids if objId in found]
+        operations, layout = moderation_operations(hits, verdict, moderator)
+        response = es.bulk(operations=operations) if operations else {"items": []}
+    except Exception as e:
+        print(e)
+        return [{"objId": objId, "status": "failed", "error": str(e)} for objId in ids]
+    bump_index_generation()
+
+    results = {
+        objId: {"objId": objId, "status": "not_found"}
+        for objId in ids
+        if objId not in found
+    }
+    items = iter(response["items"])
+    restore = []
+    for hit, kinds in layout:
+        outcomes = {kind: next(items)[kind] for kind in kinds}
+        errors = [
+            outcome["error"].get("reason")
+            for outcome in outcomes.values()
+            if "error" in outcome
+        ]
+        result = {"objId": hit["_id"], "post_id": hit["_source"].get("post_id")}
+        if not errors:
+            result["status"] = MODERATION_VERDICTS[verdict]
+            if verdict == "reject" and seen_filter.ready:
+                post_id = hit["_source"].get("post_id")
+                if post_id:
+                    seen_filter.remove(post_id)
+            # Verified posts still count towards their incident
+            if verdict != "verify":
+                untrack_incident(hit["_id"])
+        else:
+            result["status"] = "failed"
+            result["error"] = errors[0]
+            # The copy failed but the original is gone, so it is put back
+            copy_failed = "error" in outcomes.get("index", {})
+            deleted = "delete" in outcomes and "error" not in outcomes["delete"]
+            if copy_failed and deleted:
+                restore.append({"index": {"_index": hit["_index"], "_id": hit["_id"]}})
+                restore.append(hit["_source"])
+        results[hit["_id"]] = result
+
+    if restore:
+        try:
+            es.bulk(operations=restore)
+        except Exception as e:
+            print(f"Couldn't restore posts after a failed move: {e}")
+    return [results[objId] for objId in ids]
+
+
+@search.post("/moderate")
+def moderatePosts():
+    # {"ids": [objId, ...], "verdict": "verify" | "archive" | "reject",
+    #  "moderator": optional}, moves thousands of posts in a few requests
+    if es is None:
+        return {"error": "Elasticsearch not available (demo mode)"}
+    if local_search is None and searching_locally():
+        # The stand-in can't move posts between the indices the way ES does
+        return {"error": "Elasticsearch not available, try again later"}
+
+    req = request.get_json(silent=True) or {}
+    verdict = req.get("verdict")
+    if verdict not in MODERATION_VERDICTS:
+        return {"error": f"verdict must be one of {', '.join(MODERATION_VERDICTS)}"}
+    ids = list(dict.fromkeys(str(objId) for objId in req.get("ids") or []))
+    if len(ids) > MODERATE_MAX_POSTS:
+        return {"error": f"At most {MODERATE_MAX_POSTS} posts per request"}
+
+    results = []
+    for start in range(0, len(ids), BULK_CHUNK_SIZE):
+        results += moderate_chunk(
+            ids[start : start + BULK_CHUNK_SIZE], verdict, req.get("moderator")
+        )
+    summary = {MODERATION_VERDICTS[verdict]: 0, "not_found": 0, "failed": 0}
+    for result in results:
+        summary[result["status"]] += 1
+    return {**summary, "items": results}
+
+
 @search.get("/get-unverified-count")
-def unverifiedCount():
+async def unverifiedCount():
+    # Both counts go out together on the shared async client
     try:
-        print(es.count(index=INDEX_NAME).get("count"))
-        return {"count": es.count(index=INDEX_NAME).get("count")}
+        unverified, archived = await async_search.gather(
+            ("count", {"index": INDEX_NAME}),
+            ("count", {"index": ARCHIVE_INDEX_NAME, "ignore_unavailable": True}),
+        )
+        print(unverified["count"])
+        return {"count": unverified["count"], "archived": archived["count"]}
     except Exception as e:
         print(e)
         return {"error": "Couldn't get count"}
 
 
+def stats_aggregations(interval, days, size):
+    # Start of the histogram window, as a whole interval
+    start = datetime.now().replace(minute=0, second=0, microsecond=0)
+    if interval != "hour":
+        start = start.replace(hour=0)
+    start -= timedelta(days=days)
+
+    aggs = {
+        # One bucket per monthly partition when partitioned
+        "by_index": {"terms": {"field": "_index", "size": 1000}},
+        "timeline": {
+            "filter": {"range": {"date": {"gte": start}}},
+            "aggs": {
+                "buckets": {
+                    "date_histogram": {
+                        "field": "date",
+                        "calendar_interval": interval,
+                        "min_doc_count": 0,
+                        "extended_bounds": {"min": start, "max": datetime.now()},
+                    }
+                }
+            },
+        },
+    }
+    for field in STATS_FIELDS:
+        aggs[field] = {"terms": {"field": f"{field}.keyword", "size": size}}
+    return aggs
+
+
+@search.get("/stats")
+def searchStats():
+    if es is None:
+        return {"error": "Elasticsearch not available (demo mode)"}
+
+    interval = request.args.get("interval", "day")
+    if interval not in STATS_INTERVALS:
+        interval = "day"
+    days = min(max(request.args.get("days", 30, type=int), 1), 366)
+    size = min(max(request.args.get("size", STATS_TERMS_SIZE, type=int), 1), 100)
+
+    cache_key = (interval, days, size)
+    cached = stats_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Counts, breakdowns and the timeline all come from one size=0 search
+    try:
+        response = es.search(
+            index=f"{INDEX_NAME},{ARCHIVE_INDEX_NAME}",
+            size=0,
+            track_total_hits=True,
+            aggs=stats_aggregations(interval, days, size),
+            ignore_unavailable=True,
+        )
+    except Exception as e:
+        print(e)
+        return {"error": "Couldn't get stats"}
+
+    aggregations = response["aggregations"]
+    by_index = Counter()
+    for bucket in aggregations["by_index"]["buckets"]:
+        by_index[partition_base(bucket["key"])] += bucket["doc_count"]
+    stats = {
+        "counts": {
+            "total": response["hits"]["total"]["value"],
+            "unverified": by_index.get(INDEX_NAME, 0),
+            "archived": by_index.get(ARCHIVE_INDEX_NAME, 0),
+        },
+        "timeline": {
+            "interval": interval,
+            "buckets": [
+                {"date": bucket["key_as_string"], "count": bucket["doc_count"]}
+                for bucket in aggregations["timeline"]["buckets"]["buckets"]
+            ],
+        },
+    }
+    for field in STATS_FIELDS:
+        stats[field] = [
+            {"key": bucket["key"], "count": bucket["doc_count"]}
+            for bucket in aggregations[field]["buckets"]
+        ]
+
+    stats_cache.set(cache_key, stats)
+    return stats
+
+
+@search.get("/geo-grid")
+def geoGrid():
+    # Post counts per geohash cell, for the map views
+    if es is None:
+        return {"error": "Elasticsearch not available (demo mode)"}
+
+    precision = min(
+        max(request.args.get("precision", GEO_GRID_PRECISION, type=int), 1), 8
+    )
+    size = min(max(request.args.get("size", GEO_GRID_SIZE, type=int), 1), 10_000)
+    filters = [{"exists": {"field": GEO_FIELD}}]
+    days = request.args.get("days", type=int)
+    if days:
+        filters.append(
+            {"range": {"date": {"gte": datetime.now() - timedelta(days=days)}}}
+        )
+    if request.args.get("disaster_type"):
+        filters.append({"match": {"disaster_type": request.args["disaster_type"]}})
+    geo_filters = extract_geo_filters(request.args)
+    if geo_filters["bbox"]:
+        filters.append({"geo_bounding_box": {GEO_FIELD: geo_filters["bbox"]}})
+
+    try:
+        response = es.search(
+            index=f"{INDEX_NAME},{ARCHIVE_INDEX_NAME}",
+            size=0,
+            query={"bool": {"filter": filters}},
+            aggs={
+                "cells": {
+                    "geohash_grid": {
+                        "field": GEO_FIELD,
+                        "precision": precision,
+                        "size": size,
+                    },
+                    "aggs": {"centroid": {"geo_centroid": {"field": GEO_FIELD}}},
+                }
+            },
+            ignore_unavailable=True,
+        )
+    except Exception as e:
+        print(e)
+        return {"error": "Couldn't get geo grid"}
+
+    return {
+        "precision": precision,
+        "cells": [
+            {
+                "geohash": bucket["key"],
+                "count": bucket["doc_count"],
+                **bucket["centroid"]["location"],
+            }
+            for bucket in response["aggregations"]["cells"]["buckets"]
+        ],
+    }
+
+
 @search.post("/find-by-id")
 def findByID():
     req = request.json
     print(req)
     received_id = req["id"]
     print(received_id)
+    if seen_filter.ready and received_id not in seen_filter:
+        return {"count": 0}
     try:
         response = es.count(index=INDEX_NAME, query={"match": {"post_id": received_id}})
         print(response["count"])
@@ -559,3 +2417,199 @@ def findByID():
     except Exception as e:
         print(e)
         return {"error": "Couldn't get count"}
+
+
+@search.post("/find-by-ids")
+def findByIDs():
+    received_ids = [str(post_id) for post_id in request.json.get("ids", [])]
+
+    counts = {}
+    candidates = []
+    for post_id in received_ids:
+        if seen_filter.ready and post_id not in seen_filter:
+            counts[post_id] = 0
+        else:
+            candidates.append(post_id)
+    filtered = len(counts)
+
+    if candidates:
+        try:
+            response = es.search(
+                index=INDEX_NAME,
+                size=0,
+                query={"terms": {"post_id.keyword": candidates}},
+                aggs={
+                    "by_id": {
+                        "terms": {"field": "post_id.keyword", "size": len(candidates)}
+                    }
+                },
+            )
+        except Exception as e:
+            print(e)
+            return {"error": "Couldn't get counts"}
+        found = {
+            bucket["key"]: bucket["doc_count"]
+            for bucket in response["aggregations"]["by_id"]["buckets"]
+        }
+        for post_id in candidates:
+            counts[post_id] = found.get(post_id, 0)
+
+    return {"counts": counts, "filtered": filtered, "checked": len(candidates)}
+
+
+@search.get("/async")
+def asyncStats():
+    if async_search is None:
+        return {"error": "Elasticsearch not available (demo mode)"}
+    return async_search.stats()
+
+
+@search.get("/cluster")
+def clusterStats():
+    # Health and connection pool use of the synchronous client
+    if es is None or local_search is not None:
+        return {"error": "Elasticsearch not available"}
+    return es.stats()
+
+
+@search.get("/incidents")
+def getIncidents():
+    if incidents is None:
+        return {"error": "Incident clustering is disabled"}
+
+    hours = request.args.get("hours", type=float)
+    since = datetime.now() - timedelta(hours=hours) if hours else None
+    size = min(max(request.args.get("size", 20, type=int), 1), 100)
+    total, found = incidents.ranked(
+        since=since,
+        min_posts=request.args.get("min_posts", 1, type=int),
+        category=request.args.get("category"),
+        size=size,
+    )
+    return {"total": total, "incidents": found}
+
+
+@search.get("/incidents/stats")
+def incidentStats():
+    if incidents is None:
+        return {"enabled": False}
+    return {"enabled": True, **incidents.stats()}
+
+
+def saved_query_events(query_ids):
+    subscriber = saved_queries.subscribe(query_ids)
+    try:
+        yield ": subscribed\n\n"
+        while True:
+            try:
+                match = subscriber.get(timeout=SSE_KEEPALIVE)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: match\ndata: {json.dumps(match)}\n\n"
+    finally:
+        # Runs when the client disconnects and the next write fails
+        saved_queries.unsubscribe(subscriber, query_ids)
+
+
+@search.post("/add-saved-query")
+def addSavedQuery():
+    try:
+        entities = extract_entities(request.form)
+        # Only new posts are matched, so a date range like "this week" would
+        # just go stale
+        entities["date"] = None
+        es_query = build_es_query(entities)["query"]
+        parameters = format_entities(entities)
+        query_id = uuid.uuid4().hex
+        if local_search is None:
+            # Stored and searchable first, so a reload can't drop it again
+            es.index(
+                index=SAVED_QUERY_INDEX_NAME,
+                id=query_id,
+                document={
+                    "query": es_query,
+                    "parameters": parameters,
+                    "created_at": datetime.now().isoformat(timespec="seconds"),
+                },
+                refresh="wait_for",
+            )
+        saved_queries.add(es_query, parameters, query_id)
+        return {"id": query_id, "parameters": parameters}
+    except Exception as e:
+        print(e)
+        return {"error": "Couldn't save the query"}
+
+
+@search.post("/remove-saved-query")
+def removeSavedQuery():
+    query_id = request.form.get("id", "")
+    if local_search is None:
+        # It may have been saved through another worker
+        try:
+            es.delete(index=SAVED_QUERY_INDEX_NAME, id=query_id, refresh="wait_for")
+            saved_queries.remove(query_id)
+            return {"success": True}
+        except Exception as e:
+            print(e)
+    if not saved_queries.remove(query_id):
+        return {"error": "No saved query with that id"}
+    return {"success": True}
+
+
+@search.get("/saved-queries")
+def getSavedQueries():
+    return {"queries": saved_queries.list()}
+
+
+@search.get("/saved-queries/stream")
+def streamSavedQueries():
+    # ?ids=a,b so one dashboard follows all of its widgets on one connection
+    query_ids = [
+        query_id for query_id in request.args.get("ids", "").split(",") if query_id
+    ]
+    unknown = [query_id for query_id in query_ids if query_id not in saved_queries]
+    if unknown and local_search is None:
+        # Saved through another worker since the last reload
+        try:
+            reload_saved_queries()
+        except Exception as e:
+            print(e)
+        unknown = [query_id for query_id in unknown if query_id not in saved_queries]
+    if not query_ids or unknown:
+        return {"error": "Unknown saved query ids", "ids": unknown}
+    return Response(
+        saved_query_events(query_ids),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@search.get("/saved-queries/stats")
+def savedQueryStats():
+    return saved_queries.stats()
+
+
+@search.get("/dedup")
+def dedupStats():
+    if duplicate_index is None:
+        return {"enabled": False}
+    return {"enabled": True, **duplicate_index.stats()}
+
+
+@search.get("/seen-filter")
+def seenFilterStats():
+    return seen_filter.stats()
+
+
+@search.get("/cache")
+def searchCacheStats():
+    return {
+        "search": {
+            **search_cache.stats(),
+            "generation": index_generation,
+            "cluster_generation": cluster_generation,
+        },
+        "parse": parse_cache.stats(),
+        "stats": stats_cache.stats(),
+    }
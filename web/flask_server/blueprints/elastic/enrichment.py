@@ -0,0 +1,219 @@
+from blueprints.elastic.analysis import nlp, nlp_client, analyze_doc, analyze_texts
+from collections import deque
+from datetime import datetime
+import itertools
+import queue
+import threading
+import time
+
+# Post fields read by the enrichment, in the order they are joined
+ENRICHMENT_TEXT_FIELDS = ("post_title", "post_body", "location", "disaster_type")
+
+
+def enrichment_text(document):
+    # Original case, the entity recognizer relies on it to find places
+    return ". ".join(
+        str(document.get(field)).strip()
+        for field in ENRICHMENT_TEXT_FIELDS
+        if document.get(field)
+    )
+
+
+def enrichment_fields(analyzed, document):
+    locations = []
+    for location in analyzed["locations"]:
+        # Lowercased like the terms searched for
+        location = " ".join(location.lower().split())
+        if location not in locations:
+            locations.append(location)
+
+    fields = {
+        "disaster_category": (
+            analyzed["categories"][0] if analyzed["categories"] else None
+        ),
+        "disaster_categories": analyzed["categories"],
+        "disaster_keywords": analyzed["disasters"],
+        "gpe_locations": locations,
+        "lemmas": " ".join(lemma for lemma in analyzed["lemmas"] if lemma.isalnum()),
+        "enriched_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    # A priority sent with the post is kept, the keywords only fill the gap
+    if not document.get("priority") and analyzed["priority"]:
+        fields["priority"] = analyzed["priority"]
+    return fields
+
+
+def enrich_documents(items, batch_size, n_process=1):
+    # (document, context) pairs in, (fields, context) pairs out, in order
+    if nlp_client is not None:
+        # The service batches on its side, n_process is up to it
+        items = iter(items)
+        while True:
+            chunk = list(itertools.islice(items, batch_size))
+            if not chunk:
+                return
+            texts = [enrichment_text(document) for document, _ in chunk]
+            for analyzed, (document, context) in zip(analyze_texts(texts), chunk):
+                yield enrichment_fields(analyzed, document), context
+
+    texts = (
+        (enrichment_text(document), (document, context)) for document, context in items
+    )
+    for doc, (document, context) in nlp.pipe(
+        texts, as_tuples=True, batch_size=batch_size, n_process=n_process
+    ):
+        yield enrichment_fields(analyze_doc(doc), document), context
+
+
+def enrichment_operations(index, doc_id, fields):
+    return [{"update": {"_index": index, "_id": doc_id}}, {"doc": fields}]
+
+
+class EnrichmentWorker:
+    """Background thread that annotates ingested posts with NLP fields.
+
+    Posts are queued at ingest and drained in batches of up to `batch_size`,
+    waiting at most `max_wait` seconds for a batch to fill, so a quiet feed
+    is still enriched promptly. Each batch is one nlp.pipe call and one bulk
+    update, after which `on_write` is called. A full queue drops the post
+    rather than blocking ingest. Posts of a failed batch, or that the bulk
+    update rejected as overloaded, are queued again up to `max_attempts`
+    times, after a `retry_delay` pause.
+    """
+
+    def __init__(
+        self,
+        es_client,
+        batch_size,
+        max_wait,
+        max_queue,
+        on_write=None,
+        max_attempts=3,
+        retry_delay=1.0,
+    ):
+        self.es = es_client
+        self.on_write = on_write
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue(max_queue)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.enriched = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.latencies = deque(maxlen=100)
+
+    def submit(self, index, doc_id, document):
+        if not doc_id:
+            return False
+        self.start()
+        try:
+            self.queue.put_nowait((index, doc_id, document, 1))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.started_at = time.time()
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            start = time.perf_counter()
+            try:
+                retry = self.process(batch)
+            except Exception as e:
+                print(f"Enrichment batch failed: {e}")
+                retry = batch
+            if retry:
+                self.requeue(retry)
+            elapsed = time.perf_counter() - start
+            self.batches += 1
+            self.busy_seconds += elapsed
+            self.latencies.append(elapsed)
+
+    def process(self, batch):
+        # Returns the posts worth another try
+        operations = []
+        for fields, (index, doc_id) in enrich_documents(
+            ((document, (index, doc_id)) for index, doc_id, document, _ in batch),
+            self.batch_size,
+        ):
+            operations += enrichment_operations(index, doc_id, fields)
+
+        response = self.es.bulk(operations=operations)
+        if self.on_write is not None:
+            self.on_write()
+        retry = []
+        for entry, item in zip(batch, response["items"]):
+            outcome = item["update"]
+            if "error" not in outcome:
+                self.enriched += 1
+            elif outcome.get("status") == 429 or outcome.get("status", 0) >= 500:
+                retry.append(entry)
+            else:
+                # Usually the post was removed before it got enriched
+                self.failed += 1
+        return retry
+
+    def requeue(self, entries):
+        time.sleep(self.retry_delay)
+        for index, doc_id, document, attempts in entries:
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                continue
+            try:
+                self.queue.put_nowait((index, doc_id, document, attempts + 1))
+                self.retried += 1
+            except queue.Full:
+                self.dropped += 1
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        uptime = time.time() - self.started_at if self.started_at else 0.0
+        return {
+            "running": self.thread is not None,
+            "queue_depth": self.queue.qsize(),
+            "max_queue": self.queue.maxsize,
+            "batch_size": self.batch_size,
+            "max_wait": self.max_wait,
+            "enriched": self.enriched,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "retried": self.retried,
+            "batches": self.batches,
+            "batch_latency_ms": {
+                "last": self.latencies[-1] * 1000 if self.latencies else None,
+                "median": latencies[len(latencies) // 2] * 1000 if latencies else None,
+                "max": latencies[-1] * 1000 if latencies else None,
+            },
+            # Posts per second while working, and averaged since the first post
+            "throughput": (
+                self.enriched / self.busy_seconds if self.busy_seconds else 0.0
+            ),
+            "average_rate": self.enriched / uptime if uptime else 0.0,
+        }
@@ -0,0 +1,113 @@
+from blueprints.elastic.cache import TTLCache
+from collections import namedtuple
+import bisect
+import csv
+import os
+import re
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "data", "india_places.csv")
+GEOCODE_CACHE_SIZE = int(os.environ.get("GEOCODE_CACHE_SIZE", 4096))
+
+# Most specific first, "Kurla, Mumbai" is placed at Kurla
+PLACE_KINDS = ("locality", "city", "district", "state")
+
+TOKEN_PATTERN = re.compile(r"\w+|&")
+
+Place = namedtuple("Place", ["name", "state", "kind", "lat", "lon"])
+
+
+def normalize_place(text):
+    return " ".join(TOKEN_PATTERN.findall(str(text or "").lower()))
+
+
+class Gazetteer:
+    """Offline place lookup over a bundled CSV of Indian places.
+
+    Every name and alias is one entry of a sorted array. Free text is
+    scanned word by word, and at each word the longest place name starting
+    there is found by bisecting on growing prefixes, stopping as soon as no
+    name starts with the words read so far. Of the places found, the most
+    specific one wins, preferring places inside a state the text names, so
+    "Bilaspur, Himachal Pradesh" is not placed in Chhattisgarh.
+    """
+
+    def __init__(self, path=GAZETTEER_PATH, cache_size=GEOCODE_CACHE_SIZE):
+        self.places = []
+        entries = []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                self.places.append(
+                    Place(
+                        row["name"],
+                        row["state"],
+                        row["kind"],
+                        float(row["lat"]),
+                        float(row["lon"]),
+                    )
+                )
+                aliases = [row["name"]] + row["aliases"].split("|")
+                for alias in aliases:
+                    if alias:
+                        entries.append((normalize_place(alias), len(self.places) - 1))
+        entries.sort()
+        self.names = [name for name, _ in entries]
+        self.place_ids = [place_id for _, place_id in entries]
+        self.cache = TTLCache(cache_size, 24 * 60 * 60)
+
+    def __len__(self):
+        return len(self.places)
+
+    def longest_match(self, words, start):
+        # (end, [place]) of the longest name at words[start], or None
+        match = None
+        for end in range(start + 1, len(words) + 1):
+            phrase = " ".join(words[start:end])
+            position = bisect.bisect_left(self.names, phrase)
+            if position == len(self.names) or not self.names[position].startswith(
+                phrase
+            ):
+                break
+            if self.names[position] == phrase:
+                last = bisect.bisect_right(self.names, phrase)
+                match = (
+                    end,
+                    [
+                        self.places[place_id]
+                        for place_id in self.place_ids[position:last]
+                    ],
+                )
+        return match
+
+    def matches(self, text):
+        words = normalize_place(text).split(" ")
+        found = []
+        start = 0
+        while start < len(words):
+            match = self.longest_match(words, start)
+            if match is None:
+                start += 1
+            else:
+                start, places = match
+                found += places
+        return found
+
+    def lookup(self, text):
+        key = normalize_place(text)
+        if not key:
+            return None
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached[0]
+
+        found = self.matches(key)
+        states = {place.state for place in found if place.kind == "state"}
+        place = min(
+            found,
+            key=lambda place: (
+                bool(states) and place.state not in states,
+                PLACE_KINDS.index(place.kind),
+            ),
+            default=None,
+        )
+        self.cache.set(key, (place,))
+        return place
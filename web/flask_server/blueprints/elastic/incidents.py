@@ -0,0 +1,383 @@
+from blueprints.elastic.analysis import keyword_categories, PRIORITY_LEVELS
+from blueprints.elastic.localSearch import parse_date_value
+from spacy.lang.en.stop_words import STOP_WORDS
+from collections import Counter
+from datetime import datetime
+import numpy as np
+import threading
+import uuid
+import math
+import zlib
+import re
+
+# Post fields whose words make up the incident text vectors
+INCIDENT_TEXT_FIELDS = ("post_title", "post_body")
+# Every post field the clustering reads
+INCIDENT_FIELDS = INCIDENT_TEXT_FIELDS + (
+    "post_id",
+    "date",
+    "location",
+    "disaster_type",
+    "source",
+    "priority",
+    "url",
+    "incident_id",
+)
+# Posts kept per incident to show what it is about
+INCIDENT_REPRESENTATIVES = 3
+INCIDENT_MAX_POST_IDS = 200
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Longest first, so "forest fire" wins over "fire"
+DISASTER_PATTERN = re.compile(
+    r"\b("
+    + "|".join(
+        re.escape(keyword)
+        for keyword in sorted(keyword_categories, key=len, reverse=True)
+    )
+    + ")"
+)
+CARD_FIELDS = ("post_id", "post_title", "source", "date", "location", "url")
+
+
+def incident_category(document):
+    # Broad category of the disaster_type, e.g. "cyclone" and "flood" are both
+    # natural disasters. Types without a known keyword are their own category.
+    disaster_type = " ".join(str(document.get("disaster_type") or "").lower().split())
+    match = DISASTER_PATTERN.search(disaster_type)
+    if match:
+        return keyword_categories[match.group(1)][0]
+    return disaster_type or None
+
+
+def location_tokens(text):
+    return frozenset(TOKEN_PATTERN.findall(str(text or "").lower()))
+
+
+def post_card(doc_id, document):
+    card = {field: document.get(field) for field in CARD_FIELDS}
+    card["objId"] = doc_id
+    return card
+
+
+class IncidentIndex:
+    """Online clustering of posts into incidents.
+
+    A post can only join an incident of the same disaster category, whose
+    locations share a word with its own and that saw a post within
+    `window_hours` of it. Among those, it joins the one whose centroid is
+    most similar to its hashed term-frequency vector, if the cosine reaches
+    `threshold`, otherwise it starts a new incident. Centroids are rows of
+    one float32 array, updated as running means, so nothing is reclustered.
+    Past `max_incidents` the least recently active incident is dropped.
+    Members are keyed by doc_id: a post added again replaces its earlier
+    copy, and `remove` takes a deleted post back out of its incident. A post
+    added with an `incident_id`, e.g. one another process assigned, joins
+    that incident instead. `rebuild` swaps in a fresh copy built from such
+    posts, keeping what was added or removed meanwhile.
+    """
+
+    def __init__(self, dimensions, threshold, window_hours, max_incidents):
+        self.dimensions = dimensions
+        self.threshold = threshold
+        self.window = window_hours * 3600
+        self.max_incidents = max_incidents
+        capacity = min(64, max_incidents)
+        self.centroids = np.zeros((capacity, dimensions), dtype=np.float32)
+        self.sizes = np.zeros(capacity, dtype=np.int32)
+        self.first_seen = np.zeros(capacity, dtype=np.float64)
+        self.last_seen = np.zeros(capacity, dtype=np.float64)
+        self.incidents = [None] * capacity
+        self.by_category = {}
+        self.by_id = {}
+        self.free = list(range(capacity - 1, -1, -1))
+        # doc_id -> what the post added to its incident, to take it back out
+        self.members = {}
+        # Changes made while a rebuild runs, None when none is running
+        self.pending = None
+        self.lock = threading.Lock()
+        self.posts = 0
+        self.created = 0
+        self.evicted = 0
+
+    def vector(self, document):
+        text = " ".join(
+            str(document.get(field) or "") for field in INCIDENT_TEXT_FIELDS
+        )
+        counts = Counter(
+            zlib.crc32(token.encode("utf-8")) % self.dimensions
+            for token in TOKEN_PATTERN.findall(text.lower())
+            if token not in STOP_WORDS
+        )
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for position, count in counts.items():
+            vector[position] = 1 + math.log(count)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def add(self, document, doc_id=None, incident_id=None):
+        # Returns the id of the incident the post joined
+        vector = self.vector(document)
+        if vector is None:
+            return None
+        category = incident_category(document)
+        locations = location_tokens(document.get("location"))
+        seen = (parse_date_value(document.get("date")) or datetime.now()).timestamp()
+
+        with self.lock:
+            if doc_id is not None and doc_id in self.members:
+                self.discard(doc_id)
+            else:
+                self.posts += 1
+            slots = np.fromiter(self.by_category.get(category, ()), dtype=np.int64)
+            slots = slots[
+                (self.first_seen[slots] - self.window <= seen)
+                & (seen <= self.last_seen[slots] + self.window)
+            ]
+            slots = [
+                slot
+                for slot in slots
+                if not locations
+                or not self.incidents[slot]["location_tokens"]
+                or not locations.isdisjoint(self.incidents[slot]["location_tokens"])
+            ]
+            slot = self.by_id.get(incident_id)
+            if slot is None and incident_id is not None:
+                slot = self.new_incident(category, seen, incident_id)
+            if slot is None and slots:
+                centroids = self.centroids[slots]
+                similarities = (centroids @ vector) / np.linalg.norm(centroids, axis=1)
+                best = int(similarities.argmax())
+                if similarities[best] >= self.threshold:
+                    slot = int(slots[best])
+            if slot is None:
+                slot = self.new_incident(category, seen)
+
+            size = self.sizes[slot] + 1
+            self.centroids[slot] += (vector - self.centroids[slot]) / size
+            self.sizes[slot] = size
+            self.first_seen[slot] = min(self.first_seen[slot], seen)
+            self.last_seen[slot] = max(self.last_seen[slot], seen)
+
+            incident = self.incidents[slot]
+            incident["location_tokens"].update(locations)
+            counted = {
+                field: document[field]
+                for field in ("location", "disaster_type", "source", "priority")
+                if document.get(field)
+            }
+            for field, value in counted.items():
+                incident[field][value] += 1
+            if doc_id is not None:
+                if len(incident["post_ids"]) < INCIDENT_MAX_POST_IDS:
+                    incident["post_ids"].append(doc_id)
+                positions = np.flatnonzero(vector)
+                self.members[doc_id] = {
+                    "slot": slot,
+                    "positions": positions,
+                    "weights": vector[positions],
+                    "locations": locations,
+                    "counted": counted,
+                }
+                incident["members"].add(doc_id)
+
+            # Closest posts to the centroid as it was when they joined
+            similarity = float(
+                self.centroids[slot] @ vector / np.linalg.norm(self.centroids[slot])
+            )
+            representatives = incident["representatives"]
+            representatives.append((similarity, post_card(doc_id, document)))
+            representatives.sort(key=lambda entry: entry[0], reverse=True)
+            del representatives[INCIDENT_REPRESENTATIVES:]
+            if self.pending is not None:
+                self.pending.append(("add", document, doc_id, incident["id"]))
+            return incident["id"]
+
+    def remove(self, doc_id):
+        # Whether the post was in an incident
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(("remove", doc_id))
+            if doc_id not in self.members:
+                return False
+            self.discard(doc_id)
+            self.posts -= 1
+            return True
+
+    def discard(self, doc_id):
+        member = self.members.pop(doc_id)
+        slot = member["slot"]
+        incident = self.incidents[slot]
+        incident["members"].discard(doc_id)
+        size = self.sizes[slot] - 1
+        if size <= 0:
+            self.drop(slot)
+            return
+        # The running mean without this post's vector
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        vector[member["positions"]] = member["weights"]
+        self.centroids[slot] = (self.centroids[slot] * (size + 1) - vector) / size
+        self.sizes[slot] = size
+        incident["location_tokens"].subtract(member["locations"])
+        incident["location_tokens"] += Counter()
+        for field, value in member["counted"].items():
+            incident[field][value] -= 1
+            if incident[field][value] <= 0:
+                del incident[field][value]
+        if doc_id in incident["post_ids"]:
+            incident["post_ids"].remove(doc_id)
+        incident["representatives"] = [
+            entry
+            for entry in incident["representatives"]
+            if entry[1]["objId"] != doc_id
+        ]
+
+    def new_incident(self, category, seen, incident_id=None):
+        if not self.free:
+            if len(self.incidents) < self.max_incidents:
+                self.grow()
+            else:
+                active = np.flatnonzero(self.sizes)
+                evicted = int(active[self.last_seen[active].argmin()])
+                self.posts -= int(self.sizes[evicted])
+                self.drop(evicted)
+                self.evicted += 1
+        slot = self.free.pop()
+        self.first_seen[slot] = seen
+        self.last_seen[slot] = seen
+        incident_id = incident_id or uuid.uuid4().hex
+        self.incidents[slot] = {
+            "id": incident_id,
+            "category": category,
+            # Token -> member posts naming it
+            "location_tokens": Counter(),
+            "location": Counter(),
+            "disaster_type": Counter(),
+            "source": Counter(),
+            "priority": Counter(),
+            "post_ids": [],
+            "members": set(),
+            "representatives": [],
+        }
+        self.by_category.setdefault(category, set()).add(slot)
+        self.by_id[incident_id] = slot
+        self.created += 1
+        return slot
+
+    def grow(self):
+        capacity = len(self.incidents)
+        grown = min(capacity * 2, self.max_incidents)
+        self.centroids = np.vstack(
+            [self.centroids, np.zeros((grown - capacity, self.dimensions), np.float32)]
+        )
+        self.sizes = np.concatenate([self.sizes, np.zeros(grown - capacity, np.int32)])
+        self.first_seen = np.concatenate([self.first_seen, np.zeros(grown - capacity)])
+        self.last_seen = np.concatenate([self.last_seen, np.zeros(grown - capacity)])
+        self.incidents += [None] * (grown - capacity)
+        self.free += range(grown - 1, capacity - 1, -1)
+
+    def drop(self, slot):
+        for doc_id in self.incidents[slot]["members"]:
+            del self.members[doc_id]
+        self.by_category[self.incidents[slot]["category"]].discard(slot)
+        del self.by_id[self.incidents[slot]["id"]]
+        self.incidents[slot] = None
+        self.centroids[slot] = 0
+        self.sizes[slot] = 0
+        self.free.append(slot)
+
+    def rebuild(self, posts):
+        # (document, doc_id, incident_id) triples, in posting order
+        fresh = IncidentIndex(
+            self.dimensions, self.threshold, self.window / 3600, self.max_incidents
+        )
+        with self.lock:
+            self.pending = []
+        try:
+            for document, doc_id, incident_id in posts:
+                fresh.add(document, doc_id, incident_id)
+        except Exception:
+            with self.lock:
+                self.pending = None
+            raise
+        with self.lock:
+            pending, self.pending = self.pending, None
+            for change in pending:
+                if change[0] == "add":
+                    fresh.add(*change[1:])
+                else:
+                    fresh.remove(change[1])
+            for name in (
+                "centroids",
+                "sizes",
+                "first_seen",
+                "last_seen",
+                "incidents",
+                "by_category",
+                "by_id",
+                "free",
+                "members",
+                "posts",
+            ):
+                setattr(self, name, getattr(fresh, name))
+        return fresh.posts
+
+    def describe(self, slot):
+        incident = self.incidents[slot]
+        location = incident["location"].most_common(1)
+        disaster_type = incident["disaster_type"].most_common(1)
+        location = location[0][0] if location else None
+        disaster_type = disaster_type[0][0] if disaster_type else None
+        return {
+            "id": incident["id"],
+            "label": " – ".join(part for part in (disaster_type, location) if part),
+            "category": incident["category"],
+            "disaster_type": disaster_type,
+            "location": location,
+            "locations": dict(incident["location"]),
+            "posts": int(self.sizes[slot]),
+            "first_seen": datetime.fromtimestamp(self.first_seen[slot]).isoformat(
+                timespec="seconds"
+            ),
+            "last_seen": datetime.fromtimestamp(self.last_seen[slot]).isoformat(
+                timespec="seconds"
+            ),
+            "sources": dict(incident["source"]),
+            "priority": next(
+                (level for level in PRIORITY_LEVELS if incident["priority"][level]),
+                None,
+            ),
+            "representatives": [card for _, card in incident["representatives"]],
+            "post_ids": list(incident["post_ids"]),
+        }
+
+    def ranked(self, since=None, min_posts=1, category=None, size=20):
+        with self.lock:
+            slots = np.flatnonzero(self.sizes >= max(min_posts, 1))
+            if since is not None:
+                slots = slots[self.last_seen[slots] >= since.timestamp()]
+            if category:
+                slots = [
+                    slot
+                    for slot in slots
+                    if self.incidents[slot]["category"] == category.lower()
+                ]
+            # Biggest incidents first, most recently active among equals
+            slots = sorted(
+                slots, key=lambda slot: (-self.sizes[slot], -self.last_seen[slot])
+            )
+            return len(slots), [self.describe(slot) for slot in slots[:size]]
+
+    def stats(self):
+        return {
+            "incidents": int(np.count_nonzero(self.sizes)),
+            "capacity": len(self.incidents),
+            "max_incidents": self.max_incidents,
+            "dimensions": self.dimensions,
+            "threshold": self.threshold,
+            "window_hours": self.window / 3600,
+            "posts": self.posts,
+            "created": self.created,
+            "evicted": self.evicted,
+            "centroid_bytes": self.centroids.nbytes,
+        }
@@ -0,0 +1,1082 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import bisect
+import copy
+import heapq
+import itertools
+import math
+import re
+import sys
+import threading
+
+TOKEN_PATTERN = re.compile(r"\w+")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# The default sort field gets an incrementally maintained bucket index
+RANK_FIELD = "source_rank"
+
+EARTH_RADIUS_KM = 6371.0088
+DISTANCE_UNITS = {"km": 1.0, "m": 0.001, "mi": 1.609344}
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+# The painless statements update scripts use: ctx._source.a.b += 1
+SCRIPT_STATEMENT = re.compile(
+    r"^ctx\._source((?:\.\w+)+)\s*(\+=|-=|=)\s*(params\.\w+|-?\d+(?:\.\d+)?)$"
+)
+
+
+def analyze(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def parse_date_value(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(
+            tzinfo=None
+        )
+    except ValueError:
+        return None
+
+
+def run_script(source, script):
+    # Runs simple field assignments, anything else is out of scope locally
+    script = {"source": script} if isinstance(script, str) else script
+    params = script.get("params") or {}
+    for statement in script.get("source", "").split(";"):
+        statement = statement.strip()
+        if not statement:
+            continue
+        match = SCRIPT_STATEMENT.match(statement)
+        if match is None:
+            raise NotImplementedError(f"Local search can't run '{statement}'")
+        path, operator, value = match.groups()
+        if value.startswith("params."):
+            value = params[value[len("params.") :]]
+        else:
+            value = float(value) if "." in value else int(value)
+        *parents, field = path[1:].split(".")
+        target = source
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        if operator == "=":
+            target[field] = value
+        elif operator == "+=":
+            target[field] = target.get(field, 0) + value
+        else:
+            target[field] = target.get(field, 0) - value
+    return source
+
+
+def is_keyword_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def base_field(field):
+    return field[: -len(".keyword")] if field.endswith(".keyword") else field
+
+
+def clause_value(value, key="query"):
+    # {"field": "text"} and {"field": {"query": "text"}} are both valid DSL
+    return value.get(key) if isinstance(value, dict) else value
+
+
+def as_list(clauses):
+    if not clauses:
+        return []
+    return [clauses] if isinstance(clauses, dict) else clauses
+
+
+def project_source(source, projection):
+    if projection is None or projection is True:
+        return dict(source)
+    if projection is False:
+        return {}
+    if isinstance(projection, dict):
+        includes = projection.get("includes")
+        excludes = set(projection.get("excludes") or [])
+    else:
+        includes = projection
+        excludes = set()
+    if isinstance(includes, str):
+        includes = [includes]
+    projected = {}
+    for field in includes or source.keys():
+        if field in excludes:
+            continue
+        if "." in field:
+            head, tail = field.split(".", 1)
+            if isinstance(source.get(head), dict) and tail in source[head]:
+                projected.setdefault(head, {})[tail] = source[head][tail]
+        elif field in source:
+            projected[field] = source[field]
+    return projected
+
+
+def missing_value(missing):
+    if missing is None or missing == "_last":
+        return float("inf")
+    if missing == "_first":
+        return float("-inf")
+    return missing
+
+
+def descending_value(value):
+    if isinstance(value, str):
+        # Code points mirrored, the sentinel puts longer strings first
+        return "".join(chr(0x10FFFF - ord(char)) for char in value) + chr(0x10FFFF)
+    return -value
+
+
+def floor_date(date, interval):
+    if interval in ("hour", "1h"):
+        return date.replace(minute=0, second=0, microsecond=0)
+    day = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval in ("week", "1w"):
+        return day - timedelta(days=day.weekday())
+    if interval in ("month", "1M"):
+        return day.replace(day=1)
+    if interval in ("year", "1y"):
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_bucket(date, interval):
+    if interval in ("month", "1M"):
+        return date.replace(
+            year=date.year + date.month // 12, month=date.month % 12 + 1
+        )
+    if interval in ("year", "1y"):
+        return date.replace(year=date.year + 1)
+    if interval in ("hour", "1h"):
+        return date + timedelta(hours=1)
+    return date + timedelta(days=7 if interval in ("week", "1w") else 1)
+
+
+def parse_sort(sort):
+    # -> [(field, descending, missing)]
+    spec = []
+    for entry in sort or []:
+        if isinstance(entry, str):
+            spec.append((entry, entry == "_score", None))
+            continue
+        field, options = next(iter(entry.items()))
+        if isinstance(options, str):
+            options = {"order": options}
+        default_order = "desc" if field == "_score" else "asc"
+        spec.append(
+            (
+                field,
+                options.get("order", default_order) == "desc",
+                options.get("missing"),
+            )
+        )
+    return spec
+
+
+def geo_point(value):
+    # Only the {"lat": .., "lon": ..} form, which is what posts store
+    if isinstance(value, dict) and "lat" in value and "lon" in value:
+        return (float(value["lat"]), float(value["lon"]))
+    return None
+
+
+def parse_distance(distance):
+    # "50km", "500m", "10mi" or a number of meters, in km
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-z]*)\s*", str(distance))
+    unit = match.group(2) or "m" if match else None
+    if unit not in DISTANCE_UNITS:
+        raise ValueError(f"Unsupported distance '{distance}'")
+    return float(match.group(1)) * DISTANCE_UNITS[unit]
+
+
+def haversine_km(first, second):
+    lat1, lon1 = map(math.radians, first)
+    lat2, lon2 = map(math.radians, second)
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(box):
+    # -> (top, left, bottom, right) from the corner or the edge form
+    if "top_left" in box:
+        top, left = geo_point(box["top_left"])
+        bottom, right = geo_point(box["bottom_right"])
+        return top, left, bottom, right
+    return box["top"], box["left"], box["bottom"], box["right"]
+
+
+def geohash(point, precision):
+    latitudes, longitudes = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (longitudes, point[1]) if even else (latitudes, point[0])
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def text_clauses(query):
+    # (field, text) of every scored match/match_phrase clause
+    clauses = []
+    for kind, body in (query or {}).items():
+        if kind in ("match", "match_phrase"):
+            field, value = next(iter(body.items()))
+            if not field.endswith(".keyword"):
+                clauses.append((field, clause_value(value)))
+        elif kind == "bool":
+            for occur in ("must", "should"):
+                for clause in as_list(body.get(occur)):
+                    clauses += text_clauses(clause)
+    return clauses
+
+
+class LocalIndex:
+    """Inverted index over the posts of one index name.
+
+    Documents get an increasing internal number on every write, which keys
+    every posting set and is the tiebreak after the sort fields, the way
+    _shard_doc is for Elasticsearch. Required clauses are evaluated from the
+    most selective one down, so broad terms only ever intersect a small set.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.docs = {}
+        self.ids = {}
+        self.docnos = {}
+        self.sequence = itertools.count()
+        self.auto_ids = itertools.count(1)
+        # field -> term -> {docno}
+        self.postings = defaultdict(lambda: defaultdict(set))
+        # field -> docno -> analyzed tokens, for phrases and term frequencies
+        self.tokens = defaultdict(dict)
+        self.total_lengths = defaultdict(int)
+        # field -> exact value -> {docno}
+        self.keywords = defaultdict(lambda: defaultdict(set))
+        self.dates = {}
+        # Parallel arrays ordered by (date, docno)
+        self.date_keys = []
+        self.date_docnos = []
+        # source_rank -> {docno}
+        self.by_rank = defaultdict(set)
+        # field -> docno -> (lat, lon)
+        self.points = defaultdict(dict)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def source(self, doc_id):
+        docno = self.docnos.get(doc_id)
+        return None if docno is None else self.docs[docno]
+
+    def put(self, doc_id, source):
+        created = self.remove(doc_id) is False
+        docno = next(self.sequence)
+        self.docs[docno] = source
+        self.ids[docno] = doc_id
+        self.docnos[doc_id] = docno
+
+        for field, value in source.items():
+            if isinstance(value, str):
+                tokens = tuple(sys.intern(token) for token in analyze(value))
+                postings = self.postings[field]
+                for token in tokens:
+                    postings[token].add(docno)
+                self.tokens[field][docno] = tokens
+                self.total_lengths[field] += len(tokens)
+                self.keywords[field][value].add(docno)
+            elif isinstance(value, (int, float)):
+                self.keywords[field][value].add(docno)
+            elif geo_point(value) is not None:
+                self.points[field][docno] = geo_point(value)
+            elif is_keyword_list(value):
+                # Arrays like gpe_locations match a term on any of their values
+                for item in value:
+                    self.keywords[field][item].add(docno)
+
+        date = parse_date_value(source.get("date"))
+        if date is not None:
+            self.dates[docno] = date
+            position = bisect.bisect_left(self.date_keys, (date, docno))
+            self.date_keys.insert(position, (date, docno))
+            self.date_docnos.insert(position, docno)
+        self.by_rank[source.get(RANK_FIELD)].add(docno)
+        return created
+
+    def remove(self, doc_id):
+        docno = self.docnos.pop(doc_id, None)
+        if docno is None:
+            return False
+        source = self.docs.pop(docno)
+        del self.ids[docno]
+
+        for field, value in source.items():
+            if isinstance(value, str):
+                tokens = self.tokens[field].pop(docno, ())
+                for token in set(tokens):
+                    self.postings[field][token].discard(docno)
+                self.total_lengths[field] -= len(tokens)
+                self.keywords[field][value].discard(docno)
+            elif isinstance(value, (int, float)):
+                self.keywords[field][value].discard(docno)
+            elif geo_point(value) is not None:
+                self.points[field].pop(docno, None)
+            elif is_keyword_list(value):
+                for item in value:
+                    self.keywords[field][item].discard(docno)
+
+        date = self.dates.pop(docno, None)
+        if date is not None:
+            position = bisect.bisect_left(self.date_keys, (date, docno))
+            del self.date_keys[position]
+            del self.date_docnos[position]
+        self.by_rank[source.get(RANK_FIELD)].discard(docno)
+        return True
+
+    def next_id(self):
+        while True:
+            doc_id = f"local-{next(self.auto_ids)}"
+            if doc_id not in self.docnos:
+                return doc_id
+
+    # Query evaluation: every clause yields a set of docnos, None meaning all.
+    # `within` is the set matched so far, cheap clauses just intersect it.
+
+    def term_sets(self, kind, body):
+        field, value = next(iter(body.items()))
+        if kind == "term":
+            values = [clause_value(value, "value")]
+        elif kind == "terms":
+            values = value
+        elif field.endswith(".keyword"):
+            values = [clause_value(value)]
+        else:
+            postings = self.postings[field]
+            return [
+                postings.get(token, set()) for token in analyze(clause_value(value))
+            ]
+        keywords = self.keywords[base_field(field)]
+        return [keywords.get(value, set()) for value in values]
+
+    def date_slice(self, bounds):
+        lower = parse_date_value(bounds.get("gte", bounds.get("gt")))
+        upper = parse_date_value(bounds.get("lte", bounds.get("lt")))
+        start, end = 0, len(self.date_keys)
+        if lower is not None:
+            if "gt" in bounds:
+                start = bisect.bisect_right(self.date_keys, (lower, math.inf))
+            else:
+                start = bisect.bisect_left(self.date_keys, (lower,))
+        if upper is not None:
+            if "lt" in bounds:
+                end = bisect.bisect_left(self.date_keys, (upper,))
+            else:
+                end = bisect.bisect_right(self.date_keys, (upper, math.inf))
+        return start, max(start, end)
+
+    def estimate(self, clause):
+        # Upper bound on the clause's matches, used to order evaluation
+        kind, body = next(iter(clause.items()))
+        if kind in ("match", "term", "terms"):
+            return sum(len(members) for members in self.term_sets(kind, body))
+        if kind == "match_phrase":
+            return min(
+                (len(members) for members in self.term_sets(kind, body)), default=0
+            )
+        if kind == "range" and "date" in body:
+            start, end = self.date_slice(body["date"])
+            return end - start
+        if kind == "ids":
+            return len(body.get("values", []))
+        return len(self.docs)
+
+    def phrase_candidates(self, field, phrase, within):
+        # Docs holding every token of the phrase, positions unchecked
+        postings = self.postings[field]
+        docs = within
+        for token in sorted(
+            set(phrase), key=lambda token: len(postings.get(token, ()))
+        ):
+            members = postings.get(token, set())
+            docs = set(members) if docs is None else docs & members
+        return docs
+
+    def verify_phrase(self, field, phrase, docs):
+        tokens = self.tokens[field]
+        width = len(phrase)
+        matched = set()
+        for docno in docs:
+            doc_tokens = tokens[docno]
+            if doc_tokens == phrase:
+                matched.add(docno)
+                continue
+            for start in range(len(doc_tokens) - width + 1):
+                if doc_tokens[start : start + width] == phrase:
+                    matched.add(docno)
+                    break
+        return matched
+
+    def phrase_docs(self, field, text, within):
+        phrase = tuple(analyze(text))
+        if not phrase:
+            return set()
+        docs = self.phrase_candidates(field, phrase, within)
+        if len(phrase) == 1:
+            return docs
+        return self.verify_phrase(field, phrase, docs)
+
+    def range_docs(self, field, bounds, within=None):
+        if field == "date":
+            start, end = self.date_slice(bounds)
+            if start == end:
+                return set()
+            if within is None or len(within) * 8 >= end - start:
+                return set(self.date_docnos[start:end])
+            first, last = self.date_keys[start], self.date_keys[end - 1]
+            dates = self.dates
+            return {
+                docno
+                for docno in within
+                if docno in dates and first <= (dates[docno], docno) <= last
+            }
+
+        lower = bounds.get("gte", bounds.get("gt"))
+        upper = bounds.get("lte", bounds.get("lt"))
+        docs = set()
+        for docno, source in self.docs.items():
+            value = source.get(field)
+            if value is None:
+                continue
+            try:
+                if lower is not None and (
+                    value < lower if "gte" in bounds else value <= lower
+                ):
+                    continue
+                if upper is not None and (
+                    value > upper if "lte" in bounds else value >= upper
+                ):
+                    continue
+            except TypeError:
+                continue
+            docs.add(docno)
+        return docs
+
+    def clause_docs(self, clause, within=None):
+        kind, body = next(iter(clause.items()))
+        if kind == "match_all":
+            return None
+        if kind == "bool":
+            return self.bool_docs(body, within)
+        if kind in ("match", "term", "terms"):
+            docs = set()
+            for members in self.term_sets(kind, body):
+                docs |= members if within is None else within & members
+            return docs
+        if kind == "match_phrase":
+            field, value = next(iter(body.items()))
+            if field.endswith(".keyword"):
+                return self.clause_docs({"term": body}, within)
+            return self.phrase_docs(field, clause_value(value), within)
+        if kind == "range":
+            field, bounds = next(iter(body.items()))
+            return self.range_docs(field, bounds, within)
+        if kind == "ids":
+            return {
+                self.docnos[doc_id]
+                for doc_id in body.get("values", [])
+                if doc_id in self.docnos
+            }
+        if kind == "geo_distance":
+            radius = parse_distance(body["distance"])
+            field, origin = next(
+                (field, value)
+                for field, value in body.items()
+                if field not in ("distance", "distance_type", "_name")
+            )
+            origin = geo_point(origin)
+            return {
+                docno
+                for docno, point in self.geo_points(field, within)
+                if haversine_km(origin, point) <= radius
+            }
+        if kind == "geo_bounding_box":
+            field, box = next(iter(body.items()))
+            top, left, bottom, right = bounding_box(box)
+            return {
+                docno
+                for docno, (lat, lon) in self.geo_points(field, within)
+                if bottom <= lat <= top and left <= lon <= right
+            }
+        if kind == "exists":
+            field = base_field(body["field"])
+            return {
+                docno
+                for docno in (self.docs if within is None else within)
+                if self.docs[docno].get(field) not in (None, "", [])
+            }
+        raise NotImplementedError(f"Local search does not support '{kind}' queries")
+
+    def geo_points(self, field, within=None):
+        points = self.points[field]
+        if within is None:
+            return points.items()
+        return ((docno, points[docno]) for docno in within if docno in points)
+
+    def bool_docs(self, body, within=None):
+        docs = within
+        required = as_list(body.get("filter")) + as_list(body.get("must"))
+        phrases = []
+        for clause in sorted(required, key=self.estimate):
+            kind, clause_body = next(iter(clause.items()))
+            field, value = next(iter(clause_body.items()), (None, None))
+            if kind == "match_phrase" and not field.endswith(".keyword"):
+                # Positions are only checked once the other clauses have narrowed
+                phrase = tuple(analyze(clause_value(value)))
+                clause_docs = self.phrase_candidates(field, phrase, docs)
+                if len(phrase) > 1:
+                    phrases.append((field, phrase))
+            else:
+                clause_docs = self.clause_docs(clause, docs)
+            if clause_docs is not None:
+                docs = clause_docs if docs is None else docs & clause_docs
+            if docs is not None and not docs:
+                return docs
+        for field, phrase in phrases:
+            docs = self.verify_phrase(field, phrase, docs)
+
+        should = as_list(body.get("should"))
+        if should and not required:
+            matched = set()
+            for clause in should:
+                clause_docs = self.clause_docs(clause, docs)
+                if clause_docs is None:
+                    matched = None
+                    break
+                matched |= clause_docs
+            if matched is not None:
+                docs = matched if docs is None else docs & matched
+
+        for clause in as_list(body.get("must_not")):
+            excluded = self.clause_docs(clause, docs)
+            if excluded is None:
+                return set()
+            docs = (set(self.docs) if docs is None else docs) - excluded
+        return docs
+
+    def query_docs(self, query):
+        if not query:
+            return None
+        return self.clause_docs(query)
+
+    def bm25(self, docno, clauses):
+        score = 0.0
+        for field, text in clauses:
+            postings = self.postings[field]
+            tokens = self.tokens[field]
+            doc_tokens = tokens.get(docno, ())
+            average = self.total_lengths[field] / max(len(tokens), 1)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc_tokens) / max(average, 1))
+            for token in set(analyze(text)):
+                frequency = doc_tokens.count(token)
+                if not frequency:
+                    continue
+                documents = len(postings[token])
+                idf = math.log(
+                    1 + (len(self.docs) - documents + 0.5) / (documents + 0.5)
+                )
+                score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return score
+
+    # Ordering: keys are (sort values..., index position, docno)
+
+    def rank_ordered(self, docs, sort, position, size, after):
+        # Default sort on source_rank, answered bucket by bucket
+        _, descending, missing = sort[0]
+        buckets = defaultdict(list)
+        for rank, members in self.by_rank.items():
+            if rank is None and missing in (None, "_first", "_last"):
+                value = missing_value(missing)
+            else:
+                value = missing if rank is None else rank
+                value = -value if descending else value
+            buckets[value].append(members)
+
+        hits = []
+        for value in sorted(buckets):
+            if after is not None and (value, position) < after[:2]:
+                continue
+            members = [
+                bucket if docs is None else bucket & docs for bucket in buckets[value]
+            ]
+            members = members[0] if len(members) == 1 else set().union(*members)
+            if after is not None and (value, position) == after[:2]:
+                members = [docno for docno in members if docno > after[2]]
+            needed = size - len(hits)
+            if needed * 10 < len(members):
+                members = heapq.nsmallest(needed, members)
+            else:
+                members = sorted(members)[:needed]
+            hits += [((value, position, docno), self, docno) for docno in members]
+            if len(hits) >= size:
+                break
+        return hits
+
+    def ordered(self, docs, sort, clauses, position, size, after):
+        if len(sort) == 1 and sort[0][0] == RANK_FIELD:
+            return self.rank_ordered(docs, sort, position, size, after)
+
+        def sort_key(docno):
+            values = []
+            for field, descending, missing in sort or [("_score", True, None)]:
+                if field == "_score":
+                    value = self.bm25(docno, clauses)
+                elif field == "date":
+                    value = self.dates.get(docno)
+                    value = None if value is None else value.timestamp() * 1000
+                else:
+                    value = self.docs[docno].get(field)
+                if value is None and missing not in (None, "_first", "_last"):
+                    value = missing
+                if value is None:
+                    value = missing_value(missing)
+                elif descending:
+                    value = descending_value(value)
+                values.append(value)
+            return (*values, position, docno)
+
+        keyed = (
+            (sort_key(docno), self, docno)
+            for docno in (self.docs if docs is None else docs)
+        )
+        if after is not None:
+            keyed = (hit for hit in keyed if hit[0] > after)
+        return heapq.nsmallest(size, keyed, key=lambda hit: hit[0])
+
+
+class LocalSearchBackend:
+    """In-process stand-in for the Elasticsearch client.
+
+    Answers the subset of the client API the search blueprint uses by
+    interpreting the query DSL build_es_query produces: bool queries of match,
+    match_phrase, term(s), range and exists clauses, field sorts with
+    search_after, _source projection and terms aggregations. Text matches are
+    scored with BM25. Everything lives in memory, so it only knows the posts
+    written through this process.
+    """
+
+    def __init__(self, aliases=None, alias_filters=None):
+        # alias -> index name, e.g. to read and write one store under two names
+        self.aliases = dict(aliases or {})
+        # alias -> query its documents have to match, as with a filtered alias
+        self.alias_filters = dict(alias_filters or {})
+        self.indices_by_name = {}
+        self.lock = threading.RLock()
+        self.indices = LocalIndicesClient(self)
+
+    def get_index(self, name, create=True):
+        name = self.aliases.get(name, name)
+        if name not in self.indices_by_name and create:
+            self.indices_by_name[name] = LocalIndex(name)
+        return self.indices_by_name.get(name)
+
+    def resolve(self, index):
+        return [target for target, _ in self.resolve_filtered(index)]
+
+    def resolve_filtered(self, index):
+        # (index, alias filter) pairs. A store named both through a filtered
+        # alias and without one is read unfiltered.
+        names = index.split(",") if isinstance(index, str) else list(index or [])
+        if not names or names == ["_all"]:
+            names = list(self.indices_by_name)
+        filters = {}
+        for name in names:
+            target = self.get_index(name)
+            alias_filter = self.alias_filters.get(name)
+            if target in filters and filters[target] != alias_filter:
+                alias_filter = None
+            filters[target] = alias_filter
+        return list(filters.items())
+
+    def filtered_docs(self, target, query, alias_filter):
+        if alias_filter is not None:
+            query = {
+                "bool": {"must": [query] if query else [], "filter": [alias_filter]}
+            }
+        return target.query_docs(query)
+
+    def ping(self):
+        return True
+
+    # Document APIs
+
+    def index(self, index, document, id=None, **kwargs):
+        with self.lock:
+            target = self.get_index(index)
+            doc_id = str(id) if id is not None else target.next_id()
+            created = target.put(doc_id, dict(document))
+        return {
+            "_index": index,
+            "_id": doc_id,
+            "result": "created" if created else "updated",
+        }
+
+    def get(self, index, id, source_includes=None, **kwargs):
+        for target, alias_filter in self.resolve_filtered(index):
+            source = target.source(id)
+            if source is not None and alias_filter is not None:
+                if not target.clause_docs(alias_filter, {target.docnos[id]}):
+                    continue
+            if source is not None:
+                return {
+                    "_index": target.name,
+                    "_id": id,
+                    "found": True,
+                    "_source": project_source(source, source_includes),
+                }
+        raise KeyError(f"Document {id} not found in {index}")
+
+    def mget(self, index, ids, source_includes=None, **kwargs):
+        docs = []
+        for doc_id in ids:
+            try:
+                docs.append(self.get(index, doc_id, source_includes))
+            except KeyError:
+                docs.append({"_index": index, "_id": doc_id, "found": False})
+        return {"docs": docs}
+
+    def delete(self, index, id, **kwargs):
+        with self.lock:
+            target = self.get_index(index, create=False)
+            if target is None or not target.remove(id):
+                raise KeyError(f"Document {id} not found in {index}")
+        return {"_index": index, "_id": id, "result": "deleted"}
+
+    def update(self, index, id, doc=None, upsert=None, script=None, **kwargs):
+        with self.lock:
+            target = self.get_index(index)
+            source = target.source(id)
+            if source is None:
+                if upsert is None and doc is None:
+                    raise KeyError(f"Document {id} not found in {index}")
+                target.put(id, dict(upsert if upsert is not None else doc))
+                return {"_index": index, "_id": id, "result": "created"}
+            if script is not None:
+                # Suggestion upserts bump a weight, so the source is copied deep
+                target.put(id, run_script(copy.deepcopy(source), script))
+            else:
+                target.put(id, {**source, **(doc or {})})
+        return {"_index": index, "_id": id, "result": "updated"}
+
+    def bulk(self, operations, **kwargs):
+        items = []
+        operations = iter(operations)
+        for action in operations:
+            kind, meta = next(iter(action.items()))
+            index = meta.get("_index")
+            doc_id = meta.get("_id")
+            try:
+                if kind in ("index", "create"):
+                    result = self.index(index, next(operations), id=doc_id)
+                elif kind == "update":
+                    result = self.update(index, doc_id, **next(operations))
+                elif kind == "delete":
+                    result = self.delete(index, doc_id)
+                else:
+                    raise NotImplementedError(f"Unknown bulk action '{kind}'")
+                items.append({kind: {**result, "status": 200}})
+            except Exception as e:
+                items.append(
+                    {
+                        kind: {
+                            "_index": index,
+                            "_id": doc_id,
+                            "status": 404 if isinstance(e, KeyError) else 400,
+                            "error": {"type": type(e).__name__, "reason": str(e)},
+                        }
+                    }
+                )
+        return {
+            "errors": any("error" in next(iter(item.values())) for item in items),
+            "items": items,
+        }
+
+    # Search APIs
+
+    def open_point_in_time(self, index, keep_alive=None, **kwargs):
+        # No snapshot, but new writes always sort after the docnos already seen
+        return {"id": f"local:{index}"}
+
+    def close_point_in_time(self, id=None, **kwargs):
+        return {"succeeded": True}
+
+    def count(self, index=None, query=None, body=None, **kwargs):
+        query = query or (body or {}).get("query")
+        total = 0
+        with self.lock:
+            for target, alias_filter in self.resolve_filtered(index):
+                docs = self.filtered_docs(target, query, alias_filter)
+                total += len(target) if docs is None else len(docs)
+        return {"count": total}
+
+    def search(self, index=None, body=None, **kwargs):
+        request = dict(body or {})
+        request.update(
+            {key: value for key, value in kwargs.items() if value is not None}
+        )
+        if "pit" in request:
+            index = request["pit"]["id"].split(":", 1)[1]
+        if "source" in request:
+            request["_source"] = request.pop("source")
+
+        size = request.get("size", 10)
+        sort = parse_sort(request.get("sort"))
+        after = tuple(request["search_after"]) if request.get("search_after") else None
+        query = request.get("query")
+        clauses = text_clauses(query)
+        # Like ES, scores are only computed when they decide the order
+        scored = not sort or any(field == "_score" for field, _, _ in sort)
+
+        with self.lock:
+            matches = [
+                (target, self.filtered_docs(target, query, alias_filter))
+                for target, alias_filter in self.resolve_filtered(index)
+            ]
+            hits = heapq.nsmallest(
+                size,
+                itertools.chain.from_iterable(
+                    target.ordered(docs, sort, clauses, position, size, after)
+                    for position, (target, docs) in enumerate(matches)
+                ),
+                key=lambda hit: hit[0],
+            )
+            response = {
+                "hits": {
+                    "total": {
+                        "value": sum(
+                            len(target) if docs is None else len(docs)
+                            for target, docs in matches
+                        ),
+                        "relation": "eq",
+                    },
+                    "hits": [
+                        {
+                            "_index": target.name,
+                            "_id": target.ids[docno],
+                            "_score": target.bm25(docno, clauses) if scored else None,
+                            "_source": project_source(
+                                target.docs[docno], request.get("_source")
+                            ),
+                            "sort": list(key),
+                        }
+                        for key, target, docno in hits
+                    ],
+                }
+            }
+            aggregations = self.aggregate(matches, request.get("aggs") or {})
+
+        if aggregations:
+            response["aggregations"] = aggregations
+        if "pit" in request:
+            response["pit_id"] = request["pit"]["id"]
+        return response
+
+    def msearch(self, searches, index=None, **kwargs):
+        # searches alternates headers and bodies, as in the _msearch NDJSON
+        responses = []
+        for header, body in zip(searches[::2], searches[1::2]):
+            try:
+                response = self.search(index=header.get("index", index), body=body)
+                responses.append({**response, "status": 200})
+            except Exception as e:
+                responses.append(
+                    {
+                        "error": {"type": type(e).__name__, "reason": str(e)},
+                        "status": 400,
+                    }
+                )
+        return {"responses": responses}
+
+    def aggregate(self, matches, aggs):
+        results = {}
+        for name, spec in aggs.items():
+            if "terms" in spec:
+                results[name] = self.terms_aggregation(matches, spec["terms"])
+            elif "filter" in spec:
+                filtered = []
+                for target, docs in matches:
+                    clause_docs = target.query_docs(spec["filter"])
+                    if docs is None or clause_docs is None:
+                        docs = clause_docs if docs is None else docs
+                    else:
+                        docs = docs & clause_docs
+                    filtered.append((target, docs))
+                results[name] = {
+                    "doc_count": sum(
+                        len(target) if docs is None else len(docs)
+                        for target, docs in filtered
+                    ),
+                    **self.aggregate(filtered, spec.get("aggs") or {}),
+                }
+            elif "date_histogram" in spec:
+                results[name] = self.date_histogram(matches, spec["date_histogram"])
+            elif "geohash_grid" in spec:
+                results[name] = self.geohash_grid(
+                    matches, spec["geohash_grid"], spec.get("aggs") or {}
+                )
+            elif "geo_centroid" in spec:
+                results[name] = self.geo_centroid(matches, spec["geo_centroid"])
+            else:
+                raise NotImplementedError(
+                    f"Local search does not support aggregation '{name}'"
+                )
+        return results
+
+    def terms_aggregation(self, matches, spec):
+        field = base_field(spec["field"])
+        counts = defaultdict(int)
+        for target, docs in matches:
+            if field == "_index":
+                counts[target.name] += len(target) if docs is None else len(docs)
+                continue
+            keywords = target.keywords[field]
+            if docs is not None and len(docs) < len(keywords):
+                for docno in docs:
+                    value = target.docs[docno].get(field)
+                    if value not in (None, ""):
+                        counts[value] += 1
+            else:
+                for value, members in keywords.items():
+                    count = len(members if docs is None else members & docs)
+                    if count and value != "":
+                        counts[value] += count
+        buckets = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+        return {
+            "buckets": [
+                {"key": key, "doc_count": count}
+                for key, count in buckets[: spec.get("size", 10)]
+            ]
+        }
+
+    def date_histogram(self, matches, spec):
+        if spec.get("field", "date") != "date":
+            raise NotImplementedError("Local search only buckets the date field")
+        interval = spec.get("calendar_interval", "day")
+        counts = defaultdict(int)
+        for target, docs in matches:
+            dates = target.dates
+            for docno in dates if docs is None else docs:
+                if docno in dates:
+                    counts[floor_date(dates[docno], interval)] += 1
+
+        bounds = spec.get("extended_bounds") or {}
+        keys = set(counts)
+        if spec.get("min_doc_count", 1) == 0:
+            # Empty buckets are filled in across the data and the extended bounds
+            edges = list(keys)
+            for bound in (bounds.get("min"), bounds.get("max")):
+                date = parse_date_value(bound)
+                if date is not None:
+                    edges.append(floor_date(date, interval))
+            if edges:
+                current, last = min(edges), max(edges)
+                while current <= last:
+                    keys.add(current)
+                    current = next_bucket(current, interval)
+        return {
+            "buckets": [
+                {
+                    "key_as_string": key.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                    "key": int(key.replace(tzinfo=timezone.utc).timestamp() * 1000),
+                    "doc_count": counts.get(key, 0),
+                }
+                for key in sorted(keys)
+                if counts.get(key, 0) >= spec.get("min_doc_count", 1)
+            ]
+        }
+
+    def geohash_grid(self, matches, spec, aggs):
+        precision = spec.get("precision", 5)
+        cells = defaultdict(lambda: defaultdict(set))
+        for position, (target, docs) in enumerate(matches):
+            for docno, point in target.geo_points(spec["field"], docs):
+                cells[geohash(point, precision)][position].add(docno)
+
+        def cell_count(cell):
+            return sum(len(docs) for docs in cell.values())
+
+        buckets = sorted(
+            cells.items(), key=lambda item: (-cell_count(item[1]), item[0])
+        )
+        return {
+            "buckets": [
+                {
+                    "key": key,
+                    "doc_count": cell_count(cell),
+                    **self.aggregate(
+                        [
+                            (target, cell.get(position, set()))
+                            for position, (target, _) in enumerate(matches)
+                        ],
+                        aggs,
+                    ),
+                }
+                for key, cell in buckets[: spec.get("size", 10000)]
+            ]
+        }
+
+    def geo_centroid(self, matches, spec):
+        count = 0
+        lat_total = lon_total = 0.0
+        for target, docs in matches:
+            for _, (lat, lon) in target.geo_points(spec["field"], docs):
+                count += 1
+                lat_total += lat
+                lon_total += lon
+        if not count:
+            return {"count": 0}
+        return {
+            "location": {"lat": lat_total / count, "lon": lon_total / count},
+            "count": count,
+        }
+
+
+class LocalIndicesClient:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def exists(self, index, **kwargs):
+        return all(
+            self.backend.get_index(name, create=False) is not None
+            for name in index.split(",")
+        )
+
+    def create(self, index, **kwargs):
+        self.backend.get_index(index)
+        return {"acknowledged": True, "index": index}
+
+    def put_mapping(self, index, **kwargs):
+        return {"acknowledged": True}
+
+    def refresh(self, index=None, **kwargs):
+        return {}
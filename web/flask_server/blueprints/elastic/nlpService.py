@@ -0,0 +1,202 @@
+from multiprocessing.connection import Client, Listener
+from collections import deque
+import argparse
+import threading
+import queue
+import time
+import os
+
+# How long the batching thread waits for more requests to join a batch
+NLP_SERVICE_MAX_WAIT = float(os.environ.get("NLP_SERVICE_MAX_WAIT", 0.005))
+
+
+def parse_address(address):
+    # "host:port" for TCP, anything else is a Unix socket path
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+class NLPClient:
+    """Sends texts to a running NLPService and waits for their parses.
+
+    Every thread keeps its own connection, so concurrent requests from one
+    worker reach the service side by side and are batched together there.
+    A connection the service dropped, e.g. across a restart, is reopened
+    once before the call fails.
+    """
+
+    def __init__(self, address, authkey):
+        self.address = parse_address(address)
+        self.authkey = authkey.encode("utf-8")
+        self.local = threading.local()
+
+    def request(self, message):
+        for attempt in range(2):
+            connection = getattr(self.local, "connection", None)
+            try:
+                if connection is None:
+                    connection = Client(self.address, authkey=self.authkey)
+                    self.local.connection = connection
+                connection.send(message)
+                status, result = connection.recv()
+                break
+            except (EOFError, OSError) as e:
+                if connection is not None:
+                    connection.close()
+                self.local.connection = None
+                if attempt:
+                    raise ConnectionError(f"NLP service unreachable: {e}")
+        if status == "error":
+            raise RuntimeError(f"NLP service failed: {result}")
+        return result
+
+    def analyze(self, texts):
+        return self.request(("analyze", list(texts)))
+
+    def stats(self):
+        return self.request(("stats",))
+
+
+class NLPService:
+    """Owns the spaCy model and parses texts for every Flask worker.
+
+    Each worker connection gets a thread that puts its texts on one queue.
+    The batching thread takes what is waiting, waiting up to `max_wait` for
+    more until it has `batch_size` texts, and parses them all in one
+    nlp.pipe call. Workers then only hold the keyword lists, however many
+    of them run.
+    """
+
+    def __init__(self, batch_size, max_wait):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.connections = 0
+        self.batches = 0
+        self.texts = 0
+        self.latencies = deque(maxlen=100)
+        self.lock = threading.Lock()
+
+    def handle(self, connection):
+        with self.lock:
+            self.connections += 1
+        try:
+            while True:
+                message = connection.recv()
+                if message[0] == "stats":
+                    connection.send(("ok", self.stats()))
+                    continue
+                if message[0] != "analyze":
+                    connection.send(("error", f"Unknown request {message[0]!r}"))
+                    continue
+                request = {"texts": message[1], "done": threading.Event()}
+                self.requests.put(request)
+                request["done"].wait()
+                connection.send(request["result"])
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+            with self.lock:
+                self.connections -= 1
+
+    def next_batch(self):
+        batch = [self.requests.get()]
+        size = len(batch[0]["texts"])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request["texts"])
+        return batch
+
+    def run_batches(self):
+        from blueprints.elastic.analysis import parse_texts
+
+        while True:
+            batch = self.next_batch()
+            texts = [text for request in batch for text in request["texts"]]
+            started = time.perf_counter()
+            try:
+                parsed = parse_texts(texts, self.batch_size)
+                position = 0
+                for request in batch:
+                    end = position + len(request["texts"])
+                    request["result"] = ("ok", parsed[position:end])
+                    position = end
+            except Exception as e:
+                print(f"NLP batch failed: {e}")
+                for request in batch:
+                    request["result"] = ("error", str(e))
+            with self.lock:
+                self.batches += 1
+                self.texts += len(texts)
+                self.latencies.append(time.perf_counter() - started)
+            for request in batch:
+                request["done"].set()
+
+    def serve(self, address, authkey):
+        # Every worker thread connects on its first parse, often all at once
+        listener = Listener(
+            parse_address(address), backlog=128, authkey=authkey.encode("utf-8")
+        )
+        threading.Thread(target=self.run_batches, daemon=True).start()
+        print(f"NLP service listening on {address}")
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                # A client with the wrong key, the service keeps serving
+                print(f"Refused NLP service connection: {e!r}")
+                continue
+            threading.Thread(
+                target=self.handle, args=(connection,), daemon=True
+            ).start()
+
+    def stats(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            return {
+                "connections": self.connections,
+                "queued": self.requests.qsize(),
+                "batches": self.batches,
+                "texts": self.texts,
+                "avg_batch_size": (
+                    round(self.texts / self.batches, 2) if self.batches else 0.0
+                ),
+                "avg_batch_ms": (
+                    round(1000 * sum(latencies) / len(latencies), 2)
+                    if latencies
+                    else 0.0
+                ),
+            }
+
+
+if __name__ == "__main__":
+    # From web/flask_server: python -m blueprints.elastic.nlpService, then
+    # start the Flask workers with the same NLP_SERVICE and NLP_SERVICE_AUTHKEY
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Shared spaCy parsing service")
+    parser.add_argument(
+        "--address", default=os.environ.get("NLP_SERVICE") or "127.0.0.1:6010"
+    )
+    args = parser.parse_args()
+
+    authkey = os.environ.get("NLP_SERVICE_AUTHKEY", "")
+    if not authkey:
+        # Requests are unpickled, so only authenticated workers may connect
+        raise SystemExit("Set NLP_SERVICE_AUTHKEY to start the NLP service")
+    from blueprints.elastic.analysis import load_nlp, NLP_BATCH_SIZE
+
+    load_nlp()
+    NLPService(NLP_BATCH_SIZE, NLP_SERVICE_MAX_WAIT).serve(args.address, authkey)
@@ -0,0 +1,77 @@
+from blueprints.elastic.localSearch import parse_date_value
+from datetime import datetime
+import re
+
+# unverified_posts-2024.12 holds the posts dated December 2024
+PARTITION_DATE_FORMAT = "%Y.%m"
+PARTITION_PATTERN = re.compile(r"^(.+)-(\d{4})\.(\d{2})$")
+
+
+def month_start(date):
+    return datetime(date.year, date.month, 1)
+
+
+def add_months(date, months):
+    month = date.year * 12 + date.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(base, date):
+    return f"{base}-{date.strftime(PARTITION_DATE_FORMAT)}"
+
+
+def write_alias(base):
+    return f"{base}-write"
+
+
+def template_name(base):
+    return f"{base}-partitions"
+
+
+def parse_partition(name):
+    # "unverified_posts-2024.12" -> ("unverified_posts", 2024-12-01), else None
+    match = PARTITION_PATTERN.match(name)
+    if not match:
+        return None
+    base, year, month = match.groups()
+    if not 1 <= int(month) <= 12:
+        return None
+    return base, datetime(int(year), int(month), 1)
+
+
+def partition_base(name):
+    # Concrete partition name back to the index it belongs to
+    parsed = parse_partition(name)
+    return parsed[0] if parsed else name
+
+
+def document_partition(base, document):
+    # Posts go to the month of their date, so a re-sent post overwrites itself.
+    # Undated posts have no month to go to and take the write alias.
+    date = parse_date_value(document.get("date"))
+    return partition_name(base, date) if date else write_alias(base)
+
+
+def partitions_between(base, start, end, max_partitions):
+    # Monthly partitions overlapping [start, end], None past max_partitions
+    if start is None or end is None or start > end:
+        return None
+    names = []
+    month = month_start(start)
+    while month <= end:
+        names.append(partition_name(base, month))
+        if len(names) > max_partitions:
+            return None
+        month = add_months(month, 1)
+    return names
+
+
+def expired_partitions(names, base, keep_months, today=None):
+    # Partitions of base whose whole month is older than the last keep_months
+    cutoff = add_months(month_start(today or datetime.now()), 1 - keep_months)
+    expired = []
+    for name in names:
+        parsed = parse_partition(name)
+        if parsed and parsed[0] == base and parsed[1] < cutoff:
+            expired.append(name)
+    return sorted(expired)
@@ -0,0 +1,369 @@
+from blueprints.elastic.localSearch import (
+    LocalIndex,
+    analyze,
+    as_list,
+    base_field,
+    bounding_box,
+    clause_value,
+    geo_point,
+    geohash,
+    parse_distance,
+    EARTH_RADIUS_KM,
+)
+from collections import Counter, defaultdict
+import itertools
+import threading
+import queue
+import math
+import uuid
+
+# Geo clauses are filed under the geohash cells covering them, at the finest
+# precision that needs no more than GEO_MAX_CELLS cells
+GEO_MAX_PRECISION = 5
+GEO_MAX_CELLS = 16
+GEO_PREFIX = "geo:"
+# Anchors are picked again from the key counts after this many posts, and
+# every time the count doubles
+REANCHOR_AFTER = 1000
+
+
+def cell_size(precision):
+    # (degrees of latitude, degrees of longitude) of one geohash cell
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** (bits - bits // 2)
+
+
+def geohash_cover(top, left, bottom, right):
+    # Cells overlapping the box, stepping one cell at a time from its corner
+    for precision in range(GEO_MAX_PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        rows = math.floor(top / lat_step) - math.floor(bottom / lat_step) + 1
+        columns = math.floor(right / lon_step) - math.floor(left / lon_step) + 1
+        if rows * columns <= GEO_MAX_CELLS:
+            break
+    latitudes = [min(bottom + row * lat_step, top) for row in range(rows + 1)]
+    longitudes = [min(left + column * lon_step, right) for column in range(columns + 1)]
+    return {geohash((lat, lon), precision) for lat in latitudes for lon in longitudes}
+
+
+def distance_box(origin, radius_km):
+    # (top, left, bottom, right) around a circle
+    lat, lon = origin
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(lat))
+    lon_delta = min(lat_delta / cos_lat, 180.0) if cos_lat > 1e-6 else 180.0
+    return (
+        min(lat + lat_delta, 90.0),
+        max(lon - lon_delta, -180.0),
+        max(lat - lat_delta, -90.0),
+        min(lon + lon_delta, 180.0),
+    )
+
+
+def keyword_field(field):
+    return field if field.endswith(".keyword") else field + ".keyword"
+
+
+def clause_keys(clause):
+    # (requirements, exact) for a clause. Requirements are the keys a post
+    # needs for the clause to match, as a list of sets that each need a hit,
+    # None when nothing can be derived from it. Exact when having them is
+    # enough for the clause to match.
+    kind, body = next(iter(clause.items()))
+    if kind == "bool":
+        required = as_list(body.get("filter")) + as_list(body.get("must"))
+        exact = not body.get("must_not")
+        if required:
+            requirements = []
+            for child in required:
+                keys, child_exact = clause_keys(child)
+                requirements += keys or []
+                exact = exact and keys is not None and child_exact
+            return requirements or None, exact and bool(requirements)
+        # Without required clauses one of the should clauses has to match
+        alternatives = [clause_keys(child) for child in as_list(body.get("should"))]
+        if not alternatives or any(keys is None for keys, _ in alternatives):
+            return None, False
+        union = set().union(*(min(keys, key=len) for keys, _ in alternatives))
+        exact = exact and all(
+            child_exact and len(keys) == 1 for keys, child_exact in alternatives
+        )
+        return [union], exact
+    if kind in ("geo_distance", "geo_bounding_box"):
+        field, value = next(
+            (field, value)
+            for field, value in body.items()
+            if field not in ("distance", "distance_type", "_name")
+        )
+        if kind == "geo_distance":
+            box = distance_box(geo_point(value), parse_distance(body["distance"]))
+        else:
+            box = bounding_box(value)
+        return [{(GEO_PREFIX + field, cell) for cell in geohash_cover(*box)}], False
+    if kind not in ("match", "match_phrase", "term", "terms"):
+        return None, False
+
+    field, value = next(iter(body.items()))
+    if kind == "terms":
+        return [{(keyword_field(field), term) for term in value}], True
+    if kind == "term" or field.endswith(".keyword"):
+        key = "value" if kind == "term" else "query"
+        return [{(keyword_field(field), clause_value(value, key))}], True
+    tokens = analyze(clause_value(value))
+    if not tokens:
+        return None, False
+    if kind == "match_phrase":
+        # Every word of a phrase is needed, their order is left to the check
+        return [{(field, token)} for token in tokens], len(tokens) == 1
+    return [{(field, token) for token in tokens}], True
+
+
+class SavedQueryIndex:
+    """Matches newly indexed posts against saved queries.
+
+    Each saved query is reduced to the keys a matching post must have, the
+    words of its text clauses, exact keyword values and the geohash cells
+    covering its geo filters, and filed under the set of them that the
+    fewest posts so far had. A post only looks up the queries filed under
+    its own keys and drops those it lacks other keys for. The rest are run
+    on a throwaway LocalIndex of the batch, so matches follow the same rules
+    as search, unless having the keys already settles it. Queries nothing
+    can be derived from are tried on every post.
+
+    Matches go on the queue of every subscriber following the query, a full
+    queue drops them.
+    """
+
+    def __init__(self, max_queue, card_fields=None):
+        self.max_queue = max_queue
+        self.card_fields = card_fields
+        self.queries = {}
+        self.anchors = defaultdict(set)
+        self.unanchored = set()
+        # field -> saved queries with keys on it, key -> requirement sets with it
+        self.fields = Counter()
+        self.key_refs = Counter()
+        # key -> posts that had it, for the keys some query needs
+        self.key_counts = Counter()
+        self.reanchor_at = REANCHOR_AFTER
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+        self.posts = 0
+        self.checked = 0
+        self.matched = 0
+        self.dropped = 0
+
+    def add(self, query, parameters=None, query_id=None):
+        query_id = query_id or uuid.uuid4().hex
+        requirements, exact = clause_keys(query)
+        with self.lock:
+            if query_id in self.queries:
+                self.unfile(query_id)
+            self.queries[query_id] = {
+                "query": query,
+                "parameters": parameters,
+                "requirements": requirements or [],
+                "anchor": None,
+                "checks": [],
+                "exact": exact,
+            }
+            for keys in requirements or []:
+                self.key_refs.update(keys)
+            self.fields.update(
+                {field for keys in requirements or [] for field, _ in keys}
+            )
+            self.file(query_id)
+        return query_id
+
+    def file(self, query_id):
+        # Under the requirement set the fewest posts had, the smallest on a tie
+        saved = self.queries[query_id]
+        requirements = sorted(
+            saved["requirements"],
+            key=lambda keys: (sum(self.key_counts[key] for key in keys), len(keys)),
+        )
+        anchor = requirements[0] if requirements else None
+        saved["anchor"] = anchor
+        # The rest are checked rarest first, so most misses stop at the first
+        saved["checks"] = requirements[1:]
+        if anchor is None:
+            self.unanchored.add(query_id)
+        for key in anchor or ():
+            self.anchors[key].add(query_id)
+
+    def remove(self, query_id):
+        with self.lock:
+            if query_id not in self.queries:
+                return False
+            self.unfile(query_id)
+            del self.queries[query_id]
+            return True
+
+    def unfile(self, query_id, forget=True):
+        saved = self.queries[query_id]
+        self.unanchored.discard(query_id)
+        for key in saved["anchor"] or ():
+            self.anchors[key].discard(query_id)
+            if not self.anchors[key]:
+                del self.anchors[key]
+        if not forget:
+            return
+        for field in {field for keys in saved["requirements"] for field, _ in keys}:
+            self.fields[field] -= 1
+            if not self.fields[field]:
+                del self.fields[field]
+        for keys in saved["requirements"]:
+            for key in keys:
+                self.key_refs[key] -= 1
+                if not self.key_refs[key]:
+                    del self.key_refs[key]
+                    self.key_counts.pop(key, None)
+
+    def sync(self, saved):
+        # Makes the index hold exactly saved, {query_id: (query, parameters)}
+        for query_id in [
+            query_id for query_id in self.queries if query_id not in saved
+        ]:
+            self.remove(query_id)
+        for query_id, (query, parameters) in saved.items():
+            if query_id not in self.queries:
+                self.add(query, parameters, query_id)
+
+    def has_subscribers(self):
+        return bool(self.subscribers)
+
+    def reanchor(self):
+        with self.lock:
+            for query_id in self.queries:
+                self.unfile(query_id, forget=False)
+                self.file(query_id)
+
+    def __contains__(self, query_id):
+        return query_id in self.queries
+
+    def __len__(self):
+        return len(self.queries)
+
+    def list(self):
+        return {
+            query_id: saved["parameters"] for query_id, saved in self.queries.items()
+        }
+
+    def post_keys(self, document, fields):
+        keys = set()
+        for field in fields:
+            if field.startswith(GEO_PREFIX):
+                point = geo_point(document.get(field[len(GEO_PREFIX) :]))
+                if point is not None:
+                    cell = geohash(point, GEO_MAX_PRECISION)
+                    keys.update(
+                        (field, cell[:precision])
+                        for precision in range(1, GEO_MAX_PRECISION + 1)
+                    )
+                continue
+            values = document.get(base_field(field))
+            for value in values if isinstance(values, list) else [values]:
+                if not isinstance(value, str):
+                    continue
+                if field.endswith(".keyword"):
+                    keys.add((field, value))
+                else:
+                    keys.update((field, token) for token in analyze(value))
+        return keys
+
+    def candidates(self, document):
+        with self.lock:
+            keys = self.post_keys(document, list(self.fields))
+            self.key_counts.update(key for key in keys if key in self.key_refs)
+            found = set(self.unanchored)
+            for key in keys:
+                found |= self.anchors.get(key, set())
+            return {
+                query_id
+                for query_id in found
+                if all(
+                    not keys.isdisjoint(required)
+                    for required in self.queries[query_id]["checks"]
+                )
+            }
+
+    def percolate(self, posts):
+        # posts: [(doc_id, document)] -> {doc_id: [query_id]}
+        if not self.queries or not posts:
+            return {}
+        self.posts += len(posts)
+        if self.posts >= self.reanchor_at:
+            self.reanchor()
+            self.reanchor_at = self.posts * 2
+        batch = LocalIndex("percolate")
+        # query_id -> docnos in the batch it may match
+        candidates = defaultdict(set)
+        for doc_id, document in posts:
+            batch.put(doc_id, document)
+            for query_id in self.candidates(document):
+                candidates[query_id].add(batch.docnos[doc_id])
+
+        matches = defaultdict(list)
+        for query_id, within in candidates.items():
+            saved = self.queries.get(query_id)
+            if saved is None:
+                continue
+            docs = within
+            if not saved["exact"]:
+                self.checked += len(within)
+                docs = batch.clause_docs(saved["query"], within)
+            for docno in within if docs is None else docs:
+                matches[batch.ids[docno]].append(query_id)
+
+        documents = dict(posts)
+        for doc_id, query_ids in matches.items():
+            self.matched += 1
+            self.publish(doc_id, documents[doc_id], query_ids)
+        return dict(matches)
+
+    def subscribe(self, query_ids):
+        subscriber = queue.Queue(self.max_queue)
+        with self.lock:
+            for query_id in query_ids:
+                self.subscribers[query_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber, query_ids):
+        with self.lock:
+            for query_id in query_ids:
+                self.subscribers[query_id].discard(subscriber)
+                if not self.subscribers[query_id]:
+                    del self.subscribers[query_id]
+
+    def publish(self, doc_id, document, query_ids):
+        # One message per subscriber, naming the queries it follows that matched
+        with self.lock:
+            followed = defaultdict(list)
+            for query_id in query_ids:
+                for subscriber in self.subscribers.get(query_id, ()):
+                    followed[subscriber].append(query_id)
+        if not followed:
+            return
+        post = dict(document)
+        if self.card_fields is not None:
+            post = {field: document.get(field) for field in self.card_fields}
+        post["objId"] = doc_id
+        for subscriber, subscribed_ids in followed.items():
+            try:
+                subscriber.put_nowait({"query_ids": subscribed_ids, "post": post})
+            except queue.Full:
+                self.dropped += 1
+
+    def stats(self):
+        return {
+            "queries": len(self.queries),
+            "unanchored": len(self.unanchored),
+            "anchor_keys": len(self.anchors),
+            "subscribers": len(
+                set(itertools.chain.from_iterable(self.subscribers.values()))
+            ),
+            "posts": self.posts,
+            "checked": self.checked,
+            "matched": self.matched,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,113 @@
+from blueprints.elastic.cache import TTLCache
+import bisect
+import heapq
+import threading
+
+# Post fields that feed the autocomplete suggestions
+SUGGESTION_FIELDS = ("post_title", "location", "disaster_type")
+
+
+def normalize_suggestion(text):
+    return " ".join(str(text or "").lower().split())
+
+
+def suggestion_texts(document):
+    texts = []
+    for field in SUGGESTION_FIELDS:
+        text = " ".join(str(document.get(field) or "").split())
+        if text and normalize_suggestion(text) not in (
+            normalize_suggestion(seen) for seen, _ in texts
+        ):
+            texts.append((text, field))
+    return texts
+
+
+class PrefixIndex:
+    """In-process prefix lookup over weighted suggestion texts.
+
+    Every word start of a suggestion is a key in one sorted array, so "nadu"
+    finds "Tamil Nadu". A prefix is answered by a bisect plus a scan of the
+    matching slice, and repeated prefixes come from a small LRU; a new or
+    reweighted suggestion only drops the cached prefixes it falls under.
+    `complete` is set while the index held every known suggestion at its
+    last refresh, until then the caller should also ask Elasticsearch.
+    """
+
+    def __init__(self, max_entries, cache_size):
+        self.max_entries = max_entries
+        self.keys = []
+        self.entries = {}
+        self.prefix_cache = TTLCache(cache_size, 60)
+        self.complete = False
+        self.lock = threading.Lock()
+
+    def add(self, text, weight=1):
+        normalized = normalize_suggestion(text)
+        if not normalized:
+            return
+        with self.lock:
+            entry = self.entries.get(normalized)
+            if entry is not None:
+                entry[1] += weight
+            elif len(self.entries) < self.max_entries:
+                self.entries[normalized] = [text, weight]
+                words = normalized.split(" ")
+                for position in range(len(words)):
+                    key = " ".join(words[position:])
+                    bisect.insort(self.keys, (key, normalized))
+            else:
+                self.complete = False
+                return
+        self.invalidate(normalized)
+
+    def set_weight(self, text, weight):
+        normalized = normalize_suggestion(text)
+        with self.lock:
+            entry = self.entries.get(normalized)
+        if entry is None:
+            self.add(text, weight)
+        elif weight > entry[1]:
+            entry[1] = weight
+            self.invalidate(normalized)
+
+    def invalidate(self, normalized):
+        words = normalized.split(" ")
+        keys = [" ".join(words[position:]) for position in range(len(words))]
+        self.prefix_cache.discard(
+            lambda cached: any(key.startswith(cached[0]) for key in keys)
+        )
+
+    def lookup(self, prefix, size):
+        prefix = normalize_suggestion(prefix)
+        if not prefix:
+            return []
+        cached = self.prefix_cache.get((prefix, size))
+        if cached is not None:
+            return cached
+
+        with self.lock:
+            matches = set()
+            position = bisect.bisect_left(self.keys, (prefix,))
+            while position < len(self.keys) and self.keys[position][0].startswith(
+                prefix
+            ):
+                matches.add(self.keys[position][1])
+                position += 1
+            results = heapq.nlargest(
+                size,
+                (self.entries[normalized] for normalized in matches),
+                key=lambda entry: entry[1],
+            )
+            results = [(text, weight) for text, weight in results]
+
+        self.prefix_cache.set((prefix, size), results)
+        return results
+
+    def stats(self):
+        return {
+            "complete": self.complete,
+            "entries": len(self.entries),
+            "keys": len(self.keys),
+            "max_entries": self.max_entries,
+            "prefix_cache": self.prefix_cache.stats(),
+        }
@@ -0,0 +1,112 @@
+import threading
+import uuid
+import json
+import os
+
+
+class WriteJournal:
+    """Writes made while the cluster is down, kept on disk until replayed.
+
+    Every call is appended as one JSON line and fsynced before it returns,
+    so an acknowledged post survives a restart. Each process appends to its
+    own file. `replay` first claims a file by renaming it, so of several
+    workers only one sends it, and takes every file it finds, including
+    ones left behind by a process that has since exited. A call the cluster
+    refuses stops the replay, and the calls from there on are kept for the
+    next attempt.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, f"writes-{uuid.uuid4().hex}.ndjson")
+        self.lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+
+    def record(self, method, kwargs):
+        line = json.dumps({"method": method, "kwargs": kwargs}, default=str)
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as journal:
+                journal.write(line + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+            self.recorded += 1
+
+    def recorder(self, method, call):
+        # Applies the write to the stand-in, then journals it for the cluster
+        def record_call(*args, **kwargs):
+            if args:
+                raise ConnectionError(f"Can't journal positional {method} call")
+            result = call(**kwargs)
+            self.record(method, kwargs)
+            return result
+
+        return record_call
+
+    def claim(self):
+        claimed = []
+        if not os.path.isdir(self.directory):
+            return claimed
+        with self.lock:
+            for name in sorted(os.listdir(self.directory)):
+                if not (name.startswith("writes-") and name.endswith(".ndjson")):
+                    continue
+                path = os.path.join(self.directory, name)
+                replaying = f"{path}.replaying-{uuid.uuid4().hex}"
+                try:
+                    os.rename(path, replaying)
+                except OSError:
+                    # Another worker claimed it first
+                    continue
+                claimed.append(replaying)
+        return claimed
+
+    def replay(self, client):
+        # Returns how many calls reached the cluster
+        sent = 0
+        claimed = self.claim()
+        for number, path in enumerate(claimed):
+            with open(path, encoding="utf-8") as journal:
+                entries = [json.loads(line) for line in journal if line.strip()]
+            for position, entry in enumerate(entries):
+                try:
+                    getattr(client, entry["method"])(**entry["kwargs"])
+                except Exception as e:
+                    print(f"Write replay stopped, keeping the rest: {e}")
+                    self.keep(entries[position:])
+                    os.remove(path)
+                    # Files not started yet go back as they were
+                    for unsent in claimed[number + 1 :]:
+                        os.rename(unsent, unsent.rpartition(".replaying-")[0])
+                    break
+                sent += 1
+            else:
+                os.remove(path)
+                continue
+            break
+        with self.lock:
+            self.replayed += sent
+        return sent
+
+    def keep(self, entries):
+        # "writes--" sorts before every live file, so these go first next time
+        path = os.path.join(self.directory, f"writes--{uuid.uuid4().hex}.ndjson")
+        with open(path, "w", encoding="utf-8") as journal:
+            for entry in entries:
+                journal.write(json.dumps(entry) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def stats(self):
+        pending = 0
+        if os.path.isdir(self.directory):
+            pending = sum(
+                name.startswith("writes-") for name in os.listdir(self.directory)
+            )
+        return {
+            "directory": self.directory,
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "pending_files": pending,
+        }
@@ -25,6 +25,8 @@ def generateReport():
         # print(request.json)
         data = request.json
         print(f"New request received! {data}")
+        if isinstance(data, dict) and "reportData" in data:
+            data["reportData"] = collapseDuplicates(data["reportData"])
         # Initialize new Model
         model = DisasterAnalysis(data)
 
@@ -86,7 +88,7 @@ def newsToSummary():
         # data = request.form.get('posts')
         data = request.json
         print(data)
-        response = generateSummary(data["newsData"])
+        response = generateSummary(collapseDuplicates(data["newsData"]))
         return {"summary": response}
     except Exception as e:
         print(e)
@@ -109,6 +111,8 @@ def getOneLiner():
 def dailyReport():
     try:
         data = request.json
+        if isinstance(data, dict) and "data" in data:
+            data["data"] = collapseDuplicates(data["data"], fields=("oneLinerInfo",))
 
         # model = DisasterAnalysis(data)
 
@@ -124,6 +128,8 @@ def dailyReport():
 def RandomReport():
     try:
         data = request.json
+        if isinstance(data, dict) and "data" in data:
+            data["data"] = collapseDuplicates(data["data"], fields=("oneLinerInfo",))
 
         # model = DisasterAnalysis(data)
 
@@ -2,6 +2,7 @@ import os
 import json
 import matplotlib
 import matplotlib.pyplot as plt
+from blueprints.elastic.dedup import collapse_duplicates, default_duplicate_index
 
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 matplotlib.use("agg")
@@ -50,6 +51,14 @@ def imageToB64(image):
     pass
 
 
+def collapseDuplicates(posts, fields=("post_title", "post_body")):
+    # Rewrites of the same story only cost tokens, keep one post per story.
+    # Posts from /search already carry a dup_group_id, others are grouped here.
+    if not isinstance(posts, list):
+        return posts
+    return collapse_duplicates(posts, default_duplicate_index(fields))
+
+
 def generateSummary(data):
     if MODEL is None:
         print("[DEMO MODE] Returning placeholder summary")
@@ -0,0 +1,4 @@
+import os
+
+# The tests run against the in-process search backend, never a cluster
+os.environ["DEMO_MODE"] = "true"
@@ -0,0 +1,214 @@
+import pytest
+from flask import Flask
+
+from blueprints.elastic import elastic
+from blueprints.elastic.elastic import (
+    build_es_query,
+    build_post_document,
+    local_search_backend,
+    moderation_operations,
+    suggestion_operations,
+    ARCHIVE_INDEX_NAME,
+    INDEX_NAME,
+    SUGGEST_INDEX_NAME,
+)
+from blueprints.elastic.localSearch import LocalSearchBackend
+from blueprints.elastic.suggest import PrefixIndex
+
+INDEX = "posts"
+
+POSTS = [
+    {
+        "post_id": "1",
+        "post_title": "Flood in Chennai",
+        "post_body": "Heavy rain flooded the streets near the station",
+        "location": "Chennai",
+        "disaster_type": "flood",
+        "priority": "high",
+        "source": "Twitter",
+        "date": "2024-12-02",
+    },
+    {
+        "post_id": "2",
+        "post_title": "Cyclone warning",
+        "post_body": "Fishermen asked to stay ashore as the cyclone nears",
+        "location": "Chennai",
+        "disaster_type": "cyclone",
+        "priority": "medium",
+        "source": "RSS",
+        "date": "2024-12-05",
+    },
+    {
+        "post_id": "3",
+        "post_title": "Landslide near Kochi",
+        "post_body": "Rain triggered a landslide on the highway",
+        "location": "Kochi",
+        "disaster_type": "landslide",
+        "priority": "high",
+        "source": "RescuNet App",
+        "date": "2024-11-20",
+    },
+    {
+        "post_id": "4",
+        "post_title": "Flooding in Mumbai",
+        "post_body": "Local trains stopped after the flood",
+        "location": "Mumbai",
+        "disaster_type": "flood",
+        "priority": "low",
+        "source": "RSS",
+        "date": "2024-12-10",
+    },
+    {
+        "post_id": "5",
+        "post_title": "Flood relief camp",
+        "post_body": "Relief camp opened for flood victims",
+        "location": "Tamil Nadu",
+        "disaster_type": "flood",
+        "priority": "high",
+        "source": "Twitter",
+        "date": "2024-12-11",
+    },
+]
+
+NO_ENTITIES = {
+    "query": None,
+    "disaster_type": None,
+    "location": None,
+    "near": None,
+    "bbox": None,
+    "priority": None,
+    "source": None,
+    "date": None,
+}
+
+
+@pytest.fixture(scope="module")
+def backend():
+    backend = LocalSearchBackend()
+    for post in POSTS:
+        document = build_post_document(post)
+        backend.index(index=INDEX, id=document["post_id"], document=document)
+    return backend
+
+
+def search_ids(backend, **entities):
+    query = build_es_query({**NO_ENTITIES, **entities})
+    hits = backend.search(index=INDEX, body=query)["hits"]["hits"]
+    return [hit["_id"] for hit in hits]
+
+
+@pytest.mark.parametrize(
+    "entities, expected",
+    [
+        ({"disaster_type": "flood"}, {"1", "4", "5"}),
+        ({"disaster_type": "cyclone"}, {"2"}),
+        ({"location": "Chennai"}, {"1", "2"}),
+        # A state finds the posts placed in it, not just the ones naming it
+        ({"location": "Tamil Nadu"}, {"1", "2", "5"}),
+        ({"location": "Kerala"}, {"3"}),
+        ({"disaster_type": "flood", "location": "Tamil Nadu"}, {"1", "5"}),
+        ({"priority": "high"}, {"1", "3", "5"}),
+        ({"source": "RSS"}, {"2", "4"}),
+        ({"query": "landslide"}, {"3"}),
+        ({"query": "relief"}, {"5"}),
+        ({"date": ("2024-12-01", "2024-12-06")}, {"1", "2"}),
+        ({"disaster_type": "flood", "date": ("2024-12-09", None)}, {"4", "5"}),
+        (
+            {"near": {"lat": 13.08, "lon": 80.27, "radius_km": 50}},
+            {"1", "2"},
+        ),
+        ({"disaster_type": "earthquake"}, set()),
+    ],
+)
+def test_build_es_query_hits(backend, entities, expected):
+    assert set(search_ids(backend, **entities)) == expected
+
+
+def test_enriched_posts_use_extracted_keywords():
+    backend = LocalSearchBackend()
+    enriched = {
+        "post_id": "6",
+        "post_title": "Water everywhere",
+        "post_body": "Streets in Velachery under water since morning",
+        "location": "",
+        "disaster_type": "",
+        "source": "Twitter",
+        "disaster_keywords": ["flood"],
+        "gpe_locations": ["velachery"],
+        "enriched_at": "2024-12-02T10:00:00",
+    }
+    # Labelled flood by hand, though the enrichment found none
+    unmatched = {
+        **POSTS[3],
+        "post_id": "7",
+        "disaster_keywords": [],
+        "gpe_locations": ["mumbai"],
+        "enriched_at": "2024-12-10T10:00:00",
+    }
+    for post in (enriched, unmatched, POSTS[0]):
+        document = build_post_document(post)
+        backend.index(index=INDEX, id=document["post_id"], document=document)
+
+    assert set(search_ids(backend, disaster_type="Flood")) == {"1", "6", "7"}
+    assert set(search_ids(backend, location="Velachery")) == {"6"}
+    assert set(search_ids(backend, location="Mumbai")) == {"7"}
+
+
+def test_results_sorted_by_source_rank(backend):
+    # RSS first, then Twitter, then everything else
+    assert search_ids(backend, location="Tamil Nadu")[0] == "2"
+    assert search_ids(backend, disaster_type="flood")[0] == "4"
+
+
+def test_suggestion_upserts_bump_weight():
+    backend = LocalSearchBackend()
+    document = build_post_document(POSTS[0])
+    for _ in range(2):
+        response = backend.bulk(operations=suggestion_operations([document]))
+        assert not response["errors"]
+
+    hits = backend.search(index=SUGGEST_INDEX_NAME, body={"size": 10})["hits"]["hits"]
+    suggestions = {hit["_source"]["text"]: hit["_source"]["suggest"] for hit in hits}
+    assert suggestions["Flood in Chennai"]["weight"] == 2
+    assert "chennai" in suggestions["Flood in Chennai"]["input"]
+
+
+def test_verified_posts_leave_unverified_search():
+    backend = local_search_backend()
+    for post in POSTS[:2]:
+        document = build_post_document(post)
+        backend.index(
+            index=ARCHIVE_INDEX_NAME, id=document["post_id"], document=document
+        )
+
+    hits = [backend.get(index=INDEX_NAME, id="1")]
+    operations, _ = moderation_operations(hits, "verify", "tester")
+    assert not backend.bulk(operations=operations)["errors"]
+
+    query = build_es_query({**NO_ENTITIES, "location": "Chennai"})
+    unverified = backend.search(index=INDEX_NAME, body=query)["hits"]["hits"]
+    archived = backend.search(index=ARCHIVE_INDEX_NAME, body=query)["hits"]["hits"]
+    assert [hit["_id"] for hit in unverified] == ["2"]
+    assert backend.count(index=INDEX_NAME)["count"] == 1
+    assert {hit["_id"] for hit in archived} == {"1", "2"}
+    # Moderating it again finds nothing left to move
+    assert backend.mget(index=INDEX_NAME, ids=["1"])["docs"][0]["found"] is False
+
+
+def test_complete_suggestions_answer_short_lists_locally(monkeypatch):
+    class Cluster:
+        def search(self, **kwargs):
+            raise AssertionError("A complete index shouldn't ask the cluster")
+
+    index = PrefixIndex(10, 10)
+    index.set_weight("Flood in Chennai", 3)
+    index.complete = True
+    monkeypatch.setattr(elastic, "suggestions", index)
+    monkeypatch.setattr(elastic, "local_search", None)
+    monkeypatch.setattr(elastic, "es", Cluster())
+    app = Flask(__name__)
+    app.register_blueprint(elastic.search, url_prefix="/search")
+
+    response = app.test_client().get("/search/autocomplete?query=flo")
+    buckets = response.get_json()["aggregations"]["auto_complete"]["buckets"]
+    assert buckets == [{"key": "Flood in Chennai", "doc_count": 3}]